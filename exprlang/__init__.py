@@ -2,7 +2,7 @@
 This package is part of the YAP project.
 YAP - Yet Another Parser
 """
-__all__ = ("ExprEvaluator",)
+__all__ = ("ExprEvaluator", "PreparedExpression")
 __author__ = "Simon Nganga (theedushbag@gmail.com)"
 
 
@@ -11,10 +11,15 @@ def __dir__():
 
 
 def __getattr__(name: str):
-    global ExprEvaluator
+    global ExprEvaluator, PreparedExpression
     if name == "ExprEvaluator":
         from .main import ExprEvaluator as _ee
 
         ExprEvaluator = _ee
         return _ee
+    if name == "PreparedExpression":
+        from .prepared import PreparedExpression as _pe
+
+        PreparedExpression = _pe
+        return _pe
     raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,3 +2,4 @@ __author__: str
 __all__: tuple[str, ...]
 
 from .main import ExprEvaluator as ExprEvaluator
+from .prepared import PreparedExpression as PreparedExpression
@@ -1,11 +1,16 @@
 from .printer import ByteCodePrinter, ASTPrinter
-from .exc import LexerError, ParserError
+from .exc import LexerError, ParserError, UnboundVariable
 from .formatter import Formatter
 from .evaluator import Evaluator
 from .vm import VirtualMachine
 from .compiler import Compiler
 from .parser import Parser
 from .lexer import Lexer
+from collections import deque
+from . import batch
+import typing as ty
+import argparse
+import sys
 
 bytecodeprinter = ByteCodePrinter()
 astprinter = ASTPrinter()
@@ -44,6 +49,8 @@ def _run(expr: str):
         print(f"LexerError: {str(e)}")
     except ZeroDivisionError as e:
         print(f"ZeroDivisionError: {str(e)}")
+    except UnboundVariable as e:
+        print(f"UnboundVariable: {str(e)}")
 
 
 HELP = """
@@ -70,7 +77,86 @@ def main():
                 print()
 
 
+def run_batch(args: argparse.Namespace) -> int:
+    # One expression per input line, one result per output line in the same
+    # order. Failed lines print `error: ...` in place and are reported on
+    # stderr with their line number; the exit status is 1 if any failed.
+    # Blank lines are not evaluated, they come out as blank lines.
+    source = sys.stdin if args.file == "-" else open(args.file)
+    output = sys.stdout if args.output in (None, "-") else open(args.output, "w")
+    failures = 0
+    # Line numbers of the expressions read ahead but not yet written out.
+    linenos: deque[int] = deque()
+    read = written = 0
+
+    def expressions() -> ty.Iterator[str]:
+        nonlocal read
+        for read, line in enumerate(source, 1):
+            if line := line.strip():
+                linenos.append(read)
+                yield line
+
+    try:
+        outcomes = batch.evaluate(
+            expressions(), workers=args.workers, backend=args.backend, chunksize=args.chunksize
+        )
+        for value, error in outcomes:
+            lineno = linenos.popleft()
+            output.write("\n" * (lineno - written - 1))
+            written = lineno
+            if error is None:
+                output.write(f"{value!r}\n")
+                continue
+            failures += 1
+            message = f"{type(error).__name__}: {error}"
+            output.write(f"error: {message}\n")
+            print(f"{source.name}:{lineno}: {message}", file=sys.stderr)
+        output.write("\n" * (read - written))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    return 1 if failures else 0
+
+
+def positive(text: str) -> int:
+    number = int(text)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be positive, got {number}")
+    return number
+
+
+def arguments(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m exprlang",
+        description="Interactive expression prompt, or batch evaluation of FILE.",
+    )
+    parser.add_argument(
+        "file", nargs="?", metavar="FILE",
+        help="evaluate one expression per line of FILE ('-' for stdin)",
+    )
+    parser.add_argument(
+        "-o", "--output", metavar="OUT", help="write results to OUT instead of stdout"
+    )
+    parser.add_argument(
+        "--workers", type=positive, default=None,
+        help="worker processes for batch mode (default: all cores)",
+    )
+    parser.add_argument(
+        "--backend", choices=batch.BACKENDS, default="vm",
+        help="evaluate with the tree walking evaluator or the virtual machine",
+    )
+    parser.add_argument(
+        "--chunksize", type=positive, default=256, help="lines sent to a worker at once"
+    )
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
+    args = arguments()
+    if args.file is not None:
+        sys.exit(run_batch(args))
     try:
         main()
     except KeyboardInterrupt:
@@ -0,0 +1,330 @@
+from .parser import Infix, Parser, Prefix
+from .instructions import Instruction
+from .token import Token, TokenType
+from .exc import UnboundVariable
+from .compiler import Compiler
+from array import array
+from . import nodes
+import typing as ty
+import operator
+import enum
+
+Number = float | int
+
+
+class Kind(enum.IntEnum):
+    # One per node class, in the order the passes branch on them: leaves,
+    # then unary nodes, then binary nodes.
+    NUMBER = 0
+    VARIABLE = enum.auto()
+    GROUP = enum.auto()
+    UPLUS = enum.auto()
+    UMINUS = enum.auto()
+    PLUS = enum.auto()
+    MINUS = enum.auto()
+    STAR = enum.auto()
+    SLASH = enum.auto()
+    POWER = enum.auto()
+
+
+CLASSES: ty.Final[tuple[type[nodes.Expression], ...]] = (
+    nodes.Number,
+    nodes.Variable,
+    nodes.Group,
+    nodes.UPlus,
+    nodes.UMinus,
+    nodes.Plus,
+    nodes.Minus,
+    nodes.Star,
+    nodes.Slash,
+    nodes.Power,
+)
+KINDS: ty.Final[dict[type, Kind]] = {cls: Kind(code) for code, cls in enumerate(CLASSES)}
+# The same as plain ints, storing a Kind member into an array goes through
+# __index__ and is slower.
+_CODES: dict[type, int] = {cls: code for code, cls in enumerate(CLASSES)}
+
+# Plain ints for the sweeps, comparing against Kind members is slower.
+_NUMBER, _VARIABLE, _GROUP = int(Kind.NUMBER), int(Kind.VARIABLE), int(Kind.GROUP)
+_UMINUS, _PLUS, _SLASH = int(Kind.UMINUS), int(Kind.PLUS), int(Kind.SLASH)
+_NUMBER_TOKEN, _IDENTIFIER_TOKEN = TokenType.NUMBER, TokenType.IDENTIFIER
+
+# Indexed by Kind, None where the kind is not an operator.
+_FUNCTIONS: tuple[ty.Callable[..., ty.Any] | None, ...] = (
+    None,
+    None,
+    operator.pos,
+    operator.pos,
+    operator.neg,
+    operator.add,
+    operator.sub,
+    operator.mul,
+    operator.truediv,
+    operator.pow,
+)
+_OPCODES: tuple[Instruction | None, ...] = (
+    None,
+    None,
+    None,
+    None,
+    Instruction.NEGATE,
+    Instruction.ADD,
+    Instruction.SUBTRACT,
+    Instruction.MULTIPLY,
+    Instruction.DIVIDE,
+    Instruction.POWER,
+)
+
+
+class Arena:
+    # A whole AST as parallel columns instead of node objects. Node `i` is
+    # kinds[i], with children left[i] and right[i] (-1 where absent) and the
+    # source column of its token in columns[i]. values[i] holds the value
+    # of a NUMBER and the name of a VARIABLE; the lexeme of a NUMBER is
+    # lexemes[left[i]].
+    #
+    # Nodes are stored in post-order, children before their parent, so the
+    # root is the last node and passes can sweep the columns front to back.
+    # clear() keeps the columns allocated, only `size` goes back to 0.
+    def __init__(self, capacity: int = 64) -> None:
+        capacity = max(capacity, 1)
+        self.kinds = array("B", bytes(capacity))
+        self.left = array("l", [-1]) * capacity
+        self.right = array("l", [-1]) * capacity
+        self.columns = array("l", [0]) * capacity
+        self.values: list[ty.Any] = [None] * capacity
+        self.lexemes: list[str] = []
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def root(self) -> int:
+        if not self.size:
+            raise IndexError("The arena is empty")
+        return self.size - 1
+
+    def clear(self):
+        self.lexemes.clear()
+        self.size = 0
+
+    def _grow(self):
+        self.kinds.extend(self.kinds)
+        self.left.extend(self.left)
+        self.right.extend(self.right)
+        self.columns.extend(self.columns)
+        self.values.extend([None] * len(self.values))
+
+    def add(self, kind: int, left: int, right: int, column: int, value: ty.Any = None) -> int:
+        index = self.size
+        try:
+            self.kinds[index] = kind
+        except IndexError:
+            self._grow()
+            self.kinds[index] = kind
+        self.left[index] = left
+        self.right[index] = right
+        self.columns[index] = column
+        self.values[index] = value
+        self.size = index + 1
+        return index
+
+    def number(self, token: Token) -> int:
+        lexemes = self.lexemes
+        lexemes.append(token.lexeme)
+        return self.add(_NUMBER, len(lexemes) - 1, -1, token.column, token.value)
+
+    def variable(self, token: Token) -> int:
+        return self.add(_VARIABLE, -1, -1, token.column, token.lexeme)
+
+    def load(self, root: nodes.Expression) -> "Arena":
+        # Replaces the contents with the tree under `root`.
+        self.clear()
+        indices: list[int] = []
+        pending: list[ty.Any] = [root]
+        while pending:
+            expr = pending.pop()
+            if type(expr) is tuple:
+                kind, expr = expr
+                right = indices.pop()
+                left = indices.pop() if kind >= _PLUS else -1
+                indices.append(self.add(kind, left, right, expr.column))
+            elif isinstance(expr, nodes.Number):
+                indices.append(self.number(expr.token))
+            elif isinstance(expr, nodes.Variable):
+                indices.append(self.variable(expr.token))
+            elif isinstance(expr, nodes.Unary):
+                pending.append((_CODES[type(expr)], expr))
+                pending.append(expr.right)
+            else:
+                pending.append((_CODES[type(expr)], expr))
+                pending.append(expr.right)
+                pending.append(expr.left)
+        return self
+
+    @classmethod
+    def from_nodes(cls, root: nodes.Expression) -> "Arena":
+        return cls().load(root)
+
+    def to_nodes(self) -> nodes.Expression:
+        built: list[ty.Any] = []
+        for index in range(self.size):
+            kind, column = self.kinds[index], self.columns[index]
+            if kind == _NUMBER:
+                lexeme = self.lexemes[self.left[index]]
+                token = Token(TokenType.NUMBER, lexeme, column, self.values[index])
+                built.append(nodes.Number(token))
+            elif kind == _VARIABLE:
+                token = Token(TokenType.IDENTIFIER, self.values[index], column)
+                built.append(nodes.Variable(token))
+            else:
+                cls: ty.Any = CLASSES[kind]
+                token = Token(cls.type, cls.lexeme, column)
+                right = built[self.right[index]]
+                if kind < _PLUS:
+                    built.append(cls(token, right))
+                else:
+                    built.append(cls(built[self.left[index]], token, right))
+        return built[self.root]
+
+
+class ArenaParser(Parser):
+    # The Parser, filling an Arena instead of building node objects. Every
+    # parse reuses the same arena, `_add` is its add() bound once per parse.
+    def __init__(self, tokens: ty.Iterable[Token] | None = None, arena: Arena | None = None) -> None:
+        super().__init__(tokens)
+        self.arena = Arena() if arena is None else arena
+        self._add = self.arena.add
+
+    def _unary(self, prefix: Prefix, token: Token, right: int) -> int:  # type: ignore[override]
+        return self._add(_CODES[prefix.node], -1, right, token.column)  # type: ignore[index]
+
+    def _binary(self, infix: Infix, left: int, token: Token, right: int) -> int:  # type: ignore[override]
+        return self._add(_CODES[infix.node], left, right, token.column)  # type: ignore[index]
+
+    def _group(self, token: Token, middle: int) -> int:  # type: ignore[override]
+        return self._add(_GROUP, -1, middle, token.column)
+
+    def primary(self) -> int:  # type: ignore[override]
+        token = self._current
+        type = token.type
+        if type is _NUMBER_TOKEN:
+            self.advance()
+            lexemes = self.arena.lexemes
+            lexemes.append(token.lexeme)
+            return self._add(_NUMBER, len(lexemes) - 1, -1, token.column, token.value)
+        if type is _IDENTIFIER_TOKEN:
+            self.advance()
+            return self._add(_VARIABLE, -1, -1, token.column, token.lexeme)
+        return super().primary()  # type: ignore[return-value]
+
+    def parse(self, tokens: ty.Iterable[Token] | None = None) -> Arena:  # type: ignore[override]
+        arena = self.arena
+        arena.clear()
+        self.reset(tokens)
+        self._add = arena.add
+        self.expression()
+        return arena
+
+
+def _zero_division(dividend: Number, column: int) -> ty.NoReturn:
+    raise ZeroDivisionError(f"Zero division error '{dividend} / 0' at column {column}")
+
+
+class ArenaEvaluator:
+    # Evaluates an Arena with one sweep over its columns. Post-order means
+    # every operand is already in `results` when its operator comes up, in
+    # the same order the Evaluator would have computed it.
+    def eval(self, arena: Arena, variables: ty.Mapping[str, Number] | None = None):
+        variables = {} if variables is None else variables
+        functions = _FUNCTIONS
+        results: list[ty.Any] = []
+        push = results.append
+        columns = zip(range(arena.size), arena.kinds, arena.left, arena.right, arena.values)
+        for index, kind, left, right, value in columns:
+            if kind >= _PLUS:
+                divisor = results[right]
+                if kind == _SLASH and divisor == 0:
+                    _zero_division(results[left], arena.columns[index])
+                push(functions[kind](results[left], divisor))  # type: ignore[misc]
+            elif kind == _NUMBER:
+                push(value)
+            elif kind == _VARIABLE:
+                try:
+                    push(variables[value])
+                except KeyError:
+                    raise UnboundVariable(
+                        f"Variable {value!r} at column {arena.columns[index]} is not bound"
+                    ) from None
+            else:
+                push(functions[kind](results[right]))  # type: ignore[misc]
+        return results[arena.root]
+
+
+class ArenaCompiler(Compiler):
+    # Emits the same bytecode Compiler(cse=False) does for the equivalent
+    # tree, repeated subtrees are not shared.
+    # Constants are folded by a post-order sweep like the ArenaEvaluator's,
+    # the instructions are then emitted pre-order with an explicit stack of
+    # node indices and the opcodes that follow them.
+    def __init__(self, fold: bool = True, cse: bool = False, peephole: bool = True) -> None:
+        if cse:
+            raise ValueError("ArenaCompiler does not share repeated subtrees, cse must be False")
+        super().__init__(fold, cse, peephole)
+
+    def _fold(self, arena: Arena) -> list[Number | None]:
+        functions = _FUNCTIONS
+        folded: list[Number | None] = []
+        push = folded.append
+        columns = zip(range(arena.size), arena.kinds, arena.left, arena.right, arena.values)
+        for index, kind, left, right, value in columns:
+            if kind == _NUMBER:
+                push(value)
+            elif kind == _VARIABLE:
+                push(None)
+            elif kind < _PLUS:
+                operand = folded[right]
+                push(None if operand is None else functions[kind](operand))  # type: ignore[misc]
+            else:
+                dividend, divisor = folded[left], folded[right]
+                if dividend is None or divisor is None:
+                    push(None)
+                    continue
+                if kind == _SLASH and divisor == 0:
+                    _zero_division(dividend, arena.columns[index])
+                try:
+                    value = functions[kind](dividend, divisor)  # type: ignore[misc]
+                except OverflowError:
+                    value = None  # Left for the machine to report at runtime.
+                push(value if type(value) in (int, float) else None)
+        return folded
+
+    def compile(self, arena: Arena) -> bytes:  # type: ignore[override]
+        self.reset(self.fold, self.cse, self.peephole)
+        kinds, left, right, values = arena.kinds, arena.left, arena.right, arena.values
+        folded = self._fold(arena) if self.fold else [None] * arena.size
+        pending: list[int] = [arena.root]
+        while pending:
+            index = pending.pop()
+            if type(index) is Instruction:
+                self.push(index)
+                continue
+            kind, value = kinds[index], folded[index]
+            if value is not None:
+                self.load_const(value)
+            elif kind == _NUMBER:
+                self.load_const(values[index])
+            elif kind == _VARIABLE:
+                self.push(Instruction.LOAD_VAR)
+                self.operand(self.slot(values[index]))
+            elif kind < _UMINUS:
+                pending.append(right[index])
+            elif kind == _UMINUS:
+                pending.append(Instruction.NEGATE)
+                pending.append(right[index])
+            else:
+                pending.append(_OPCODES[kind])  # type: ignore[arg-type]
+                pending.append(right[index])
+                pending.append(left[index])
+        return self.finish()
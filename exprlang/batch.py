@@ -0,0 +1,115 @@
+from collections import deque
+from .main import ExprEvaluator
+import multiprocessing as mp
+import typing as ty
+import itertools
+import os
+
+# Source text or bytecode from ExprEvaluator.compile.
+Item = str | bytes
+# What a worker reports per item: (value, None) or (None, error).
+Outcome = tuple[ty.Any, BaseException | None]
+BACKENDS: ty.Final = ("eval", "vm")
+
+
+class _Worker:
+    # Per-process state, built once by the pool initializer.
+    evaluator: ExprEvaluator
+
+
+def _init_worker(backend: str):
+    _Worker.evaluator = ExprEvaluator(backend=backend)
+
+
+def _run_chunk(items: list[Item]) -> list[Outcome]:
+    evaluator = _Worker.evaluator
+    outcomes: list[Outcome] = []
+    for item in items:
+        try:
+            if isinstance(item, bytes):
+                outcomes.append((evaluator.exec(item), None))
+            else:
+                outcomes.append((evaluator.eval(item), None))
+        except Exception as error:
+            outcomes.append((None, error))
+    return outcomes
+
+
+def chunked(iterable: ty.Iterable[ty.Any], size: int) -> ty.Iterator[list[ty.Any]]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+_T = ty.TypeVar("_T")
+_R = ty.TypeVar("_R")
+
+
+def ordered_map(
+    function: ty.Callable[[_T], _R],
+    tasks: ty.Iterable[_T],
+    *,
+    workers: int,
+    initializer: ty.Callable[..., None],
+    initargs: tuple[ty.Any, ...] = (),
+    window: int | None = None,
+) -> ty.Iterator[_R]:
+    # Like Pool.imap, but only `window` tasks are ever in flight, so an
+    # unbounded `tasks` is consumed as fast as results are, not faster.
+    # With a single worker everything runs in this process.
+    if workers == 1:
+        initializer(*initargs)
+        yield from map(function, tasks)
+        return
+    window = 2 * workers if window is None else window
+    with mp.Pool(workers, initializer, initargs) as pool:
+        pending: deque[mp.pool.AsyncResult[_R]] = deque()
+        for task in tasks:
+            if len(pending) >= window:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(function, (task,)))
+        while pending:
+            yield pending.popleft().get()
+
+
+def evaluate(
+    items: ty.Iterable[Item],
+    *,
+    workers: int | None = None,
+    backend: str = "vm",
+    chunksize: int = 256,
+) -> ty.Iterator[Outcome]:
+    # Evaluates every item with a pool of ExprEvaluators pinned to
+    # `backend`, yielding one Outcome per item in input order. Repeated
+    # items within a chunk are shipped and evaluated once.
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if chunksize < 1:
+        raise ValueError(f"chunksize must be positive, got {chunksize}")
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if workers < 1:
+        raise ValueError(f"workers must be positive, got {workers}")
+    # Positions of each chunk's items in its unique list, queued as the
+    # pool pulls chunks and popped as their results come back in order.
+    positions: deque[list[int]] = deque()
+
+    def unique(chunks: ty.Iterable[list[Item]]) -> ty.Iterator[list[Item]]:
+        for chunk in chunks:
+            index: dict[Item, int] = {}
+            positions.append([index.setdefault(item, len(index)) for item in chunk])
+            yield list(index)
+
+    results = ordered_map(
+        _run_chunk,
+        unique(chunked(map(_hashable, items), chunksize)),
+        workers=workers,
+        initializer=_init_worker,
+        initargs=(backend,),
+    )
+    for outcomes in results:
+        for position in positions.popleft():
+            yield outcomes[position]
+
+
+def _hashable(item: Item | bytearray | memoryview) -> Item:
+    return bytes(item) if isinstance(item, (bytearray, memoryview)) else item
@@ -0,0 +1,687 @@
+"""
+Micro-benchmarks for the exprlang engines.
+
+Usage: python -m exprlang.bench [name ...]
+"""
+from .instructions import Instruction, decode_operand
+from .exc import LexerError, UnknownInstruction
+from .token import Token, TokenType
+from .vm import VirtualMachine, LoadedProgram
+from .regvm import RegisterCompiler
+from .arena import ArenaParser, ArenaEvaluator, ArenaCompiler
+from .closures import ClosureCompiler
+from .codegen import CodeGenerator
+from .evaluator import Evaluator
+from .formatter import Formatter
+from .compiler import Compiler
+from .parser import Parser
+from .lexer import Lexer
+from . import constants, lexer as _lexer, nodes
+import typing as ty
+import operator
+import enum
+import random
+import timeit
+import sys
+
+BENCHMARKS: dict[str, ty.Callable[[], None]] = {}
+
+
+def benchmark(function: ty.Callable[[], None]):
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def best_of(
+    function: ty.Callable[[], object], repeat: int = 5, number: int = 1, setup: str = "pass"
+) -> float:
+    return min(timeit.repeat(function, setup, repeat=repeat, number=number)) / number
+
+
+def report(title: str, rows: list[tuple[str, float]]):
+    baseline = rows[0][1]
+    print(title)
+    for name, seconds in rows:
+        print(f"  {name:<24} {seconds * 1e6:12.1f} us  {baseline / seconds:6.2f}x")
+
+
+def generate(terms: int, variables: ty.Sequence[str] = ("x", "y"), seed: int = 0) -> str:
+    # A balanced random expression, nesting only grows with log(terms).
+    rng = random.Random(seed)
+    leaves = [*variables, *map(str, range(1, 10))]
+
+    def build(size: int) -> str:
+        if size == 1:
+            return rng.choice(leaves)
+        half = size // 2
+        op = rng.choice("+-*")
+        return f"({build(half)} {op} {build(size - half)})"
+
+    return build(terms)
+
+
+def parse_source(source: str):
+    return Parser().parse(Lexer().scan(source))
+
+
+def compile_source(source: str, fold: bool = True, cse: bool = True) -> bytes:
+    return Compiler(fold, cse).compile(parse_source(source))
+
+
+class CharLexer:
+    # The Lexer as it was before the regex scanner, one method call per
+    # character and decimals split into NUMBER DOT NUMBER. Baseline for the
+    # `lexer` benchmark.
+    def __init__(self, source: str | None = None) -> None:
+        self._source = source or ""
+        self._tokens: list[Token] = []
+        self._stop = len(self._source)
+        self._current = 0
+        self._start = 0
+
+    def _lexeme(self) -> str:
+        return self._source[self._start : self._current]
+
+    def advance(self):
+        self._current += 1
+
+    def consume(self):
+        self._start = self._current
+
+    def add_token(self, type: TokenType):
+        token = Token(type, self._lexeme(), self._start)
+        self._tokens.append(token)
+
+    def consume_token(self, type: TokenType):
+        self.add_token(type)
+        self.consume()
+
+    def consume_char(self, type: TokenType | None = None):
+        self.advance()
+        if type is not None:
+            self.consume_token(type)
+        self.consume()
+
+    def empty(self):
+        return self._current >= self._stop
+
+    def peek(self):
+        return "" if self.empty() else self._source[self._current]
+
+    reset = __init__
+
+    def _scan(self):
+        while not self.empty():
+            match self.peek():
+                case " ": self.consume_char()
+                case "*": self.consume_char(TokenType.STAR)
+                case "-": self.consume_char(TokenType.MINUS)
+                case "+": self.consume_char(TokenType.PLUS)
+                case "(": self.consume_char(TokenType.LEFT)
+                case ")": self.consume_char(TokenType.RIGHT)
+                case "^": self.consume_char(TokenType.POWER)
+                case "/": self.consume_char(TokenType.SLASH)
+                case ".": self.consume_char(TokenType.DOT)
+                case char:
+                    if char.isdigit():
+                        self.consume_number()
+                    elif char == "_" or char.isalpha():
+                        self.consume_identifier()
+                    else: raise LexerError(
+                        f"Unexpected character: {char!r} in column {self._current}"
+                    )
+
+    def consume_number(self):
+        while self.peek().isdigit():
+            self.advance()
+        self.consume_token(TokenType.NUMBER)
+
+    def consume_identifier(self):
+        while (char := self.peek()) == "_" or char.isalnum():
+            self.advance()
+        self.consume_token(TokenType.IDENTIFIER)
+
+    def scan(self, src: str | None = None):
+        self.reset(src)
+        self._scan()
+        eof = Token(TokenType.EOF, "", self._current)
+        self._tokens.append(eof)
+        return self._tokens
+
+
+class DescentParser(Parser):
+    # The Parser as it was before the precedence table, one method per
+    # level and eight calls down to every literal. Baseline for the
+    # `parser` benchmark.
+    def expression(self) -> nodes.Expression:
+        return self.minus()
+
+    def minus(self):
+        left = self.plus()
+        while self.peektype() == TokenType.MINUS:
+            operator = self.advance()
+            left = nodes.Minus(left, operator, self.plus())
+        return left
+
+    def plus(self):
+        left = self.star()
+        while self.peektype() == TokenType.PLUS:
+            operator = self.advance()
+            left = nodes.Plus(left, operator, self.star())
+        return left
+
+    def star(self):
+        left = self.slash()
+        while self.peektype() == TokenType.STAR:
+            operator = self.advance()
+            left = nodes.Star(left, operator, self.slash())
+        return left
+
+    def slash(self):
+        left = self.unary()
+        while self.peektype() == TokenType.SLASH:
+            operator = self.advance()
+            left = nodes.Slash(left, operator, self.unary())
+        return left
+
+    def unary(self):
+        if self.peektype() in (TokenType.PLUS, TokenType.MINUS):
+            operator = self.advance()
+            right = self.unary()
+            if operator.type == TokenType.PLUS:
+                return nodes.UPlus(operator, right)
+            return nodes.UMinus(operator, right)
+        return self.power()
+
+    def power(self):
+        left = self.group()
+        while self.peektype() == TokenType.POWER:
+            operator = self.advance()
+            left = nodes.Power(left, operator, self.group())
+        return left
+
+    def group(self):
+        if self.peektype() == TokenType.LEFT:
+            operator = self.advance()
+            middle = self.expression()
+            self.consume(
+                TokenType.RIGHT,
+                f"Group expression was never closed at column {operator.column}",
+            )
+            return nodes.Group(operator, middle)
+        if self.peektype() == TokenType.IDENTIFIER:
+            return nodes.Variable(self.advance())
+        return self.number()
+
+    def number(self):
+        token = self.consume(TokenType.NUMBER, f"Expected a number, got {self.peek()}")
+        return nodes.Number(token)
+
+
+# Tokens as they were before spans and integer codes, a __dict__ each with
+# a StrEnum type and a copy of the lexeme. Baseline for the `tokens`
+# benchmark.
+StrTokenType = enum.StrEnum("StrTokenType", [type.name for type in TokenType])
+
+
+class DictToken:
+    def __init__(self, type: str, lexeme: str, column: int, value: float | int | None = None) -> None:
+        if value is None and type is StrTokenType.NUMBER:
+            value = float(lexeme) if "." in lexeme else int(lexeme)
+        self.type = type
+        self.lexeme = lexeme
+        self.column = column
+        self.value = value
+
+
+def dict_scan(source: str) -> list[DictToken]:
+    operators = {char: StrTokenType[type.name] for char, type in _lexer._OPERATORS.items()}
+    tokens = []
+    for match in _lexer._TOKEN.finditer(source):
+        group = match.lastindex
+        if group is None:
+            continue
+        lexeme = match.group(group)
+        column = match.start(group)
+        if group == _lexer._OPERATOR:
+            tokens.append(DictToken(operators[lexeme], lexeme, column))
+        elif group == _lexer._NUMBER:
+            value = float(lexeme) if "." in lexeme else int(lexeme)
+            tokens.append(DictToken(StrTokenType.NUMBER, lexeme, column, value))
+        elif group == _lexer._IDENTIFIER:
+            tokens.append(DictToken(StrTokenType.IDENTIFIER, lexeme, column))
+        else:
+            raise LexerError(f"Unexpected character: {lexeme!r} in column {column}")
+    tokens.append(DictToken(StrTokenType.EOF, "", len(source)))
+    return tokens
+
+
+class DictNumber:
+    # Nodes as they were before __slots__, a __dict__ each and the whole
+    # token kept alive. Baseline for the `memory` benchmark, for exprlang
+    # and pratts tokens alike.
+    def __init__(self, token: ty.Any) -> None:
+        self.token = token
+
+
+class DictPlus:
+    def __init__(self, left: object, operator: ty.Any, right: object) -> None:
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+
+class MatchMachine:
+    # The VirtualMachine as it was before the table dispatched loop, kept
+    # as the baseline for the `vm` benchmark.
+    def __init__(self, bytecode: bytes = b"", slots: ty.Sequence[float | int] = ()):
+        self._bytecode = bytecode
+        self._slots = slots
+        self._constants: list[int | float] = []
+        self._stack: list[float] = []
+        self.pop = lambda: self._stack.pop()
+        self.push = self._stack.append
+        self._current = 0
+
+    reset = __init__
+
+    def execute(self, bytecode: bytes, slots: ty.Sequence[float | int] = ()):
+        self.reset(bytecode, slots)
+        self._constants, self._current = constants.decode_pool(self._bytecode)
+        self._execute()
+        if self._stack:
+            return self.pop()
+
+    def _execute(self):
+        while self.peek() != Instruction.EOS:
+            match self.peek():
+                case Instruction.ADD:        self.binary(operator.add)
+                case Instruction.POWER:      self.binary(operator.pow)
+                case Instruction.DIVIDE:     self.binary(operator.truediv)
+                case Instruction.MULTIPLY:   self.binary(operator.mul)
+                case Instruction.SUBTRACT:   self.binary(operator.sub)
+                case Instruction.LOAD_CONST: self.load(self._constants)
+                case Instruction.LOAD_VAR:   self.load(self._slots)
+                case unknown: raise UnknownInstruction(unknown)
+        self.advance()
+
+    def peek(self) -> int:
+        return self._bytecode[self._current]
+
+    def advance(self) -> int:
+        consumed = self.peek()
+        self._current += 1
+        return consumed
+
+    def binary(self, function: ty.Callable[[ty.Any, ty.Any], ty.Any]):
+        self.advance()
+        right = self.pop()
+        left = self.pop()
+        self.push(function(left, right))
+
+    def load(self, table: ty.Sequence[float | int]):
+        self.advance()
+        location, self._current = decode_operand(self._bytecode, self._current)
+        self.push(table[location])
+
+
+class AppendCompiler(Compiler):
+    # The Compiler as it was before interning, one pool entry per literal,
+    # as long as the peephole pass, which pools again, is off. Baseline for
+    # the `pool` benchmark.
+    def pushc(self, constant: float | int) -> int:
+        self._constants.append(constant)
+        return len(self._constants) - 1
+
+
+@benchmark
+def lexer():
+    for terms in (100, 10_000):
+        source = generate(terms, ("x", "rate", "_tmp1"))
+        legacy, scanner = CharLexer(), Lexer()
+        assert legacy.scan(source) == scanner.scan(source)
+        number = max(1, 20_000 // terms)
+        rows = [
+            ("per character", best_of(lambda: legacy.scan(source), number=number)),
+            ("regex", best_of(lambda: scanner.scan(source), number=number)),
+        ]
+        report(f"lexer: {len(source)} characters, time per character", [
+            (name, seconds / len(source)) for name, seconds in rows
+        ])
+
+
+@benchmark
+def parser():
+    rng = random.Random(0)
+    flat = " ".join(
+        f"{rng.choice('+-*/')} {rng.choice(['x', 'y', *map(str, range(1, 10))])}"
+        for _ in range(10_000)
+    )
+    workloads = [
+        ("flat, 10000 terms", "1 " + flat),
+        ("nested, 100 terms", generate(100)),
+        ("nested, 10000 terms", generate(10_000)),
+    ]
+    for title, source in workloads:
+        tokens = Lexer().scan(source)
+        legacy, table = DescentParser(), Parser()
+        assert legacy.parse(tokens) == table.parse(tokens)
+        number = max(1, 20_000 // len(tokens))
+        report(
+            f"parser: {title}, time per token",
+            [
+                ("recursive descent", best_of(lambda: legacy.parse(tokens), number=number) / len(tokens)),
+                ("precedence table", best_of(lambda: table.parse(tokens), number=number) / len(tokens)),
+            ],
+        )
+
+
+@benchmark
+def tokens():
+    import tracemalloc
+
+    source = generate(250_000, ("x", "rate", "_tmp1"))
+    scanner = Lexer()
+    count = len(scanner.scan(source))
+    assert [token.lexeme for token in dict_scan(source)] == [token.lexeme for token in scanner.scan(source)]
+    print(f"tokens: {count} tokens from {len(source)} characters")
+    rows = []
+    for name, scan in [("__dict__ and lexemes", dict_scan), ("__slots__ and spans", lambda s: Lexer().scan(s))]:
+        seconds = best_of(lambda: scan(source), repeat=3)
+        tracemalloc.start()
+        scanned = scan(source)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del scanned
+        rows.append((name, seconds, size))
+    for name, seconds, size in rows:
+        print(
+            f"  {name:<24} {seconds / count * 1e9:8.1f} ns/token  {size / count:8.1f} B/token"
+            f"  {rows[0][1] / seconds:6.2f}x time  {rows[0][2] / size:6.2f}x memory"
+        )
+
+
+@benchmark
+def memory():
+    import tracemalloc
+
+    from pratts import nodes as pratts_nodes, token as pratts_token
+    from pratts.typedef import Location
+
+    def exprlang_tokens(i: int) -> tuple[Token, Token]:
+        return Token(TokenType.NUMBER, str(i % 1000), i), Token(TokenType.PLUS, "+", 0)
+
+    def pratts_tokens(i: int) -> tuple[pratts_token.Token, pratts_token.Token]:
+        return (
+            pratts_token.Token(pratts_token.TkType.NUMBER, str(i % 1000), Location(1, i)),
+            pratts_token.Token(pratts_token.TkType.PLUS, "+", Location(1, 0)),
+        )
+
+    def build(
+        tokens: ty.Callable[[int], tuple[ty.Any, ty.Any]],
+        number: ty.Callable[[ty.Any], object],
+        plus: ty.Callable[..., object],
+        leaves: int,
+    ):
+        # A balanced sum of `leaves` numbers from fresh tokens, the way the
+        # parser hands them out, 2 * leaves - 1 nodes in all.
+        level = [number(tokens(i)[0]) for i in range(leaves)]
+        while len(level) > 1:
+            pairs = zip(level[::2], level[1::2])
+            paired = [plus(l, tokens(0)[1], r) for l, r in pairs]
+            level = paired + level[len(paired) * 2 :]
+        return level[0]
+
+    leaves = 500_000
+    # Both packages build Plus(left, operator, right) and Number(token), so
+    # the same __dict__ classes serve as the baseline for either.
+    for package, tokens, number, plus in [
+        ("exprlang", exprlang_tokens, nodes.Number, nodes.Plus),
+        ("pratts", pratts_tokens, pratts_nodes.Number, pratts_nodes.Plus),
+    ]:
+        rows = []
+        for name, number_class, plus_class in [
+            ("__dict__ and tokens", DictNumber, DictPlus),
+            ("__slots__ and spans", number, plus),
+        ]:
+            tracemalloc.start()
+            tree = build(tokens, number_class, plus_class, leaves)
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del tree
+            rows.append((name, size / (2 * leaves - 1)))
+        baseline = rows[0][1]
+        print(f"memory: {package}, {2 * leaves - 1} nodes, bytes per node")
+        for name, size in rows:
+            print(f"  {name:<24} {size:12.1f} B   {baseline / size:6.2f}x")
+
+
+@benchmark
+def arena():
+    import gc
+
+    variables = {"x": 3, "y": 0.5}
+    for terms in (100, 100_000):
+        tokens = Lexer().scan(generate(terms))
+        parser, arena_parser = Parser(), ArenaParser()
+        tree, flat = parser.parse(tokens), arena_parser.parse(tokens)
+        evaluator, arena_evaluator = Evaluator(), ArenaEvaluator()
+        compiler, arena_compiler = Compiler(cse=False), ArenaCompiler()
+        assert evaluator.eval(tree, variables) == arena_evaluator.eval(flat, variables)
+        assert compiler.compile(tree) == arena_compiler.compile(flat)
+        number = max(1, 100_000 // terms)
+        tracked = len(gc.get_objects())
+        del tree
+        tracked -= len(gc.get_objects())
+        tree = parser.parse(tokens)
+        print(f"arena: {terms} terms, {len(flat)} nodes, {tracked} gc tracked objects as a tree, 0 as an arena")
+        # timeit turns the collector off, which hides what allocating the
+        # tree's nodes costs a program that leaves it on.
+        for name, setup, nodes_run, arena_run in [
+            ("parse", "pass", lambda: parser.parse(tokens), lambda: arena_parser.parse(tokens)),
+            ("parse, gc on", "gc.enable()", lambda: parser.parse(tokens), lambda: arena_parser.parse(tokens)),
+            ("eval", "pass", lambda: evaluator.eval(tree, variables), lambda: arena_evaluator.eval(flat, variables)),
+            ("compile", "pass", lambda: compiler.compile(tree), lambda: arena_compiler.compile(flat)),
+        ]:
+            report(
+                f"  {name}",
+                [
+                    ("nodes", best_of(nodes_run, number=number, setup=setup)),
+                    ("arena", best_of(arena_run, number=number, setup=setup)),
+                ],
+            )
+
+
+@benchmark
+def evaluator():
+    # The visitor is the fast path, the explicit stack only runs for trees
+    # nested deeper than the recursion limit.
+    from .tests import EXPRESSIONS
+
+    variables = {"x": 3, "y": 0.5}
+    workloads = [
+        ("tests.EXPRESSIONS", [parse_source(source) for source, _ in EXPRESSIONS]),
+        ("100 terms", [parse_source(generate(100))]),
+        ("10000 terms", [parse_source(generate(10_000))]),
+    ]
+    engine = Evaluator()
+    for title, trees in workloads:
+        visit = lambda: [engine.eval(tree, variables) for tree in trees]
+        walk = lambda: [engine._walk(tree) for tree in trees]
+        assert visit() == walk()
+        number = max(1, 20_000 // sum(len(Formatter().format(tree)) for tree in trees))
+        report(
+            f"evaluator: {title}",
+            [
+                ("recursive visitor", best_of(visit, number=number)),
+                ("explicit stack", best_of(walk, number=number)),
+            ],
+        )
+    tree = parse_source("x")
+    for _ in range(100_000):
+        tree = nodes.UMinus(Token(TokenType.MINUS, "-", 0), tree)
+    report(
+        "evaluator: 100000 nested signs",
+        [("visitor, then stack", best_of(lambda: engine.eval(tree, variables)))],
+    )
+
+
+@benchmark
+def vm():
+    for terms in (100, 10_000):
+        bytecode = compile_source(generate(terms), fold=False, cse=False)
+        slots = (3, 0.5)
+        legacy, machine = MatchMachine(), VirtualMachine()
+        assert legacy.execute(bytecode, slots) == machine.execute(bytecode, slots)
+        number = max(1, 20_000 // terms)
+        report(
+            f"vm: {terms} terms, {len(bytecode)} bytes of bytecode",
+            [
+                ("match dispatch", best_of(lambda: legacy.execute(bytecode, slots), number=number)),
+                ("table dispatch", best_of(lambda: machine.execute(bytecode, slots), number=number)),
+            ],
+        )
+
+
+@benchmark
+def pool():
+    for name, source in [
+        ("10000 ones", " + ".join(["1"] * 10_000)),
+        ("10000 generated terms", generate(10_000)),
+    ]:
+        tree = parse_source(source)
+        legacy = AppendCompiler(fold=False, peephole=False).compile(tree)
+        interned = Compiler(fold=False).compile(tree)
+        legacy_pool, interned_pool = constants.decode_pool(legacy)[0], constants.decode_pool(interned)[0]
+        machine = VirtualMachine()
+        assert machine.execute(legacy, (3, 0.5)) == machine.execute(interned, (3, 0.5))
+        title = f"pool: {name}, {len(legacy_pool)} -> {len(interned_pool)} constants"
+        report(
+            f"{title}, {len(legacy)} -> {len(interned)} bytes, decode",
+            [
+                ("every literal", best_of(lambda: constants.decode_pool(legacy), number=20)),
+                ("interned", best_of(lambda: constants.decode_pool(interned), number=20)),
+            ],
+        )
+        report(
+            f"{title}, execute",
+            [
+                ("every literal", best_of(lambda: machine.execute(legacy, (3, 0.5)), number=20)),
+                ("interned", best_of(lambda: machine.execute(interned, (3, 0.5)), number=20)),
+            ],
+        )
+
+
+@benchmark
+def cse():
+    for terms in (10, 1_000):
+        part = generate(terms)
+        tree = parse_source(f"({part}) * ({part}) / ({part}) + ({part})")
+        plain, shared = Compiler(fold=False, cse=False), Compiler(fold=False)
+        plain_code, shared_code = plain.compile(tree), shared.compile(tree)
+        machine = VirtualMachine()
+        slots = (3, 0.5)
+        assert machine.execute(plain_code, slots) == machine.execute(shared_code, slots)
+        number = max(1, 20_000 // terms)
+        title = f"cse: 4 copies of {terms} terms, {len(plain_code)} -> {len(shared_code)} bytes of bytecode"
+        report(
+            f"{title}, compile",
+            [
+                ("every copy", best_of(lambda: plain.compile(tree), number=number)),
+                ("shared", best_of(lambda: shared.compile(tree), number=number)),
+            ],
+        )
+        report(
+            f"{title}, execute",
+            [
+                ("every copy", best_of(lambda: machine.execute(plain_code, slots), number=number)),
+                ("shared", best_of(lambda: machine.execute(shared_code, slots), number=number)),
+            ],
+        )
+
+
+@benchmark
+def loaded():
+    for terms in (10, 1_000):
+        bytecode = compile_source(generate(terms), fold=False)
+        machine, program = VirtualMachine(), LoadedProgram(bytecode)
+        slots = (3, 0.5)
+        number = max(1, 100_000 // terms)
+        report(
+            f"loaded: {terms} terms, executed repeatedly",
+            [
+                ("VirtualMachine.execute", best_of(lambda: machine.execute(bytecode, slots), number=number)),
+                ("LoadedProgram.run", best_of(lambda: program.run(slots), number=number)),
+            ],
+        )
+
+
+@benchmark
+def registers():
+    from .tests import EXPRESSIONS
+
+    # Without folding, or the corpus compiles to constants only.
+    corpus = [parse_source(expr) for expr, _ in EXPRESSIONS]
+    stack, register = Compiler(fold=False), RegisterCompiler(fold=False)
+    cases = [("tests.EXPRESSIONS", corpus, ())]
+    for terms in (100, 10_000):
+        cases.append((f"{terms} generated terms", [parse_source(generate(terms))], (3, 0.5)))
+    for name, trees, slots in cases:
+        bytecodes = [stack.compile(tree) for tree in trees]
+        loaded = [LoadedProgram(bytecode) for bytecode in bytecodes]
+        programs = [register.compile(tree) for tree in trees]
+        for program, bytecode in zip(programs, bytecodes):
+            assert program.run(slots) == VirtualMachine().execute(bytecode, slots)
+        machine = VirtualMachine()
+        counts = sum(len(program.code) for program in loaded), sum(len(program.code) for program in programs)
+        number = max(1, 20_000 // sum(counts))
+        report(
+            f"registers: {name}, {counts[0]} stack -> {counts[1]} register instructions",
+            [
+                ("VirtualMachine.execute", best_of(lambda: [machine.execute(b, slots) for b in bytecodes], number=number)),
+                ("LoadedProgram.run", best_of(lambda: [program.run(slots) for program in loaded], number=number)),
+                ("RegisterProgram.run", best_of(lambda: [program.run(slots) for program in programs], number=number)),
+            ],
+        )
+
+
+@benchmark
+def backends():
+    for terms in (10, 1_000):
+        source = generate(terms)
+        ast = parse_source(source)
+        bytecode = compile_source(source, fold=False)
+        closures = ClosureCompiler()
+        closure = closures.compile(ast)
+        machine, program, evaluator = VirtualMachine(), LoadedProgram(bytecode), Evaluator()
+        variables = {"x": 3, "y": 0.5}
+        slots = [variables[name] for name in closures.variables]
+        function = CodeGenerator().compile(ast)
+        registers = RegisterCompiler(fold=False).compile(ast)
+        assert closure(slots) == program.run(slots) == evaluator.eval(ast, variables)
+        assert registers.run(slots) == program.run(slots)
+        assert function(slots) == closure(slots)
+        number = max(1, 100_000 // terms)
+        report(
+            f"backends: {terms} terms, precompiled",
+            [
+                ("Evaluator.eval", best_of(lambda: evaluator.eval(ast, variables), number=number)),
+                ("VirtualMachine.execute", best_of(lambda: machine.execute(bytecode, slots), number=number)),
+                ("LoadedProgram.run", best_of(lambda: program.run(slots), number=number)),
+                ("RegisterProgram.run", best_of(lambda: registers.run(slots), number=number)),
+                ("closure", best_of(lambda: closure(slots), number=number)),
+                ("codegen", best_of(lambda: function(slots), number=number)),
+            ],
+        )
+
+
+def main(argv: list[str]):
+    names = argv or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit(f"Unknown benchmark {name!r}, choose from {', '.join(BENCHMARKS)}")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+import typing as ty
+
+if ty.TYPE_CHECKING:
+    from .closures import Closure
+    from .codegen import Function
+    from .vm import LoadedProgram
+    from .regvm import RegisterProgram
+    from . import nodes
+
+
+class CacheEntry:
+    # Everything the front end produced for one source string, plus the
+    # call count and tier ExprEvaluator.eval uses to promote it. `tier` is
+    # the tier running the expression, `attempted` the last one promoted to,
+    # which is ahead of `tier` once a backend failed to compile it.
+    __slots__ = (
+        "ast", "bytecode", "variables", "program", "registers", "closure", "function",
+        "calls", "tier", "attempted", "runner",
+    )
+
+    def __init__(self, ast: "nodes.Expression") -> None:
+        self.ast = ast
+        self.bytecode: bytes | None = None
+        self.variables: tuple[str, ...] = ()
+        self.program: "LoadedProgram | None" = None
+        self.registers: "RegisterProgram | None" = None
+        self.closure: "Closure | None" = None
+        self.function: "Function | None" = None
+        self.calls = 0
+        self.tier = 0
+        self.attempted = 0
+        self.runner: "ty.Callable[[ty.Sequence[float | int]], ty.Any] | None" = None
+
+
+class CompileCache:
+    # Bounded LRU mapping of source text to CacheEntry.
+    def __init__(self, maxsize: int = 1024) -> None:
+        if maxsize < 0:
+            raise ValueError(f"maxsize must be non-negative, got {maxsize}")
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.maxsize = maxsize
+        self.evictions = 0
+        self.misses = 0
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, expr: object) -> bool:
+        return expr in self._entries
+
+    def get(self, expr: str) -> CacheEntry | None:
+        entry = self._entries.get(expr)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(expr)
+        self.hits += 1
+        return entry
+
+    def peek(self, expr: str) -> CacheEntry | None:
+        # Like get, but neither counted nor moved to the front.
+        return self._entries.get(expr)
+
+    def put(self, expr: str, entry: CacheEntry):
+        if self.maxsize == 0:
+            return
+        self._entries[expr] = entry
+        self._entries.move_to_end(expr)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.evictions = 0
+        self.misses = 0
+        self.hits = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"CompileCache(size={len(self)}, maxsize={self.maxsize}, hits={self.hits}, "
+            f"misses={self.misses}, evictions={self.evictions})"
+        )
@@ -0,0 +1,85 @@
+from .regvm import RegisterCompiler
+from . import nodes
+import typing as ty
+import operator
+
+Number = float | int
+Closure = ty.Callable[[ty.Sequence[Number]], Number]
+
+
+class ClosureCompiler(nodes.Visitor[Closure]):
+    # Turns the AST into nested Python closures once. Literals are decoded
+    # here, so calling the result does no visitor dispatch or parsing.
+    # Calling nested closures recurses as deep as the tree, so trees too
+    # deep to compile this way run as a flat RegisterProgram instead.
+    def __init__(self) -> None:
+        self._slots: dict[str, int] = {}
+
+    @property
+    def variables(self) -> tuple[str, ...]:
+        return tuple(self._slots)
+
+    reset = __init__
+
+    def accept_number(self, expr: nodes.Number) -> Closure:
+        value = expr.value
+        return lambda slots: value
+
+    def accept_variable(self, expr: nodes.Variable) -> Closure:
+        slot = self._slots.setdefault(expr.name, len(self._slots))
+        return operator.itemgetter(slot)
+
+    def accept_group(self, expr: nodes.Group) -> Closure:
+        return expr.right.accept(self)
+
+    def accept_uplus(self, expr: nodes.UPlus) -> Closure:
+        right = expr.right.accept(self)
+        return lambda slots: +right(slots)
+
+    def accept_uminus(self, expr: nodes.UMinus) -> Closure:
+        right = expr.right.accept(self)
+        return lambda slots: -right(slots)
+
+    def _binlr(self, expr: nodes.Binary) -> tuple[Closure, Closure]:
+        return expr.left.accept(self), expr.right.accept(self)
+
+    def accept_plus(self, expr: nodes.Plus) -> Closure:
+        left, right = self._binlr(expr)
+        return lambda slots: left(slots) + right(slots)
+
+    def accept_minus(self, expr: nodes.Minus) -> Closure:
+        left, right = self._binlr(expr)
+        return lambda slots: left(slots) - right(slots)
+
+    def accept_star(self, expr: nodes.Star) -> Closure:
+        left, right = self._binlr(expr)
+        return lambda slots: left(slots) * right(slots)
+
+    def accept_power(self, expr: nodes.Power) -> Closure:
+        left, right = self._binlr(expr)
+        return lambda slots: left(slots) ** right(slots)
+
+    def accept_slash(self, expr: nodes.Slash) -> Closure:
+        left, right = self._binlr(expr)
+        column = expr.column
+
+        def divide(slots: ty.Sequence[Number]):
+            dividend = left(slots)
+            divisor = right(slots)
+            if divisor == 0:
+                raise ZeroDivisionError(
+                    f"Zero division error '{dividend} / 0' at column {column}"
+                )
+            return dividend / divisor
+
+        return divide
+
+    def compile(self, root: nodes.Expression) -> Closure:
+        self.reset()
+        try:
+            return root.accept(self)
+        except RecursionError:
+            registers = RegisterCompiler()
+            program = registers.compile(root)
+            self._slots = {name: slot for slot, name in enumerate(registers.variables)}
+            return program.run
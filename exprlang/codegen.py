@@ -0,0 +1,171 @@
+from . import nodes
+import typing as ty
+import ast
+
+Number = float | int
+Function = ty.Callable[[ty.Sequence[Number]], Number]
+
+_OPERATORS: dict[type, type[ast.operator]] = {
+    nodes.Plus: ast.Add,
+    nodes.Minus: ast.Sub,
+    nodes.Star: ast.Mult,
+    nodes.Power: ast.Pow,
+}
+
+
+def _zero_division(dividend: Number, column: int) -> ty.NoReturn:
+    raise ZeroDivisionError(f"Zero division error '{dividend} / 0' at column {column}")
+
+
+class CodeGenerator(nodes.Visitor[ast.expr]):
+    # Translates the AST into a Python function `def expression(slots)` and
+    # lets CPython compile it. Expressions are emitted inline, divisions are
+    # hoisted into statements so the divisor can be checked for the same
+    # ZeroDivisionError the Evaluator raises. Whatever was evaluated to the
+    # left of a hoisted division is stored first, keeping the evaluation
+    # order of the Evaluator. Trees too deep for the visitor, or for
+    # CPython to compile as one expression, are emitted by _walk as
+    # straight-line code with one temporary per operation.
+    def __init__(self) -> None:
+        self._slots: dict[str, int] = {}
+        self._body: list[ast.stmt] = []
+        self._temps = 0
+
+    @property
+    def variables(self) -> tuple[str, ...]:
+        return tuple(self._slots)
+
+    reset = __init__
+
+    def _temp(self, value: ast.expr, at: int | None = None) -> ast.Name:
+        if isinstance(value, (ast.Name, ast.Constant)):
+            return ty.cast(ast.Name, value)
+        name = f"t{self._temps}"
+        self._temps += 1
+        store = ast.Assign([ast.Name(name, ast.Store())], value, lineno=0)
+        self._body.insert(len(self._body) if at is None else at, store)
+        return ast.Name(name, ast.Load())
+
+    def _binlr(self, expr: nodes.Binary) -> tuple[ast.expr, ast.expr]:
+        left = expr.left.accept(self)
+        mark = len(self._body)
+        right = expr.right.accept(self)
+        if len(self._body) != mark:
+            left = self._temp(left, at=mark)
+        return left, right
+
+    def _binary(self, expr: nodes.Binary) -> ast.expr:
+        left, right = self._binlr(expr)
+        return ast.BinOp(left, _OPERATORS[type(expr)](), right)
+
+    def accept_number(self, expr: nodes.Number) -> ast.expr:
+        return ast.Constant(expr.value)
+
+    def accept_variable(self, expr: nodes.Variable) -> ast.expr:
+        slot = self._slots.setdefault(expr.name, len(self._slots))
+        return ast.Name(f"v{slot}", ast.Load())
+
+    def accept_group(self, expr: nodes.Group) -> ast.expr:
+        return expr.right.accept(self)
+
+    def accept_uplus(self, expr: nodes.UPlus) -> ast.expr:
+        return ast.UnaryOp(ast.UAdd(), expr.right.accept(self))
+
+    def accept_uminus(self, expr: nodes.UMinus) -> ast.expr:
+        return ast.UnaryOp(ast.USub(), expr.right.accept(self))
+
+    def accept_plus(self, expr: nodes.Plus) -> ast.expr:
+        return self._binary(expr)
+
+    def accept_minus(self, expr: nodes.Minus) -> ast.expr:
+        return self._binary(expr)
+
+    def accept_star(self, expr: nodes.Star) -> ast.expr:
+        return self._binary(expr)
+
+    def accept_power(self, expr: nodes.Power) -> ast.expr:
+        return self._binary(expr)
+
+    def accept_slash(self, expr: nodes.Slash) -> ast.expr:
+        left, right = self._binlr(expr)
+        return self._divide(left, right, expr.column)
+
+    def _divide(self, left: ast.expr, right: ast.expr, column: int) -> ast.expr:
+        left, right = self._temp(left), self._temp(right)
+        check = ast.If(
+            ast.Compare(right, [ast.Eq()], [ast.Constant(0)]),
+            [ast.Expr(ast.Call(ast.Name("_zero_division", ast.Load()), [left, ast.Constant(column)], []))],
+            [],
+        )
+        self._body.append(check)
+        return self._temp(ast.BinOp(left, ast.Div(), right))
+
+    def _walk(self, root: nodes.Expression) -> ast.expr:
+        # Post-order with an explicit stack, like RegisterCompiler._walk.
+        # Every operation is stored in a temporary right away, so no
+        # expression in the function nests deeper than one operator.
+        operands: list[ast.expr] = []
+        pending: list[ty.Any] = [root]
+        while pending:
+            expr = pending.pop()
+            kind = type(expr)
+            if kind is tuple:
+                expr = expr[0]
+                kind = type(expr)
+                right = operands.pop()
+                if kind is nodes.UMinus:
+                    right = self._temp(ast.UnaryOp(ast.USub(), right))
+                elif kind is nodes.UPlus:
+                    right = self._temp(ast.UnaryOp(ast.UAdd(), right))
+                elif kind is nodes.Slash:
+                    right = self._divide(operands.pop(), right, expr.column)
+                else:
+                    right = self._temp(ast.BinOp(operands.pop(), _OPERATORS[kind](), right))
+                operands.append(right)
+            elif kind is nodes.Number or kind is nodes.Variable:
+                operands.append(expr.accept(self))
+            elif kind is nodes.Group:
+                pending.append(expr.right)
+            else:
+                pending.append((expr,))
+                pending.append(expr.right)
+                if isinstance(expr, nodes.Binary):
+                    pending.append(expr.left)
+        return operands.pop()
+
+    def generate(self, root: nodes.Expression, flat: bool = False) -> ast.Module:
+        # `flat` emits straight-line code even for shallow trees.
+        self.reset()
+        if flat:
+            result = self._walk(root)
+        else:
+            try:
+                result = root.accept(self)
+            except RecursionError:
+                self.reset()
+                result = self._walk(root)
+        body = [*self._body, ast.Return(result)]
+        if self._slots:
+            names = [ast.Name(f"v{slot}", ast.Store()) for slot in range(len(self._slots))]
+            unpack = ast.Assign([ast.Tuple(names, ast.Store())], ast.Name("slots", ast.Load()))
+            body.insert(0, unpack)
+        arguments = ast.arguments([], [ast.arg("slots")], None, [], [], None, [])
+        function = ast.FunctionDef("expression", arguments, body, [], lineno=0)
+        return ast.fix_missing_locations(ast.Module([function], []))
+
+    def source(self, root: nodes.Expression) -> str:
+        try:
+            return ast.unparse(self.generate(root))
+        except RecursionError:
+            return ast.unparse(self.generate(root, flat=True))
+
+    def compile(self, root: nodes.Expression, filename: str = "<exprlang>") -> Function:
+        # The nested expression may be fine for the visitor and still too
+        # deep for CPython's compiler, which then raises RecursionError too.
+        try:
+            code = compile(self.generate(root), filename, "exec")
+        except RecursionError:
+            code = compile(self.generate(root, flat=True), filename, "exec")
+        namespace: dict[str, ty.Any] = {"_zero_division": _zero_division}
+        exec(code, namespace)
+        return namespace["expression"]
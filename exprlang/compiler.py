@@ -1,77 +1,448 @@
-from .instructions import Instruction
-from . import nodes
+from .instructions import HAS_OPERAND, Instruction, decode_operand, encode_operand
+from .exc import UnknownInstruction
+from collections import Counter
+from . import constants, nodes
+import typing as ty
+import operator
 
+Number = float | int
 
-class Compiler(nodes.Visitor[None]):
+_OPERATORS: dict[type, ty.Callable[[Number, Number], ty.Any]] = {
+    nodes.Plus: operator.add,
+    nodes.Minus: operator.sub,
+    nodes.Star: operator.mul,
+    nodes.Slash: operator.truediv,
+    nodes.Power: operator.pow,
+}
+_SIGNS: dict[type, ty.Callable[[Number], Number]] = {
+    nodes.UMinus: operator.neg,
+    nodes.UPlus: operator.pos,
+    nodes.Group: operator.pos,
+}
+_OPCODES: dict[type, Instruction] = {
+    nodes.Plus: Instruction.ADD,
+    nodes.Minus: Instruction.SUBTRACT,
+    nodes.Star: Instruction.MULTIPLY,
+    nodes.Slash: Instruction.DIVIDE,
+    nodes.Power: Instruction.POWER,
+    nodes.UMinus: Instruction.NEGATE,
+}
+
+
+def _pool_key(constant: Number) -> tuple[type, ty.Any]:
+    # Constants are pooled once per type and value, so 1 and 1.0 stay apart.
+    # -0.0 equals 0.0 and NaN equals nothing, their repr tells them apart.
+    if type(constant) is float and (constant == 0 or constant != constant):
+        return (float, repr(constant))
+    return (type(constant), constant)
+
+
+class ConstantFolder(nodes.Visitor[Number | None]):
+    # Computes the value of every subtree whose operands are all known at
+    # compile time. Subtrees depending on variables evaluate to None. Trees
+    # too deep for the visitor are folded again by _walk, without recursion.
+    def __init__(self) -> None:
+        self.constants: dict[int, Number] = {}
+
+    def _record(self, expr: nodes.Expression, value: Number | None):
+        if value is not None:
+            self.constants[id(expr)] = value
+        return value
+
+    def _binary(self, expr: nodes.Binary, op: ty.Callable[[Number, Number], ty.Any]):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        return self._apply(expr, op, left, right)
+
+    def _apply(
+        self,
+        expr: nodes.Binary,
+        op: ty.Callable[[Number, Number], ty.Any],
+        left: Number | None,
+        right: Number | None,
+    ):
+        if left is None or right is None:
+            return None
+        try:
+            value = op(left, right)
+        except OverflowError:
+            return None  # Left for the machine to report at runtime.
+        if type(value) not in (int, float):
+            return None
+        return self._record(expr, value)
+
+    def accept_number(self, expr: nodes.Number):
+        return self._record(expr, expr.value)
+
+    def accept_variable(self, expr: nodes.Variable):
+        return None
+
+    def accept_group(self, expr: nodes.Group):
+        return self._record(expr, expr.right.accept(self))
+
+    def accept_uplus(self, expr: nodes.UPlus):
+        right = expr.right.accept(self)
+        return None if right is None else self._record(expr, +right)
+
+    def accept_uminus(self, expr: nodes.UMinus):
+        right = expr.right.accept(self)
+        return None if right is None else self._record(expr, -right)
+
+    def accept_plus(self, expr: nodes.Plus):
+        return self._binary(expr, operator.add)
+
+    def accept_minus(self, expr: nodes.Minus):
+        return self._binary(expr, operator.sub)
+
+    def accept_star(self, expr: nodes.Star):
+        return self._binary(expr, operator.mul)
+
+    def accept_power(self, expr: nodes.Power):
+        return self._binary(expr, operator.pow)
+
+    def _divide(self, expr: nodes.Binary):
+        def divide(left: Number, right: Number):
+            if right == 0:
+                raise ZeroDivisionError(
+                    f"Zero division error '{left} / 0' at column {expr.column}"
+                )
+            return left / right
+
+        return divide
+
+    def accept_slash(self, expr: nodes.Slash):
+        return self._binary(expr, self._divide(expr))
+
+    def fold(self, root: nodes.Expression) -> dict[int, Number]:
+        self.constants = {}
+        try:
+            root.accept(self)
+        except RecursionError:
+            self.constants = {}
+            self._walk(root)
+        return self.constants
+
+    def _walk(self, root: nodes.Expression):
+        # Post-order with an explicit stack: a node is revisited as a
+        # (function, node) pair once its operands are on `values`.
+        values: list[Number | None] = []
+        pending: list[ty.Any] = [root]
+        while pending:
+            expr = pending.pop()
+            kind = type(expr)
+            if kind is tuple:
+                function, expr = expr
+                if isinstance(expr, nodes.Unary):
+                    if values[-1] is not None:
+                        values[-1] = self._record(expr, function(values[-1]))
+                    continue
+                right = values.pop()
+                if function is operator.truediv:
+                    function = self._divide(expr)
+                values[-1] = self._apply(expr, function, values[-1], right)
+            elif kind is nodes.Number:
+                values.append(self._record(expr, expr.value))
+            elif kind is nodes.Variable:
+                values.append(None)
+            elif kind in _SIGNS:
+                pending.append((_SIGNS[kind], expr))
+                pending.append(expr.right)
+            else:
+                pending.append((_OPERATORS[kind], expr))
+                pending.append(expr.right)
+                pending.append(expr.left)
+
+
+class CommonSubtrees:
+    # Value numbering: structurally equal subtrees get the same number, built
+    # bottom-up from the numbers of their children, so comparing two subtrees
+    # compares two ints. Groups take the number of what they enclose.
+    #
+    # find() returns the operator nodes whose subtree is reached more than
+    # once, counting every repeat but not descending into it, mapped to
+    # their number. Leaves and folded constants are never shared, loading
+    # them again costs as much as loading a temporary.
     def __init__(self) -> None:
-        self._constants: list[list[int]] = [[1, ord("0")]]
+        self.numbers: dict[int, int] = {}
+
+    def number(self, root: nodes.Expression) -> dict[int, int]:
+        keys: dict[tuple[ty.Any, ...], int] = {}
+        numbers: dict[int, int] = {}
+        pending: list[ty.Any] = [root]
+        while pending:
+            expr = pending.pop()
+            kind = type(expr)
+            if kind is tuple:
+                expr = expr[0]
+                kind = type(expr)
+                if kind is nodes.Group:
+                    numbers[id(expr)] = numbers[id(expr.right)]
+                    continue
+                if isinstance(expr, nodes.Unary):
+                    key: tuple[ty.Any, ...] = (kind, numbers[id(expr.right)])
+                else:
+                    key = (kind, numbers[id(expr.left)], numbers[id(expr.right)])
+            elif kind is nodes.Number:
+                key = (kind, type(expr.value), expr.value)
+            elif kind is nodes.Variable:
+                key = (kind, expr.name)
+            else:
+                pending.append((expr,))
+                pending.append(expr.right)
+                if isinstance(expr, nodes.Binary):
+                    pending.append(expr.left)
+                continue
+            numbers[id(expr)] = keys.setdefault(key, len(keys))
+        self.numbers = numbers
+        return numbers
+
+    def find(self, root: nodes.Expression, folded: ty.Mapping[int, Number] = {}) -> dict[int, int]:
+        numbers = self.number(root)
+        uses: Counter[int] = Counter()
+        reached: list[tuple[int, int]] = []
+        pending: list[ty.Any] = [root]
+        while pending:
+            expr = pending.pop()
+            kind = type(expr)
+            if kind is nodes.Number or kind is nodes.Variable or id(expr) in folded:
+                continue
+            if kind is nodes.Group:
+                pending.append(expr.right)
+                continue
+            number = numbers[id(expr)]
+            reached.append((id(expr), number))
+            uses[number] += 1
+            if uses[number] == 1:
+                pending.append(expr.right)
+                if isinstance(expr, nodes.Binary):
+                    pending.append(expr.left)
+        return {node: number for node, number in reached if uses[number] > 1}
+
+
+class Peephole:
+    # Rewrites short instruction sequences of finished bytecode into cheaper
+    # ones with the same result. Each instruction is matched against the end
+    # of the output, so rewrites cascade and `----3` becomes `LOAD_CONST 3`:
+    #
+    #   LOAD_CONST k; NEGATE  ->  LOAD_CONST -k
+    #   NEGATE; NEGATE        ->
+    #
+    # `a + -b` is not `a - b`: with a = -0.0 and the int b = 0 the first is
+    # 0.0 and the second -0.0, and the type of b is only known at run time.
+    # The constant pool is rebuilt from the constants still loaded.
+    def __init__(self) -> None:
+        self._constants: list[Number] = []
+        self._interned: dict[tuple[type, ty.Any], int] = {}
+
+    reset = __init__
+
+    def pushc(self, constant: Number) -> int:
+        location = self._interned.setdefault(_pool_key(constant), len(self._constants))
+        if location == len(self._constants):
+            self._constants.append(constant)
+        return location
+
+    def optimize(self, bytecode: bytes) -> bytes:
+        self.reset()
+        consts, ip = constants.decode_pool(bytecode)
+        # (opcode, operand) pairs, LOAD_CONST carries the constant itself.
+        code: list[tuple[int, ty.Any]] = []
+        while (op := bytecode[ip]) != Instruction.EOS:
+            if op in HAS_OPERAND:
+                operand, ip = decode_operand(bytecode, ip + 1)
+                code.append((op, consts[operand] if op == Instruction.LOAD_CONST else operand))
+                continue
+            if op not in _INSTRUCTIONS:
+                raise UnknownInstruction(op)
+            ip += 1
+            last = code[-1][0] if code else None
+            if op == Instruction.NEGATE and last == Instruction.NEGATE:
+                code.pop()
+            elif op == Instruction.NEGATE and last == Instruction.LOAD_CONST:
+                code[-1] = (last, -code[-1][1])
+            else:
+                code.append((op, None))
+        buffer = bytearray()
+        for op, operand in code:
+            buffer.append(op)
+            if op == Instruction.LOAD_CONST:
+                buffer += encode_operand(self.pushc(operand))
+            elif operand is not None:
+                buffer += encode_operand(operand)
+        buffer.append(Instruction.EOS)
+        return constants.encode_pool(self._constants) + bytes(buffer)
+
+
+_INSTRUCTIONS: frozenset[int] = frozenset(Instruction)
+
+
+class Compiler(nodes.Visitor[None]):
+    # Emits bytecode by visiting the tree, or with _emit_walk when the tree
+    # is nested deeper than the interpreter stack allows.
+    def __init__(self, fold: bool = True, cse: bool = True, peephole: bool = True) -> None:
+        self._constants: list[Number] = []
+        self._interned: dict[tuple[type, ty.Any], int] = {}
+        self._folded: dict[int, Number] = {}
+        # Node ids of repeated subtrees to their number, and the temporary
+        # each number is stored in once computed.
+        self._shared: dict[int, int] = {}
+        self._temps: dict[int, int] = {}
         self._buffer: list[int] = []
+        self._slots: dict[str, int] = {}
         self.push = self._buffer.append
+        self.fold = fold
+        self.cse = cse
+        self.peephole = peephole
+
+    @property
+    def variables(self) -> tuple[str, ...]:
+        # Variable names of the last compiled program, in slot order.
+        return tuple(self._slots)
 
-    def pushc(self, constant: list[int]) -> int:
-        location = len(self._constants)
-        self._constants.append(constant)
+    def slot(self, name: str) -> int:
+        return self._slots.setdefault(name, len(self._slots))
+
+    def pushc(self, constant: Number) -> int:
+        location = self._interned.setdefault(_pool_key(constant), len(self._constants))
+        if location == len(self._constants):
+            self._constants.append(constant)
         return location
 
     reset = __init__
 
-    def accept_number(self, expr: nodes.Number):
-        size = len(expr.token.lexeme)
-        constant = [size, *map(ord, expr.token.lexeme)]
+    def operand(self, value: int):
+        self._buffer.extend(encode_operand(value))
+
+    def load_const(self, constant: Number):
         self.push(Instruction.LOAD_CONST)
         location = self.pushc(constant)
-        self.push(location)
+        self.operand(location)
+
+    def store_temp(self, number: int):
+        # Keeps a copy of the value just computed for the repeats.
+        temp = self._temps[number] = len(self._temps)
+        self.push(Instruction.DUP)
+        self.push(Instruction.STORE_TEMP)
+        self.operand(temp)
+
+    def load_temp(self, number: int):
+        self.push(Instruction.LOAD_TEMP)
+        self.operand(self._temps[number])
+
+    def emit(self, expr: nodes.Expression):
+        # Subtrees known at compile time collapse into a single constant,
+        # repeated subtrees are computed once and then loaded.
+        value = self._folded.get(id(expr))
+        if value is not None:
+            self.load_const(value)
+            return
+        shared = self._shared.get(id(expr))
+        if shared is None:
+            expr.accept(self)
+        elif shared in self._temps:
+            self.load_temp(shared)
+        else:
+            expr.accept(self)
+            self.store_temp(shared)
+
+    def accept_number(self, expr: nodes.Number):
+        self.load_const(expr.value)
+
+    def accept_variable(self, expr: nodes.Variable):
+        self.push(Instruction.LOAD_VAR)
+        self.operand(self.slot(expr.name))
 
     def accept_plus(self, expr: nodes.Plus):
-        expr.left.accept(self)
-        expr.right.accept(self)
+        self.emit(expr.left)
+        self.emit(expr.right)
         self.push(Instruction.ADD)
 
     def accept_minus(self, expr: nodes.Minus):
-        expr.left.accept(self)
-        expr.right.accept(self)
+        self.emit(expr.left)
+        self.emit(expr.right)
         self.push(Instruction.SUBTRACT)
 
     def accept_slash(self, expr: nodes.Slash):
-        expr.left.accept(self)
-        expr.right.accept(self)
+        self.emit(expr.left)
+        self.emit(expr.right)
         self.push(Instruction.DIVIDE)
 
     def accept_power(self, expr: nodes.Power):
-        expr.left.accept(self)
-        expr.right.accept(self)
+        self.emit(expr.left)
+        self.emit(expr.right)
         self.push(Instruction.POWER)
 
     def accept_star(self, expr: nodes.Star):
-        expr.left.accept(self)
-        expr.right.accept(self)
+        self.emit(expr.left)
+        self.emit(expr.right)
         self.push(Instruction.MULTIPLY)
 
     def accept_group(self, expr: nodes.Group):
-        expr.right.accept(self)
+        self.emit(expr.right)
 
     def accept_uminus(self, expr: nodes.UMinus):
-        self.push(Instruction.LOAD_CONST)
-        self.push(0)
-        expr.right.accept(self)
-        self.push(Instruction.SUBTRACT)
+        self.emit(expr.right)
+        self.push(Instruction.NEGATE)
 
     def accept_uplus(self, expr: nodes.UPlus):
-        self.push(Instruction.LOAD_CONST)
-        self.push(0)
-        expr.right.accept(self)
-        self.push(Instruction.ADD)
+        # +x is x for every number, there is nothing to run.
+        self.emit(expr.right)
 
-    def serialize_consts(self):
-        from itertools import chain
+    def _emit_walk(self, root: nodes.Expression):
+        # Pre-order with an explicit stack. Operators are pushed below their
+        # operands as the Instruction to emit once those are compiled, the
+        # first copy of a repeated subtree below that as a (number,) pair.
+        pending: list[ty.Any] = [root]
+        while pending:
+            expr = pending.pop()
+            kind = type(expr)
+            if kind is Instruction:
+                self.push(expr)
+                continue
+            if kind is tuple:
+                self.store_temp(expr[0])
+                continue
+            value = self._folded.get(id(expr))
+            shared = self._shared.get(id(expr))
+            if value is not None:
+                self.load_const(value)
+                continue
+            if shared is not None:
+                if shared in self._temps:
+                    self.load_temp(shared)
+                    continue
+                pending.append((shared,))
+            if kind is nodes.Number or kind is nodes.Variable:
+                expr.accept(self)
+            elif kind is nodes.Group or kind is nodes.UPlus:
+                pending.append(expr.right)
+            elif kind is nodes.UMinus:
+                pending.append(Instruction.NEGATE)
+                pending.append(expr.right)
+            else:
+                pending.append(_OPCODES[kind])
+                pending.append(expr.right)
+                pending.append(expr.left)
 
-        constants = chain.from_iterable(self._constants)
-        return bytes(chain(constants, (Instruction.EOS,)))
+    def serialize_consts(self):
+        return constants.encode_pool(self._constants)
 
     def compile(self, root: nodes.Expression):
-        self.reset()
-        root.accept(self)
+        self.reset(self.fold, self.cse, self.peephole)
+        if self.fold:
+            self._folded = ConstantFolder().fold(root)
+        if self.cse:
+            self._shared = CommonSubtrees().find(root, self._folded)
+        try:
+            self.emit(root)
+        except RecursionError:
+            folded, shared = self._folded, self._shared
+            self.reset(self.fold, self.cse, self.peephole)
+            self._folded, self._shared = folded, shared
+            self._emit_walk(root)
+        return self.finish()
+
+    def finish(self) -> bytes:
         self.push(Instruction.EOS)
-        program = bytes(self._buffer)
-        cosnts = self.serialize_consts()
-        return cosnts + program
+        bytecode = self.serialize_consts() + bytes(self._buffer)
+        return Peephole().optimize(bytecode) if self.peephole else bytecode
@@ -0,0 +1,60 @@
+from .instructions import encode_operand, decode_operand
+from .exc import InvalidByteCode
+import struct
+import enum
+
+Number = float | int
+
+# Constant pool layout (varints are encoded like instruction operands):
+#   version:u8  count:varint  tags:u8[count]
+#   doubles:f64le[number of FLOAT tags]
+#   ints:(size:varint value:u8[size] big endian two's complement)[number of INT tags]
+VERSION = 3
+
+
+class Tag(enum.IntEnum):
+    INT = 0
+    FLOAT = 1
+
+
+def _int_size(value: int) -> int:
+    return value.bit_length() // 8 + 1
+
+
+def encode_pool(values: list[Number]) -> bytes:
+    tags = bytes(Tag.FLOAT if isinstance(value, float) else Tag.INT for value in values)
+    floats = [value for value in values if isinstance(value, float)]
+    buffer = bytearray((VERSION,))
+    buffer += encode_operand(len(values))
+    buffer += tags
+    buffer += struct.pack(f"<{len(floats)}d", *floats)
+    for value in values:
+        if isinstance(value, float):
+            continue
+        size = _int_size(value)
+        buffer += encode_operand(size)
+        buffer += value.to_bytes(size, "big", signed=True)
+    return bytes(buffer)
+
+
+def decode_pool(bytecode: bytes, offset: int = 0) -> tuple[list[Number], int]:
+    # Returns the constants and the offset of the first instruction.
+    if bytecode[offset] != VERSION:
+        raise InvalidByteCode(
+            f"Unsupported constant pool version {bytecode[offset]}, expected {VERSION}"
+        )
+    count, offset = decode_operand(bytecode, offset + 1)
+    tags = bytecode[offset : offset + count]
+    offset += count
+    nfloats = tags.count(Tag.FLOAT)
+    floats = iter(struct.unpack(f"<{nfloats}d", bytes(bytecode[offset : offset + nfloats * 8])))
+    offset += nfloats * 8
+    values: list[Number] = []
+    for tag in tags:
+        if tag == Tag.FLOAT:
+            values.append(next(floats))
+            continue
+        size, offset = decode_operand(bytecode, offset)
+        values.append(int.from_bytes(bytecode[offset : offset + size], "big", signed=True))
+        offset += size
+    return values, offset
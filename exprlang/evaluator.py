@@ -1,7 +1,29 @@
+from .exc import UnboundVariable
+import typing as ty
 from . import nodes
+import operator
+
+_BINARY: dict[type, ty.Callable[[ty.Any, ty.Any], ty.Any]] = {
+    nodes.Plus: operator.add,
+    nodes.Minus: operator.sub,
+    nodes.Star: operator.mul,
+    nodes.Slash: operator.truediv,
+    nodes.Power: operator.pow,
+}
+_UNARY: dict[type, ty.Callable[[ty.Any], ty.Any]] = {
+    nodes.UMinus: operator.neg,
+    nodes.UPlus: operator.pos,
+    nodes.Group: operator.pos,
+}
 
 
 class Evaluator(nodes.Visitor[float | int]):
+    # Recursion is the fastest way through the usual, shallow tree. Trees
+    # nested deeper than the interpreter stack allows are evaluated again by
+    # _walk, which keeps its own stack and is only limited by memory.
+    def __init__(self) -> None:
+        self._variables: ty.Mapping[str, float | int] = {}
+
     def accept_group(self, expr: nodes.Group):
         return expr.right.accept(self)
 
@@ -15,8 +37,15 @@ class Evaluator(nodes.Visitor[float | int]):
         return left - right
 
     def accept_number(self, expr: nodes.Number):
-        type = float if "." in expr.token.lexeme else int
-        return type(expr.token.lexeme)
+        return expr.value
+
+    def accept_variable(self, expr: nodes.Variable):
+        try:
+            return self._variables[expr.name]
+        except KeyError:
+            raise UnboundVariable(
+                f"Variable {expr.name!r} at column {expr.column} is not bound"
+            ) from None
 
     def accept_plus(self, expr: nodes.Plus):
         left, right = self._binlr(expr)
@@ -26,7 +55,7 @@ class Evaluator(nodes.Visitor[float | int]):
         left, right = self._binlr(expr)
         if right == 0:
             raise ZeroDivisionError(
-                f"Zero division error '{left} / 0' at column {expr.operator.column}"
+                f"Zero division error '{left} / 0' at column {expr.column}"
             )
         return left / right
 
@@ -46,5 +75,44 @@ class Evaluator(nodes.Visitor[float | int]):
         right = expr.right.accept(self)
         return +right
 
-    def eval(self, root: nodes.Expression):
-        return root.accept(self)
+    def eval(
+        self,
+        root: nodes.Expression,
+        variables: ty.Mapping[str, float | int] | None = None,
+    ):
+        self._variables = {} if variables is None else variables
+        try:
+            return root.accept(self)
+        except RecursionError:
+            return self._walk(root)
+
+    def _walk(self, root: nodes.Expression):
+        # Post-order with an explicit stack. An operator goes back on
+        # `pending` as a (function, node) pair below its operands and is
+        # applied to `values` once they have been evaluated.
+        values: list[ty.Any] = []
+        pending: list[ty.Any] = [root]
+        while pending:
+            expr = pending.pop()
+            kind = type(expr)
+            if kind is tuple:
+                function, expr = expr
+                if isinstance(expr, nodes.Unary):
+                    values[-1] = function(values[-1])
+                    continue
+                right = values.pop()
+                if function is operator.truediv and right == 0:
+                    raise ZeroDivisionError(
+                        f"Zero division error '{values[-1]} / 0' at column {expr.column}"
+                    )
+                values[-1] = function(values[-1], right)
+            elif kind is nodes.Number or kind is nodes.Variable:
+                values.append(expr.accept(self))
+            elif kind in _UNARY:
+                pending.append((_UNARY[kind], expr))
+                pending.append(expr.right)
+            else:
+                pending.append((_BINARY[kind], expr))
+                pending.append(expr.right)
+                pending.append(expr.left)
+        return values.pop()
@@ -12,3 +12,11 @@ class ParserError(Error):
 
 class UnknownInstruction(Error):
     ...
+
+
+class UnboundVariable(Error):
+    ...
+
+
+class InvalidByteCode(Error):
+    ...
@@ -1,19 +1,23 @@
 from . import nodes
+import typing as ty
 
 
 class Formatter(nodes.Visitor[str]):
     def accept_number(self, expr: nodes.Number):
-        return expr.token.lexeme
+        return expr.lexeme
+
+    def accept_variable(self, expr: nodes.Variable):
+        return expr.lexeme
 
     def _lint_binary(self, expr: nodes.Binary):
         left: str = expr.left.accept(self)
         right: str = expr.right.accept(self)
-        op: str = expr.operator.lexeme
+        op: str = expr.lexeme
         return f"{left} {op} {right}"
 
     def _lint_unary(self, expr: nodes.Unary):
         right: str = expr.right.accept(self)
-        op: str = expr.operator.lexeme
+        op: str = expr.lexeme
         return f"{op}{right}"
 
     def accept_plus(self, expr: nodes.Plus):
@@ -41,4 +45,32 @@ class Formatter(nodes.Visitor[str]):
         return self._lint_unary(expr)
 
     def format(self, root: nodes.Expression):
-        return root.accept(self)
+        try:
+            return root.accept(self)
+        except RecursionError:
+            return self._walk(root)
+
+    def _walk(self, root: nodes.Expression):
+        # In order with an explicit stack holding nodes still to format and
+        # the text that goes between them, for trees too deep to visit.
+        pieces: list[str] = []
+        pending: list[ty.Any] = [root]
+        while pending:
+            expr = pending.pop()
+            kind = type(expr)
+            if kind is str:
+                pieces.append(expr)
+            elif kind is nodes.Number or kind is nodes.Variable:
+                pieces.append(expr.lexeme)
+            elif kind is nodes.Group:
+                pieces.append("(")
+                pending.append(")")
+                pending.append(expr.right)
+            elif isinstance(expr, nodes.Unary):
+                pieces.append(expr.lexeme)
+                pending.append(expr.right)
+            else:
+                pending.append(expr.right)
+                pending.append(f" {expr.lexeme} ")
+                pending.append(expr.left)
+        return "".join(pieces)
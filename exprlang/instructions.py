@@ -9,3 +9,42 @@ class Instruction(enum.IntEnum):
     MULTIPLY = enum.auto()
     SUBTRACT = enum.auto()
     LOAD_CONST = enum.auto()
+    LOAD_VAR = enum.auto()
+    # Common subexpressions: DUP copies the top of the stack, STORE_TEMP
+    # pops it into a temporary that LOAD_TEMP pushes again.
+    DUP = enum.auto()
+    STORE_TEMP = enum.auto()
+    LOAD_TEMP = enum.auto()
+    NEGATE = enum.auto()
+
+
+# Instructions followed by an operand.
+HAS_OPERAND: frozenset[int] = frozenset(
+    (Instruction.LOAD_CONST, Instruction.LOAD_VAR, Instruction.STORE_TEMP, Instruction.LOAD_TEMP)
+)
+
+
+# Operands (constant indices, variable slots) are unsigned LEB128 varints:
+# seven bits per byte, least significant group first, high bit set on all
+# but the last byte. Values below 128 still take a single byte.
+def encode_operand(value: int) -> bytes:
+    if value < 0:
+        raise ValueError(f"Operands must be non-negative, got {value}")
+    buffer = bytearray()
+    while value > 0x7F:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+    return bytes(buffer)
+
+
+def decode_operand(bytecode: bytes | list[int], offset: int) -> tuple[int, int]:
+    # Returns the operand and the offset right after it.
+    value = shift = 0
+    while True:
+        byte = bytecode[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
@@ -1,73 +1,124 @@
 from .token import Token, TokenType
 from .exc import LexerError
+import typing as ty
+import mmap
+import re
+
+Buffer = str | bytes | bytearray | memoryview | mmap.mmap
+Source = Buffer | ty.IO[str] | ty.IO[bytes]
+
+# Every match skips the spaces in front of one token and captures it in the
+# group of its class. Decimals are a single NUMBER, a stray dot is left for
+# the parser to reject and anything else lands in the last group.
+_PATTERN = r"""
+    \ *(?:
+        (\d+(?:\.\d+)?)   # 1: number
+      | ([^\W\d]\w*)      # 2: identifier
+      | ([-+*/^().])      # 3: operator
+      | (.)               # 4: unexpected character
+      | \Z                #    trailing spaces
+    )
+"""
+_TOKEN = re.compile(_PATTERN, re.VERBOSE | re.DOTALL)
+# Binary sources are matched as they are, identifiers are ASCII only there.
+_BYTES_TOKEN = re.compile(_PATTERN.encode(), re.VERBOSE | re.DOTALL)
+_NUMBER, _IDENTIFIER, _OPERATOR, _ERROR = range(1, 5)
+# A match ending this close to the end of a chunk could still grow, e.g.
+# "12" followed by ".5" in the next chunk.
+_LOOKAHEAD = 2
+
+_OPERATORS: dict[str, TokenType] = {
+    "*": TokenType.STAR,
+    "-": TokenType.MINUS,
+    "+": TokenType.PLUS,
+    "(": TokenType.LEFT,
+    ")": TokenType.RIGHT,
+    "^": TokenType.POWER,
+    "/": TokenType.SLASH,
+    ".": TokenType.DOT,
+}
+# The same, keyed by what indexing a binary buffer gives.
+_BYTE_OPERATORS: dict[int, TokenType] = {ord(char): type for char, type in _OPERATORS.items()}
 
 
 class Lexer:
     def __init__(self, source: str | None = None) -> None:
         self._source = source or ""
         self._tokens: list[Token] = []
-        self._stop = len(self._source)
-        self._current = 0
-        self._start = 0
-
-    def _lexeme(self) -> str:
-        return self._source[self._start : self._current]
-
-    def advance(self):
-        self._current += 1
-
-    def consume(self):
-        self._start = self._current
-
-    def add_token(self, type: TokenType):
-        token = Token(type, self._lexeme(), self._start)
-        self._tokens.append(token)
-
-    def consume_token(self, type: TokenType):
-        self.add_token(type)
-        self.consume()
-
-    def consume_char(self, type: TokenType | None = None):
-        self.advance()
-        if type is not None:
-            self.consume_token(type)
-        self.consume()
-
-    def empty(self):
-        return self._current >= self._stop
-
-    def peek(self):
-        return "" if self.empty() else self._source[self._current]
 
     reset = __init__
 
-    def _scan(self):
-        while not self.empty():
-            match self.peek():
-                case " ": self.consume_char()
-                case "*": self.consume_char(TokenType.STAR)
-                case "-": self.consume_char(TokenType.MINUS)
-                case "+": self.consume_char(TokenType.PLUS)
-                case "(": self.consume_char(TokenType.LEFT)
-                case ")": self.consume_char(TokenType.RIGHT)
-                case "^": self.consume_char(TokenType.POWER)
-                case "/": self.consume_char(TokenType.SLASH)
-                case ".": self.consume_char(TokenType.DOT)
-                case char:
-                    if char.isdigit():
-                        self.consume_number()
-                    else: raise LexerError(
-                        f"Unexpected character: {char!r} in column {self._current}"
-                    )
+    def _scan(
+        self, buffer: Buffer, offset: int = 0, limit: int | None = None
+    ) -> ty.Generator[Token, None, int]:
+        # Yields the tokens in buffer, which starts at column `offset`. With a
+        # limit, stops at the first token reaching past it and returns the
+        # position to resume from once more input is appended.
+        #
+        # Tokens refer to their span of an immutable buffer, lexemes are only
+        # copied out of buffers that may change or be closed under them.
+        binary = not isinstance(buffer, str)
+        pattern = _BYTES_TOKEN if binary else _TOKEN
+        operators = _BYTE_OPERATORS if binary else _OPERATORS
+        dot = b"." if binary else "."
+        text = buffer if isinstance(buffer, (str, bytes)) else None
+        number_type, identifier_type = TokenType.NUMBER, TokenType.IDENTIFIER
+        for match in pattern.finditer(ty.cast(ty.Any, buffer)):
+            if limit is not None and match.end() > limit:
+                return match.start()
+            group = match.lastindex
+            if group is None:
+                continue
+            start, end = match.span(group)
+            column = offset + start if offset else start
+            if group == _OPERATOR:
+                kind, value = operators[buffer[start]], None
+            elif group == _NUMBER:
+                number = match.group(group)
+                kind, value = number_type, float(number) if dot in number else int(number)
+            elif group == _IDENTIFIER:
+                kind, value = identifier_type, None
+            else:
+                lexeme = match.group(group)
+                if binary:
+                    lexeme = lexeme.decode("latin-1")
+                raise LexerError(f"Unexpected character: {lexeme!r} in column {column}")
+            if text is None:
+                yield Token(kind, match.group(group).decode("latin-1"), column, value)
+            else:
+                yield Token(kind, text, column, value, start, end)
+        return len(buffer)
 
-    def consume_number(self):
-        while self.peek().isdigit():
-            self.advance()
-        self.consume_token(TokenType.NUMBER)
+    def _chunks(
+        self, file: ty.IO[ty.Any], chunksize: int
+    ) -> ty.Generator[Token, None, int]:
+        # Only the unfinished tail of the previous chunk is carried over.
+        buffer = file.read(0)
+        offset = 0
+        while chunk := file.read(chunksize):
+            buffer += chunk
+            resume = yield from self._scan(buffer, offset, len(buffer) - _LOOKAHEAD)
+            buffer = buffer[resume:]
+            offset += resume
+        yield from self._scan(buffer, offset)
+        return offset + len(buffer)
 
     def scan(self, src: str | None = None):
         self.reset(src)
-        self._scan()
-        eof = Token(TokenType.EOF, "", self._current)
+        self._tokens.extend(self._scan(self._source))
+        eof = Token(TokenType.EOF, "", len(self._source))
         self._tokens.append(eof)
         return self._tokens
+
+    def stream(self, source: Source, chunksize: int = 1 << 16) -> ty.Iterator[Token]:
+        # Yields the tokens of source as they are found, ending with EOF.
+        # Buffers (bytes, memoryview, mmap) are matched in place and file
+        # objects are read `chunksize` at a time, so memory stays bounded by
+        # the longest token. Columns count bytes for binary sources.
+        if isinstance(source, memoryview):
+            source = source.cast("B")
+        if isinstance(source, (str, bytes, bytearray, memoryview, mmap.mmap)):
+            end = yield from self._scan(source)
+        else:
+            end = yield from self._chunks(source, chunksize)
+        yield Token(TokenType.EOF, "", end)
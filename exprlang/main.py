@@ -1,36 +1,255 @@
-from .vm import VirtualMachine as _VirtualMachine
+from .tiers import TierStats, Tiers, DEFAULT_TIERS, validate as _validate
+from .prepared import PreparedExpression
+from .exc import UnboundVariable as _UnboundVariable
+from .cache import CompileCache as _CompileCache, CacheEntry as _CacheEntry
+from .vm import VirtualMachine as _VirtualMachine, LoadedProgram as _LoadedProgram
+from .regvm import RegisterCompiler as _RegisterCompiler, RegisterProgram as _RegisterProgram
+from .closures import ClosureCompiler as _ClosureCompiler, Closure as _Closure
+from .codegen import CodeGenerator as _CodeGenerator, Function as _Function
 from .evaluator import Evaluator as _Evaluator
 from .formatter import Formatter as _Formatter
 from .compiler import Compiler as _Compiler
 from .parser import Parser as _Parser
 from .lexer import Lexer as _Lexer
+import typing as ty
+
+if ty.TYPE_CHECKING:
+    from .vectorized import VectorizedExpression as _VectorizedExpression
 
 
 class ExprEvaluator:
     # Facade to abstract away all the madness.
-    def __init__(self) -> None:
+    #
+    # eval() starts every expression on the first of `tiers` and promotes it
+    # to the next backend once it has been evaluated as many times as that
+    # tier's threshold. `backend` pins every expression to one backend.
+    def __init__(
+        self,
+        cache_size: int = 1024,
+        tiers: Tiers = DEFAULT_TIERS,
+        backend: str | None = None,
+    ) -> None:
+        self._tiers = _validate(tiers if backend is None else ((backend, 0),))
+        self._cache = _CompileCache(cache_size)
+        self.stats = TierStats()
         self._vm = _VirtualMachine()
         self._formatter = _Formatter()
         self._evaluator = _Evaluator()
         self._compiler = _Compiler()
+        self._registers = _RegisterCompiler()
+        self._closures = _ClosureCompiler()
+        self._codegen = _CodeGenerator()
         self._parser = _Parser()
         self._lexer = _Lexer()
 
+    @property
+    def cache(self) -> _CompileCache:
+        return self._cache
+
     def _genast(self, expr: str):
         tokens = self._lexer.scan(expr)
         return self._parser.parse(tokens)
 
+    def _entry(self, expr: str) -> _CacheEntry:
+        entry = self._cache.get(expr)
+        if entry is None:
+            entry = _CacheEntry(self._genast(expr))
+            self._cache.put(expr, entry)
+        return entry
+
     def format(self, expr: str) -> str:
-        ast = self._genast(expr)
+        ast = self._entry(expr).ast
         return self._formatter.format(ast)
 
-    def eval(self, expr: str):
-        ast = self._genast(expr)
-        return self._evaluator.eval(ast)
+    def eval(self, expr: str, /, **variables: float | int):
+        entry = self._entry(expr)
+        entry.calls += 1
+        tiers = self._tiers
+        while entry.attempted + 1 < len(tiers) and entry.calls > tiers[entry.attempted + 1][1]:
+            entry.attempted += 1
+            self._promote(expr, entry, entry.attempted)
+        backend = tiers[entry.tier][0]
+        self.stats.calls[backend] += 1
+        if backend == "eval":
+            return self._evaluator.eval(entry.ast, variables)
+        if entry.runner is None:
+            entry.runner = self.prepare(expr, backend)._run
+        try:
+            slots = [variables[name] for name in entry.variables]
+        except KeyError as e:
+            raise _UnboundVariable(f"Variable {e.args[0]!r} is not bound") from None
+        return entry.runner(slots)
+
+    def _promote(self, expr: str, entry: _CacheEntry, tier: int):
+        # The new runner is built before the tier changes. A backend that
+        # cannot compile the expression is skipped, it keeps running on the
+        # current tier until the next one is due.
+        old, new = self._tiers[entry.tier][0], self._tiers[tier][0]
+        runner = None
+        if new != "eval":
+            try:
+                runner = self.prepare(expr, new)._run
+            except RecursionError:
+                self.stats.failures[new] += 1
+                return
+        entry.runner = runner
+        entry.tier = tier
+        self.stats.promoted(expr, old, new)
+
+    def tier(self, expr: str) -> str:
+        # The backend eval() currently uses for `expr`.
+        entry = self._cache.peek(expr)
+        return self._tiers[0 if entry is None else entry.tier][0]
+
+    def exec(self, bytecode: bytes, slots: tuple[float | int, ...] = ()):
+        return self._vm.execute(bytecode, slots)
 
-    def exec(self, bytecode: bytes):
-        return self._vm.execute(bytecode)
+    def _compiled(self, expr: str) -> _CacheEntry:
+        entry = self._entry(expr)
+        if entry.bytecode is None:
+            entry.bytecode = self._compiler.compile(entry.ast)
+            entry.variables = self._compiler.variables
+        return entry
 
     def compile(self, expr: str):
-        ast = self._genast(expr)
-        return self._compiler.compile(ast)
+        return self._compiled(expr).bytecode
+
+    def _loaded(self, expr: str) -> _CacheEntry:
+        entry = self._compiled(expr)
+        if entry.program is None:
+            assert entry.bytecode is not None
+            entry.program = _LoadedProgram(entry.bytecode)
+        return entry
+
+    def load(self, expr: str) -> _LoadedProgram:
+        program = self._loaded(expr).program
+        assert program is not None
+        return program
+
+    def _allocated(self, expr: str) -> _CacheEntry:
+        entry = self._entry(expr)
+        if entry.registers is None:
+            entry.registers = self._registers.compile(entry.ast)
+            entry.variables = self._registers.variables
+        return entry
+
+    def registers(self, expr: str) -> _RegisterProgram:
+        program = self._allocated(expr).registers
+        assert program is not None
+        return program
+
+    def _enclosed(self, expr: str) -> _CacheEntry:
+        entry = self._entry(expr)
+        if entry.closure is None:
+            entry.closure = self._closures.compile(entry.ast)
+            entry.variables = self._closures.variables
+        return entry
+
+    def closure(self, expr: str) -> _Closure:
+        closure = self._enclosed(expr).closure
+        assert closure is not None
+        return closure
+
+    def _generated(self, expr: str) -> _CacheEntry:
+        entry = self._entry(expr)
+        if entry.function is None:
+            entry.function = self._codegen.compile(entry.ast, f"<exprlang {expr!r}>")
+            entry.variables = self._codegen.variables
+        return entry
+
+    def codegen(self, expr: str) -> _Function:
+        function = self._generated(expr).function
+        assert function is not None
+        return function
+
+    def prepare(self, expr: str, backend: str = "vm") -> PreparedExpression:
+        # backend "vm" runs a LoadedProgram, "register" a RegisterProgram,
+        # "closure" nested closures and "codegen" a function compiled by
+        # CPython.
+        run: ty.Callable[[ty.Sequence[float | int]], ty.Any]
+        if backend == "vm":
+            entry = self._loaded(expr)
+            assert entry.program is not None
+            run = entry.program.run
+        elif backend == "register":
+            entry = self._allocated(expr)
+            assert entry.registers is not None
+            run = entry.registers.run
+        elif backend == "closure":
+            entry = self._enclosed(expr)
+            assert entry.closure is not None
+            run = entry.closure
+        elif backend == "codegen":
+            entry = self._generated(expr)
+            assert entry.function is not None
+            run = entry.function
+        else:
+            raise ValueError(
+                f"Unknown backend {backend!r}, expected 'vm', 'register', 'closure' or 'codegen'"
+            )
+        return PreparedExpression(expr, entry.bytecode, entry.variables, run)
+
+    def vectorize(self, expr: str, zero_division: str = "raise") -> "_VectorizedExpression":
+        # Same as prepare, but the result is called with numpy arrays. Its
+        # `mask` has the elements divided by zero with zero_division="nan".
+        from .vectorized import VectorizedMachine, VectorizedExpression
+
+        vm = VectorizedMachine(ty.cast(ty.Any, zero_division))
+        entry = self._compiled(expr)
+        bytecode = entry.bytecode
+        assert bytecode is not None
+        return VectorizedExpression(expr, bytecode, entry.variables, vm)
+
+    def eval_many(
+        self,
+        items: ty.Iterable[str | bytes],
+        /,
+        *,
+        workers: int | None = None,
+        chunksize: int = 256,
+        backend: str = "vm",
+        return_exceptions: bool = False,
+    ) -> ty.Iterator[ty.Any]:
+        # Results of evaluating source strings, or executing bytecode, across
+        # a process pool, in input order. Input is read lazily, a bounded
+        # number of chunks at a time, so `items` may be unbounded. A failing
+        # item raises its error when reached, or is yielded as the exception
+        # with return_exceptions. See exprlang.batch.evaluate.
+        from .batch import evaluate
+
+        outcomes = evaluate(items, workers=workers, backend=backend, chunksize=chunksize)
+        for value, error in outcomes:
+            if error is None:
+                yield value
+            elif return_exceptions:
+                yield error
+            else:
+                raise error
+
+    def eval_parallel(
+        self,
+        expr: str,
+        /,
+        *args: ty.Any,
+        workers: int | None = None,
+        chunksize: int = 1 << 20,
+        zero_division: str = "raise",
+        out: ty.Any = None,
+        mask: ty.Any = None,
+        **kwargs: ty.Any,
+    ):
+        # Multi-core vectorized evaluation, see exprlang.parallel.evaluate.
+        # Returns the output SharedArray; close it once done with the result.
+        from .parallel import evaluate
+
+        prepared = self.prepare(expr)
+        assert prepared.bytecode is not None
+        return evaluate(
+            prepared.bytecode,
+            prepared.bind(*args, **kwargs),
+            workers=workers,
+            chunksize=chunksize,
+            zero_division=ty.cast(ty.Any, zero_division),
+            out=out,
+            mask=mask,
+        )
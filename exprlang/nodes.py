@@ -1,10 +1,6 @@
+from .token import Token, TokenType
 import typing as ty
 
-if ty.TYPE_CHECKING:
-    from .token import Token
-else:
-    Token = None
-
 _T_co = ty.TypeVar("_T_co", covariant=True)
 
 
@@ -27,85 +23,189 @@ class Visitor(ty.Protocol[_T_co]):
 
     def accept_number(self, expr: "Number") -> _T_co: ...
 
+    def accept_variable(self, expr: "Variable") -> _T_co: ...
+
 
 class Expression(ty.Protocol):
+    __slots__ = ()
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co: ...
 
     def __eq__(self, other: object) -> bool: ...
 
 
+# Nodes are built from tokens but keep only their source span, the column
+# and the lexeme, which operators share through their class. `operator` and
+# `token` rebuild a Token from that span when one is asked for.
+
+
 class Binary:
+    __slots__ = ("left", "column", "right")
+    type: ty.ClassVar[TokenType]
+    lexeme: ty.ClassVar[str]
+
     def __init__(self, left: Expression, operator: Token, right: Expression) -> None:
         self.left = left
-        self.operator = operator
+        self.column = operator.column
         self.right = right
 
+    @property
+    def operator(self) -> Token:
+        return Token(self.type, self.lexeme, self.column)
+
     def __eq__(self, expr: object) -> bool:
-        return isinstance(expr, Binary) and (
-            self.left == expr.left
-            and self.operator == expr.operator
-            and self.right == expr.right
-        ) or NotImplemented
+        if not isinstance(expr, Binary):
+            return NotImplemented
+        return equal(self, expr)
 
 
 class Unary:
+    __slots__ = ("column", "right")
+    type: ty.ClassVar[TokenType]
+    lexeme: ty.ClassVar[str]
+
     def __init__(self, operator: Token, right: Expression) -> None:
-        self.operator = operator
+        self.column = operator.column
         self.right = right
 
+    @property
+    def operator(self) -> Token:
+        return Token(self.type, self.lexeme, self.column)
+
     def __eq__(self, expr: object) -> bool:
-        return isinstance(expr, Unary) and (
-            self.operator == expr.operator
-            and self.right == expr.right
-        ) or NotImplemented
+        if not isinstance(expr, Unary):
+            return NotImplemented
+        return equal(self, expr)
 
 
 class Plus(Binary, Expression):
+    __slots__ = ()
+    type, lexeme = TokenType.PLUS, "+"
+
     def accept(self, visitor: Visitor[_T_co]):
         return visitor.accept_plus(self)
 
 
 class Minus(Binary, Expression):
+    __slots__ = ()
+    type, lexeme = TokenType.MINUS, "-"
+
     def accept(self, visitor: Visitor[_T_co]):
         return visitor.accept_minus(self)
 
 
 class Star(Binary, Expression):
+    __slots__ = ()
+    type, lexeme = TokenType.STAR, "*"
+
     def accept(self, visitor: Visitor[_T_co]):
         return visitor.accept_star(self)
 
 
 class Slash(Binary, Expression):
+    __slots__ = ()
+    type, lexeme = TokenType.SLASH, "/"
+
     def accept(self, visitor: Visitor[_T_co]):
         return visitor.accept_slash(self)
 
 
 class Power(Binary, Expression):
+    __slots__ = ()
+    type, lexeme = TokenType.POWER, "^"
+
     def accept(self, visitor: Visitor[_T_co]):
         return visitor.accept_power(self)
 
 
 class Group(Unary, Expression):
+    __slots__ = ()
+    type, lexeme = TokenType.LEFT, "("
+
     def accept(self, visitor: Visitor[_T_co]):
         return visitor.accept_group(self)
 
 
 class UPlus(Unary, Expression):
+    __slots__ = ()
+    type, lexeme = TokenType.PLUS, "+"
+
     def accept(self, visitor: Visitor[_T_co]):
         return visitor.accept_uplus(self)
 
 
 class UMinus(Unary, Expression):
+    __slots__ = ()
+    type, lexeme = TokenType.MINUS, "-"
+
     def accept(self, visitor: Visitor[_T_co]):
         return visitor.accept_uminus(self)
 
 
 class Number(Expression):
+    # `value` is the literal decoded once by the lexer.
+    __slots__ = ("value", "lexeme", "column")
+
     def __init__(self, token: Token) -> None:
-        self.token = token
+        assert token.value is not None
+        self.value: float | int = token.value
+        self.lexeme = token.lexeme
+        self.column = token.column
+
+    @property
+    def token(self) -> Token:
+        return Token(TokenType.NUMBER, self.lexeme, self.column, self.value)
 
     def accept(self, visitor: Visitor[_T_co]):
         return visitor.accept_number(self)
 
     def __eq__(self, numb: object) -> bool:
-        return isinstance(numb, Number) and self.token == numb.token or NotImplemented
+        if not isinstance(numb, Number):
+            return NotImplemented
+        return self.lexeme == numb.lexeme and self.column == numb.column
+
+
+class Variable(Expression):
+    __slots__ = ("name", "column")
+
+    def __init__(self, token: Token) -> None:
+        self.name = token.lexeme
+        self.column = token.column
+
+    @property
+    def lexeme(self) -> str:
+        return self.name
+
+    @property
+    def token(self) -> Token:
+        return Token(TokenType.IDENTIFIER, self.name, self.column)
+
+    def accept(self, visitor: Visitor[_T_co]):
+        return visitor.accept_variable(self)
+
+    def __eq__(self, var: object) -> bool:
+        if not isinstance(var, Variable):
+            return NotImplemented
+        return self.name == var.name and self.column == var.column
+
+
+def equal(left: Expression, right: Expression) -> bool:
+    # Structural comparison with an explicit stack, so the depth of the
+    # trees is not bounded by the recursion limit.
+    pending: list[tuple[ty.Any, ty.Any]] = [(left, right)]
+    while pending:
+        left, right = pending.pop()
+        if type(left) is not type(right):
+            return False
+        if isinstance(left, Binary):
+            if left.column != right.column:
+                return False
+            pending.append((left.right, right.right))
+            pending.append((left.left, right.left))
+        elif isinstance(left, Unary):
+            if left.column != right.column:
+                return False
+            pending.append((left.right, right.right))
+        elif left != right:
+            return False
+    return True
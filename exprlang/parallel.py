@@ -0,0 +1,184 @@
+from multiprocessing import shared_memory
+from .vectorized import VectorizedMachine, ZeroDivision, np, _require_numpy
+import multiprocessing as mp
+import typing as ty
+import os
+
+if ty.TYPE_CHECKING:
+    from numpy.typing import ArrayLike, DTypeLike, NDArray
+
+Number = float | int
+Spec = tuple[str, tuple[int, ...], str]
+
+
+class SharedArray:
+    # A numpy array living in a multiprocessing.shared_memory block.
+    # Workers attach to it by name, so the data itself is never pickled.
+    def __init__(
+        self, shape: tuple[int, ...], dtype: "DTypeLike", name: str | None = None
+    ) -> None:
+        _require_numpy()
+        dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * dtype.itemsize)
+        self._owner = name is None
+        # Only the creator unlinks the block, pool workers share its tracker.
+        self._shm = shared_memory.SharedMemory(name, create=self._owner, size=size)
+        self.array: "NDArray" = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf)
+
+    @classmethod
+    def from_array(cls, array: "ArrayLike") -> "SharedArray":
+        array = np.asarray(array)
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, spec: Spec) -> "SharedArray":
+        name, shape, dtype = spec
+        return cls(shape, dtype, name)
+
+    @property
+    def spec(self) -> Spec:
+        return self._shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        # Every view of `array` must be gone before the block can be closed.
+        del self.array
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self) -> ty.Self:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+class _DtypeProbe(VectorizedMachine):
+    # Runs the bytecode over one element per input array to find the dtype
+    # of the result for any values. The VectorizedMachine switches a power
+    # to float64 when an integer exponent is negative, so an exponent
+    # computed from the input arrays is taken as negative if its dtype
+    # allows it. Scalar inputs and constants are 0-d, their sign is known.
+    def __init__(self) -> None:
+        super().__init__("nan")
+
+    def power(self, left: "ArrayLike", right: "ArrayLike"):
+        if np.ndim(right) and np.issubdtype(np.asarray(right).dtype, np.signedinteger):
+            right = np.full_like(right, -1)
+        return super().power(left, right)
+
+
+class _Worker:
+    # Per-process state, built once by the pool initializer.
+    bytecode: bytes
+    machine: VectorizedMachine
+    inputs: list[SharedArray | Number]
+    output: SharedArray
+    mask: SharedArray | None
+
+
+def _init_worker(
+    bytecode: bytes,
+    inputs: list[Spec | Number],
+    output: Spec,
+    mask: Spec | None,
+    zero_division: ZeroDivision,
+):
+    _Worker.bytecode = bytecode
+    _Worker.machine = VectorizedMachine(zero_division)
+    _Worker.inputs = [
+        SharedArray.attach(spec) if isinstance(spec, tuple) else spec for spec in inputs
+    ]
+    _Worker.output = SharedArray.attach(output)
+    _Worker.mask = None if mask is None else SharedArray.attach(mask)
+
+
+def _run_chunk(bounds: tuple[int, int]) -> int:
+    start, stop = bounds
+    slots = [
+        value.array[start:stop] if isinstance(value, SharedArray) else value
+        for value in _Worker.inputs
+    ]
+    machine = _Worker.machine
+    # Refuses to write floats into an integer `out`, like a numpy ufunc.
+    np.copyto(_Worker.output.array[start:stop], machine.execute(_Worker.bytecode, slots), "same_kind")
+    if _Worker.mask is not None and machine.mask is not None:
+        _Worker.mask.array[start:stop] = machine.mask
+    return stop - start
+
+
+def evaluate(
+    bytecode: bytes,
+    slots: ty.Sequence["SharedArray | ArrayLike"],
+    *,
+    workers: int | None = None,
+    chunksize: int = 1 << 20,
+    zero_division: ZeroDivision = "raise",
+    out: SharedArray | None = None,
+    mask: SharedArray | None = None,
+) -> SharedArray:
+    # Evaluates `bytecode` over the leading axis of the input arrays with a
+    # pool of VectorizedMachine workers, each writing its slice of `out` in
+    # place. SharedArray inputs are used as is, other arrays are copied into
+    # shared memory once. Scalars are shipped with the bytecode.
+    _require_numpy()
+    if chunksize < 1:
+        raise ValueError(f"chunksize must be positive, got {chunksize}")
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if workers < 1:
+        raise ValueError(f"workers must be positive, got {workers}")
+
+    owned: list[SharedArray] = []
+    try:
+        inputs: list[SharedArray | Number] = []
+        for slot in slots:
+            if isinstance(slot, SharedArray):
+                inputs.append(slot)
+            elif np.ndim(slot) == 0:
+                inputs.append(np.asarray(slot).item())
+            else:
+                owned.append(SharedArray.from_array(slot))
+                inputs.append(owned[-1])
+        shapes = {value.array.shape for value in inputs if isinstance(value, SharedArray)}
+        if len(shapes) > 1:
+            raise ValueError(f"Input arrays must share one shape, got {sorted(shapes)}")
+        shape = shapes.pop() if shapes else ()
+        if not shape:
+            raise ValueError("Parallel evaluation needs at least one input array")
+
+        if out is None:
+            # Every chunk must come out with this dtype, whatever its values.
+            probe = [
+                np.ones(1, value.array.dtype) if isinstance(value, SharedArray) else value
+                for value in inputs
+            ]
+            dtype = _DtypeProbe().execute(bytecode, probe).dtype
+            out = SharedArray(shape, dtype)
+            owned.append(out)
+        elif out.array.shape != shape:
+            raise ValueError(f"Output shape {out.array.shape} does not match {shape}")
+
+        length = shape[0]
+        chunks = [(i, min(i + chunksize, length)) for i in range(0, length, chunksize)]
+        initargs = (
+            bytecode,
+            [value.spec if isinstance(value, SharedArray) else value for value in inputs],
+            out.spec,
+            None if mask is None else mask.spec,
+            zero_division,
+        )
+        # Empty inputs have no chunks, there is nothing to start a pool for.
+        if chunks:
+            with mp.Pool(min(workers, len(chunks)), _init_worker, initargs) as pool:
+                for _ in pool.imap_unordered(_run_chunk, chunks):
+                    ...
+    except BaseException:
+        for shared in owned:
+            shared.close()
+        raise
+    for shared in owned:
+        if shared is not out:
+            shared.close()
+    return out
@@ -1,85 +1,116 @@
 from .token import Token, TokenType
 from .exc import ParserError
 from . import nodes
+import typing as ty
+
+
+class Infix(ty.NamedTuple):
+    power: int
+    node: ty.Callable[[nodes.Expression, Token, nodes.Expression], nodes.Expression]
+    associativity: ty.Literal["left", "right"] = "left"
+
+
+class Prefix(ty.NamedTuple):
+    power: int
+    node: ty.Callable[[Token, nodes.Expression], nodes.Expression]
+
+
+# Binding powers, higher binds tighter. An operand of a left associative
+# operator binds one level tighter than the operator itself, so `-` below
+# `+` reads `1 - 2 + 3` as `1 - (2 + 3)`. Prefix signs bind between `/`
+# and `^`, and are only allowed where an operand of their power may go,
+# which keeps `-2 ^ 2` negative and rejects `2 ^ -1`.
+_INFIX: dict[TokenType, Infix] = {
+    TokenType.MINUS: Infix(1, nodes.Minus),
+    TokenType.PLUS: Infix(2, nodes.Plus),
+    TokenType.STAR: Infix(3, nodes.Star),
+    TokenType.SLASH: Infix(4, nodes.Slash),
+    TokenType.POWER: Infix(6, nodes.Power),
+}
+_PREFIX: dict[TokenType, Prefix] = {
+    TokenType.MINUS: Prefix(5, nodes.UMinus),
+    TokenType.PLUS: Prefix(5, nodes.UPlus),
+}
 
 
 class Parser:
-    def __init__(self, tokens: list[Token] | None = None) -> None:
-        self._tokens = tokens or []
-        self._current = 0
+    # Pulls tokens one at a time, so a Lexer.stream can be parsed without
+    # collecting its tokens first. Only the current token is held.
+    def __init__(self, tokens: ty.Iterable[Token] | None = None) -> None:
+        self._tokens = iter(tokens or ())
+        self._current = self._next(Token(TokenType.EOF, "", 0))
+
+    def _next(self, previous: Token) -> Token:
+        # A source that ends without EOF ends right after its last token.
+        end = previous.column + len(previous.lexeme)
+        return next(self._tokens, None) or Token(TokenType.EOF, "", end)
 
     def peek(self) -> Token:
-        return self._tokens[self._current]
+        return self._current
 
     def peektype(self) -> TokenType:
         return self.peek().type
 
-    def expression(self) -> nodes.Expression:
-        return self.minus()
-
-    def minus(self):
-        left = self.plus()
-        while self.peektype() == TokenType.MINUS:
-            operator = self.advance()
-            left = nodes.Minus(left, operator, self.plus())
-        return left
-
-    def plus(self):
-        left = self.star()
-        while self.peektype() == TokenType.PLUS:
-            operator = self.advance()
-            left = nodes.Plus(left, operator, self.star())
-        return left
-
-    def star(self):
-        left = self.slash()
-        while self.peektype() == TokenType.STAR:
-            operator = self.advance()
-            left = nodes.Star(left, operator, self.slash())
-        return left
-
-    def slash(self):
-        left = self.unary()
-        while self.peektype() == TokenType.SLASH:
-            operator = self.advance()
-            left = nodes.Slash(left, operator, self.unary())
-        return left
-
-    def unary(self):
-        if self.peektype() in (TokenType.PLUS, TokenType.MINUS):
-            operator = self.advance()
-            right = self.unary()
-            if operator.type == TokenType.PLUS:
-                return nodes.UPlus(operator, right)
-            return nodes.UMinus(operator, right)
-        return self.power()
-
-    def power(self):
-        left = self.group()
-        while self.peektype() == TokenType.POWER:
-            operator = self.advance()
-            left = nodes.Power(left, operator, self.group())
-        return left
-
-    def group(self):
-        if self.peektype() == TokenType.LEFT:
-            operator = self.advance()
+    def expression(self, power: int = 0) -> nodes.Expression:
+        # Parses the longest expression whose operators bind at least as
+        # tightly as `power`. Operators and groups waiting for their right
+        # operand go on a stack instead of the interpreter stack, as
+        # (operator, token, left operand, power to go on with), so the
+        # nesting depth is only bounded by memory.
+        waiting: list[tuple[Infix | Prefix | None, Token, ty.Any, int]] = []
+        while True:
+            token = self._current
+            prefix = _PREFIX.get(token.type)
+            if prefix is not None and prefix.power >= power:
+                waiting.append((prefix, self.advance(), None, power))
+                power = prefix.power
+                continue
+            if token.type == TokenType.LEFT:
+                waiting.append((None, self.advance(), None, power))
+                power = 0
+                continue
+            left = self.primary()
+            while (infix := _INFIX.get(self._current.type)) is None or infix.power < power:
+                if not waiting:
+                    return left
+                operator, token, operand, power = waiting.pop()
+                if operator is None:
+                    self.consume(
+                        TokenType.RIGHT,
+                        f"Group expression was never closed at column {token.column}",
+                    )
+                    left = self._group(token, left)
+                elif isinstance(operator, Prefix):
+                    left = self._unary(operator, token, left)
+                else:
+                    left = self._binary(operator, operand, token, left)
+            waiting.append((infix, self.advance(), left, power))
+            power = infix.power + (infix.associativity == "left")
+
+    def _unary(self, prefix: Prefix, token: Token, right: ty.Any) -> nodes.Expression:
+        return prefix.node(token, right)
+
+    def _binary(self, infix: Infix, left: ty.Any, token: Token, right: ty.Any) -> nodes.Expression:
+        return infix.node(left, token, right)
+
+    def _group(self, token: Token, middle: ty.Any) -> nodes.Expression:
+        return nodes.Group(token, middle)
+
+    def primary(self) -> nodes.Expression:
+        token = self._current
+        if token.type == TokenType.NUMBER:
+            return nodes.Number(self.advance())
+        if token.type == TokenType.IDENTIFIER:
+            return nodes.Variable(self.advance())
+        if token.type == TokenType.LEFT:
+            self.advance()
             middle = self.expression()
             self.consume(
                 TokenType.RIGHT,
-                f"Group expression was never closed at column {operator.column}",
+                f"Group expression was never closed at column {token.column}",
             )
-            return nodes.Group(operator, middle)
-        return self.number()
-
-    def number(self):
-        token = self.consume(TokenType.NUMBER, f"Expected a number, got {self.peek()}")
-        if self.peektype() == TokenType.DOT:
-            token.lexeme += self.advance().lexeme
-            token.lexeme += self.consume(
-                TokenType.NUMBER, f"Expected a number after the dot at {token.column}"
-            ).lexeme
-        return nodes.Number(token)
+            return self._group(token, middle)
+        raise ParserError(f"Expected a number, got {token}")
 
     reset = __init__
 
@@ -87,8 +118,9 @@ class Parser:
         return self.peektype() == TokenType.EOF
 
     def advance(self):
-        consumed = self.peek()
-        self._current += 1
+        consumed = self._current
+        if consumed.type != TokenType.EOF:
+            self._current = self._next(consumed)
         return consumed
 
     def consume(self, type: TokenType, message: str):
@@ -96,6 +128,6 @@ class Parser:
             raise ParserError(message)
         return self.advance()
 
-    def parse(self, tokens: list[Token] | None = None):
+    def parse(self, tokens: ty.Iterable[Token] | None = None):
         self.reset(tokens)
         return self.expression()
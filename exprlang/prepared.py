@@ -0,0 +1,51 @@
+from .exc import UnboundVariable
+import typing as ty
+
+Number = float | int
+_UNBOUND: ty.Final = object()
+
+
+class PreparedExpression:
+    # Compiled once, called many times with different variable bindings.
+    __slots__ = ("source", "bytecode", "variables", "_run")
+
+    def __init__(
+        self,
+        source: str,
+        bytecode: bytes | None,
+        variables: tuple[str, ...],
+        run: ty.Callable[[ty.Sequence[Number]], Number | None],
+    ) -> None:
+        self.source = source
+        self.bytecode = bytecode
+        self.variables = variables
+        self._run = run
+
+    def bind(self, *args: Number, **kwargs: Number) -> list[Number]:
+        # Lay the bindings out in slot order, as expected by LOAD_VAR.
+        variables = self.variables
+        if len(args) > len(variables):
+            raise TypeError(
+                f"{self.source!r} takes {len(variables)} variables, got {len(args)}"
+            )
+        slots: list[ty.Any] = [*args, *(_UNBOUND,) * (len(variables) - len(args))]
+        for name, value in kwargs.items():
+            try:
+                slot = variables.index(name)
+            except ValueError:
+                raise TypeError(f"{self.source!r} has no variable {name!r}") from None
+            if slot < len(args):
+                raise TypeError(f"Variable {name!r} bound twice")
+            slots[slot] = value
+        for name, value in zip(variables, slots):
+            if value is _UNBOUND:
+                raise UnboundVariable(f"Variable {name!r} is not bound")
+        return slots
+
+    def __call__(self, *args: Number, **kwargs: Number):
+        if kwargs or len(args) != len(self.variables):
+            args = tuple(self.bind(*args, **kwargs))
+        return self._run(args)
+
+    def __repr__(self) -> str:
+        return f"PreparedExpression({self.source!r}, variables={self.variables})"
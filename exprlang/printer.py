@@ -1,7 +1,8 @@
-from .instructions import Instruction
+from .instructions import Instruction, decode_operand
 from .exc import UnknownInstruction
 from collections import defaultdict
-from . import nodes
+from . import constants, nodes
+import typing as ty
 
 
 class ByteCodePrinter:
@@ -23,13 +24,12 @@ class ByteCodePrinter:
         self._current += 1
         return consumed
 
+    def operand(self) -> int:
+        value, self._current = decode_operand(self._bytecode, self._current)
+        return value
+
     def _load_constants(self):
-        while self.peek() != Instruction.EOS:
-            buffer = [chr(self.advance()) for _ in range(self.advance())]
-            lexeme = "".join(buffer)
-            type = float if "." in lexeme else int
-            self._constants.append(type(lexeme))
-        self.advance()
+        self._constants, self._current = constants.decode_pool(self._bytecode)
         self.push(f"CONSTANTS {self._constants}")
 
     def _execute(self):
@@ -41,6 +41,11 @@ class ByteCodePrinter:
                 case Instruction.MULTIPLY:   self.multiply()
                 case Instruction.SUBTRACT:   self.subtract()
                 case Instruction.LOAD_CONST: self.load_const()
+                case Instruction.LOAD_VAR:   self.load_var()
+                case Instruction.NEGATE:     self.negate()
+                case Instruction.DUP:        self.dup()
+                case Instruction.STORE_TEMP: self.store_temp()
+                case Instruction.LOAD_TEMP:  self.load_temp()
                 case unknown: raise UnknownInstruction(unknown)
         self.advance()
 
@@ -66,10 +71,33 @@ class ByteCodePrinter:
 
     def load_const(self):
         self.advance()
-        location = self.advance()
+        location = self.operand()
         constant = self._constants[location]
         self.push(f"LOAD_CONST {location} [{constant}]")
 
+    def load_var(self):
+        self.advance()
+        slot = self.operand()
+        self.push(f"LOAD_VAR {slot}")
+
+    def negate(self):
+        self.advance()
+        self.push("NEGATE")
+
+    def dup(self):
+        self.advance()
+        self.push("DUP")
+
+    def store_temp(self):
+        self.advance()
+        temp = self.operand()
+        self.push(f"STORE_TEMP {temp}")
+
+    def load_temp(self):
+        self.advance()
+        temp = self.operand()
+        self.push(f"LOAD_TEMP {temp}")
+
     def join(self, indent: str) -> str:
         before = lambda i: indent + i
         indented = map(before, self._instructions)
@@ -86,7 +114,15 @@ class ByteCodePrinter:
         print(instructions)
 
 
-class ASTPrinter(nodes.Visitor[None]):
+# Markers ASTPrinter.join leaves on its stack between the nodes.
+_ADVANCE = object()
+_UP = object()
+
+
+class ASTPrinter:
+    # Draws the tree top down, one line per level. Walked with an explicit
+    # stack, the markers between nodes stand for the column and line moves
+    # a recursive walk would make after returning from a child.
     def __init__(self) -> None:
         self._lines: dict[int, str] = defaultdict(lambda: "")
         self._column: int = 0
@@ -99,61 +135,46 @@ class ASTPrinter(nodes.Visitor[None]):
     def advance(self, size: int = 1):
         self._column += size
 
-    def accept_number(self, expr: nodes.Number):
-        number = self.indent + expr.token.lexeme
-        self.advance(len(expr.token.lexeme))
-        self.addline(number)
+    def _accept_leaf(self, lexeme: str):
+        leaf = self.indent + lexeme
+        self.advance(len(lexeme))
+        self.addline(leaf)
 
     def addline(self, string: str):
         current = self._lines[self._line]
         current += string[len(current) :]
         self._lines[self._line] = current
 
-    def _accept_binary(self, expr: nodes.Binary):
-        head = self.indent + expr.operator.lexeme
+    def _accept_operator(self, expr: nodes.Binary | nodes.Unary):
+        head = self.indent + expr.lexeme
         self.addline(head)
         self._line += 1
-        expr.left.accept(self)
-        self.advance()
-        expr.right.accept(self)
-        self._line -= 1
-
-    def _accept_unary(self, expr: nodes.Unary):
-        head = self.indent + expr.operator.lexeme
-        self.addline(head)
-        self._line += 1
-        expr.right.accept(self)
-        self._line -= 1
-
-    def accept_plus(self, expr: nodes.Plus):
-        return self._accept_binary(expr)
-
-    def accept_minus(self, expr: nodes.Minus):
-        return self._accept_binary(expr)
-
-    def accept_power(self, expr: nodes.Power):
-        return self._accept_binary(expr)
-
-    def accept_slash(self, expr: nodes.Slash):
-        return self._accept_binary(expr)
-
-    def accept_star(self, expr: nodes.Star):
-        return self._accept_binary(expr)
-
-    def accept_group(self, expr: nodes.Group):
-        return expr.right.accept(self)
-
-    def accept_uminus(self, expr: nodes.UMinus):
-        return self._accept_unary(expr)
-
-    def accept_uplus(self, expr: nodes.UPlus):
-        return self._accept_unary(expr)
 
     reset = __init__
 
     def join(self, root: nodes.Expression):
         self.reset()
-        root.accept(self)
+        pending: list[ty.Any] = [root]
+        while pending:
+            expr = pending.pop()
+            if expr is _ADVANCE:
+                self.advance()
+            elif expr is _UP:
+                self._line -= 1
+            elif isinstance(expr, (nodes.Number, nodes.Variable)):
+                self._accept_leaf(expr.lexeme)
+            elif isinstance(expr, nodes.Group):
+                pending.append(expr.right)
+            elif isinstance(expr, nodes.Unary):
+                self._accept_operator(expr)
+                pending.append(_UP)
+                pending.append(expr.right)
+            else:
+                self._accept_operator(expr)
+                pending.append(_UP)
+                pending.append(expr.right)
+                pending.append(_ADVANCE)
+                pending.append(expr.left)
         lines = (self._lines[l] for l in sorted(self._lines))
         return "\n".join(lines)
 
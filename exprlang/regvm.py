@@ -0,0 +1,270 @@
+from .compiler import CommonSubtrees, ConstantFolder, _pool_key
+from .instructions import Instruction
+from .exc import UnboundVariable
+from . import nodes
+import typing as ty
+import operator
+import heapq
+
+Number = float | int
+BinaryOp = ty.Callable[[ty.Any, ty.Any], ty.Any]
+# While compiling, registers are (bank, index) pairs. Banks are laid out
+# one after the other in the register file once the sizes are known.
+Operand = tuple[int, int]
+_TEMP, _CONST, _VAR = range(3)
+
+_OPCODES: dict[type, Instruction] = {
+    nodes.Plus: Instruction.ADD,
+    nodes.Minus: Instruction.SUBTRACT,
+    nodes.Star: Instruction.MULTIPLY,
+    nodes.Slash: Instruction.DIVIDE,
+    nodes.Power: Instruction.POWER,
+}
+_FUNCTIONS: dict[Instruction, BinaryOp] = {
+    Instruction.ADD: operator.add,
+    Instruction.SUBTRACT: operator.sub,
+    # NEGATE runs as a multiplication by -1, which is exact for ints and
+    # floats, zeros keep their sign, and spares the loop a unary case.
+    Instruction.NEGATE: operator.mul,
+    Instruction.MULTIPLY: operator.mul,
+    Instruction.POWER: operator.pow,
+}
+
+
+def _divide(column: int) -> BinaryOp:
+    def divide(left: ty.Any, right: ty.Any):
+        if right == 0:
+            raise ZeroDivisionError(f"Zero division error '{left} / 0' at column {column}")
+        return left / right
+
+    return divide
+
+
+class RegisterProgram:
+    # Three-address code over one flat register file: temporaries, then the
+    # constants, then the variable slots. Every instruction is a
+    # (function, destination, left, right) tuple of register numbers, and
+    # leaves cost nothing at run time, they are already in their register.
+    # `instructions` keeps the (opcode, destination, left, right) form for
+    # listings. Running only touches locals, like LoadedProgram.
+    __slots__ = ("constants", "instructions", "code", "variables", "temps", "result", "_frame")
+
+    def __init__(
+        self,
+        constants: tuple[Number, ...],
+        instructions: tuple[tuple[Instruction, int, int, int], ...],
+        code: tuple[tuple[BinaryOp, int, int, int], ...],
+        variables: int,
+        temps: int,
+        result: int,
+    ) -> None:
+        self.constants = constants
+        self.instructions = instructions
+        self.code = code
+        self.variables = variables  # Number of slots the program reads.
+        self.temps = temps
+        self.result = result
+        self._frame = (None,) * temps + constants
+
+    def run(self, slots: ty.Sequence[float | int] = ()):
+        if len(slots) < self.variables:
+            raise UnboundVariable(f"Expected {self.variables} slots, got {len(slots)}")
+        registers: list[ty.Any] = [*self._frame, *slots]
+        for function, destination, left, right in self.code:
+            registers[destination] = function(registers[left], registers[right])
+        return registers[self.result]
+
+    def listing(self) -> list[str]:
+        base = self.temps
+        lines = [f"CONSTANTS {[f'r{base + i} = {value}' for i, value in enumerate(self.constants)]}"]
+        base += len(self.constants)
+        lines.append(f"VARIABLES {[f'r{base + slot}' for slot in range(self.variables)]}")
+        for op, destination, left, right in self.instructions:
+            if op == Instruction.NEGATE:
+                lines.append(f"NEGATE r{destination}, r{left}")
+            else:
+                lines.append(f"{op.name} r{destination}, r{left}, r{right}")
+        lines.append(f"RETURN r{self.result}")
+        return lines
+
+
+class RegisterCompiler(nodes.Visitor[Operand]):
+    # Compiles the AST to a RegisterProgram. Each visit returns the register
+    # holding the value of the node. A temporary is freed as soon as the
+    # instruction reading it is emitted, and the lowest free one is reused
+    # next, so a tree needs about as many temporaries as it is deep.
+    # Constants are folded and interned like in the Compiler, and repeated
+    # subtrees keep their register instead of being computed again. Trees
+    # nested deeper than the interpreter stack allows go through _walk.
+    def __init__(self, fold: bool = True, cse: bool = True) -> None:
+        self._constants: list[Number] = []
+        self._interned: dict[tuple[type, ty.Any], int] = {}
+        self._slots: dict[str, int] = {}
+        self._folded: dict[int, Number] = {}
+        self._shared: dict[int, int] = {}
+        # Registers of the repeated subtrees computed so far, by number.
+        # They are kept until the end, the repeats may come any time.
+        self._saved: dict[int, Operand] = {}
+        self._kept: set[Operand] = set()
+        self._free: list[int] = []
+        self._temps = 0
+        self._code: list[tuple[Instruction, Operand, Operand, Operand, int]] = []
+        self.fold = fold
+        self.cse = cse
+
+    @property
+    def variables(self) -> tuple[str, ...]:
+        # Variable names of the last compiled program, in slot order.
+        return tuple(self._slots)
+
+    reset = __init__
+
+    def constant(self, value: Number) -> Operand:
+        location = self._interned.setdefault(_pool_key(value), len(self._constants))
+        if location == len(self._constants):
+            self._constants.append(value)
+        return (_CONST, location)
+
+    def allocate(self) -> Operand:
+        if self._free:
+            return (_TEMP, heapq.heappop(self._free))
+        self._temps += 1
+        return (_TEMP, self._temps - 1)
+
+    def release(self, operand: Operand):
+        if operand[0] == _TEMP and operand not in self._kept:
+            heapq.heappush(self._free, operand[1])
+
+    def instruction(self, op: Instruction, left: Operand, right: Operand, column: int) -> Operand:
+        # Operands are read before the destination is written, so the
+        # destination may be one of them.
+        self.release(left)
+        self.release(right)
+        destination = self.allocate()
+        self._code.append((op, destination, left, right, column))
+        return destination
+
+    def emit(self, expr: nodes.Expression) -> Operand:
+        value = self._folded.get(id(expr))
+        if value is not None:
+            return self.constant(value)
+        shared = self._shared.get(id(expr))
+        if shared is None:
+            return expr.accept(self)
+        operand = self._saved.get(shared)
+        if operand is None:
+            operand = self._saved[shared] = expr.accept(self)
+            self._kept.add(operand)
+        return operand
+
+    def _binary(self, expr: nodes.Binary) -> Operand:
+        left = self.emit(expr.left)
+        right = self.emit(expr.right)
+        return self.instruction(_OPCODES[type(expr)], left, right, expr.column)
+
+    def accept_number(self, expr: nodes.Number) -> Operand:
+        return self.constant(expr.value)
+
+    def accept_variable(self, expr: nodes.Variable) -> Operand:
+        return (_VAR, self._slots.setdefault(expr.name, len(self._slots)))
+
+    def accept_group(self, expr: nodes.Group) -> Operand:
+        return self.emit(expr.right)
+
+    def accept_uplus(self, expr: nodes.UPlus) -> Operand:
+        return self.emit(expr.right)
+
+    def accept_uminus(self, expr: nodes.UMinus) -> Operand:
+        right = self.emit(expr.right)
+        return self.instruction(Instruction.NEGATE, right, self.constant(-1), expr.column)
+
+    def accept_plus(self, expr: nodes.Plus) -> Operand:
+        return self._binary(expr)
+
+    def accept_minus(self, expr: nodes.Minus) -> Operand:
+        return self._binary(expr)
+
+    def accept_star(self, expr: nodes.Star) -> Operand:
+        return self._binary(expr)
+
+    def accept_slash(self, expr: nodes.Slash) -> Operand:
+        return self._binary(expr)
+
+    def accept_power(self, expr: nodes.Power) -> Operand:
+        return self._binary(expr)
+
+    def _walk(self, root: nodes.Expression) -> Operand:
+        # Post-order with an explicit stack. A node goes back on `pending`
+        # as a (node,) marker below its operands and is emitted from the
+        # registers left on `operands` once they have been.
+        operands: list[Operand] = []
+        pending: list[ty.Any] = [root]
+        while pending:
+            expr = pending.pop()
+            kind = type(expr)
+            if kind is tuple:
+                expr = expr[0]
+                kind = type(expr)
+                right = operands.pop()
+                if kind is nodes.UMinus:
+                    right = self.instruction(Instruction.NEGATE, right, self.constant(-1), expr.column)
+                elif kind is not nodes.UPlus:
+                    left = operands.pop()
+                    right = self.instruction(_OPCODES[kind], left, right, expr.column)
+                shared = self._shared.get(id(expr))
+                if shared is not None:
+                    self._saved[shared] = right
+                    self._kept.add(right)
+                operands.append(right)
+                continue
+            value = self._folded.get(id(expr))
+            if value is not None:
+                operands.append(self.constant(value))
+                continue
+            saved = self._saved.get(self._shared.get(id(expr), -1))
+            if saved is not None:
+                operands.append(saved)
+            elif kind is nodes.Number or kind is nodes.Variable:
+                operands.append(expr.accept(self))
+            elif kind is nodes.Group:
+                pending.append(expr.right)
+            else:
+                pending.append((expr,))
+                pending.append(expr.right)
+                if isinstance(expr, nodes.Binary):
+                    pending.append(expr.left)
+        return operands.pop()
+
+    def compile(self, root: nodes.Expression) -> RegisterProgram:
+        self.reset(self.fold, self.cse)
+        if self.fold:
+            self._folded = ConstantFolder().fold(root)
+        if self.cse:
+            self._shared = CommonSubtrees().find(root, self._folded)
+        try:
+            result = self.emit(root)
+        except RecursionError:
+            folded, shared = self._folded, self._shared
+            self.reset(self.fold, self.cse)
+            self._folded, self._shared = folded, shared
+            result = self._walk(root)
+        return self.finish(result)
+
+    def finish(self, result: Operand) -> RegisterProgram:
+        bases = (0, self._temps, self._temps + len(self._constants))
+        register = lambda operand: bases[operand[0]] + operand[1]
+        instructions = []
+        code: list[tuple[BinaryOp, int, int, int]] = []
+        for op, destination, left, right, column in self._code:
+            line = (op, register(destination), register(left), register(right))
+            instructions.append(line)
+            function = _divide(column) if op == Instruction.DIVIDE else _FUNCTIONS[op]
+            code.append((function, *line[1:]))
+        return RegisterProgram(
+            tuple(self._constants),
+            tuple(instructions),
+            tuple(code),
+            len(self._slots),
+            self._temps,
+            register(result),
+        )
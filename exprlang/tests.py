@@ -1,11 +1,14 @@
 from .instructions import Instruction
+from .exc import InvalidByteCode, LexerError, ParserError, UnboundVariable, UnknownInstruction
 from .token import Token, TokenType
 from .evaluator import Evaluator
 from .compiler import Compiler
 from .vm import VirtualMachine
+from .main import ExprEvaluator
+from .cache import CompileCache
 from .parser import Parser
 from .lexer import Lexer
-from . import nodes
+from . import constants, nodes
 import typing
 
 EXPRESSIONS: typing.Final[list[tuple[str, float | int]]] = [
@@ -51,6 +54,64 @@ def test_lexer():
     assert correct == tokens
 
 
+def test_lexer_numbers():
+    lexer = Lexer()
+    tokens = lexer.scan("  3.25*x1 ^ 10  ")
+    assert tokens == [
+        Token(TokenType.NUMBER, "3.25", 2),
+        Token(TokenType.STAR, "*", 6),
+        Token(TokenType.IDENTIFIER, "x1", 7),
+        Token(TokenType.POWER, "^", 10),
+        Token(TokenType.NUMBER, "10", 12),
+        Token(TokenType.EOF, "", 16),
+    ]
+    assert tokens[0].value == 3.25 and tokens[4].value == 10
+    assert type(tokens[4].value) is int
+    for expr in ["(1 . 5)", "(1.)", ".5"]:
+        try:
+            Parser().parse(lexer.scan(expr))
+        except ParserError:
+            pass
+        else:
+            raise AssertionError(f"Expected ParserError for {expr!r}")
+    try:
+        lexer.scan("1 +\t2")
+    except LexerError as e:
+        assert str(e) == "Unexpected character: '\\t' in column 3"
+    else:
+        raise AssertionError("Expected LexerError")
+
+
+def test_lexer_stream():
+    import tempfile, mmap, io
+
+    expr = " 12.5 * rate_2 -(3.25 / 100 ^ x)  "
+    lexer = Lexer()
+    correct = [*lexer.scan(expr)]
+    data = expr.encode()
+    with tempfile.TemporaryFile() as file:
+        file.write(data)
+        file.flush()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            assert list(lexer.stream(mapped)) == correct
+    for source in [expr, data, bytearray(data), memoryview(data)]:
+        assert list(lexer.stream(source)) == correct
+    for chunksize in [1, 2, 3, 5, 64]:
+        for file in [io.StringIO(expr), io.BytesIO(data)]:
+            tokens = list(lexer.stream(file, chunksize))
+            assert tokens == correct and tokens[0].value == 12.5
+    stream = lexer.stream(io.BytesIO(data), 4)
+    assert next(stream) == correct[0]
+    ast = Parser().parse(lexer.stream(io.BytesIO(data), 3))
+    assert ast == Parser().parse(correct)
+    try:
+        list(lexer.stream(io.BytesIO(b"1 + \xff"), 2))
+    except LexerError as e:
+        assert str(e) == "Unexpected character: '\xff' in column 4"
+    else:
+        raise AssertionError("Expected LexerError")
+
+
 def test_parser():
     tokens = [
         Token(TokenType.NUMBER, "50", 0),
@@ -90,6 +151,30 @@ def test_parser():
     assert root == ast
 
 
+def test_parser_precedence():
+    lexer, parser, evaluator = Lexer(), Parser(), Evaluator()
+    for expr, ans in [
+        ("2 ^ 3 ^ 2", 64),
+        ("-2 ^ 2", -4),
+        ("1 - 2 + 3", -4),
+        ("8 / 2 / 2", 2),
+        ("2 * -3 ^ 2", -18),
+        ("-(1 - 3) * 2", 4),
+    ]:
+        assert evaluator.eval(parser.parse(lexer.scan(expr))) == ans
+    for expr, message in [
+        ("2 ^ -1", "Expected a number, got Token(minus, '-', 4)"),
+        ("2 * * 3", "Expected a number, got Token(star, '*', 4)"),
+        ("(1 + 2", "Group expression was never closed at column 0"),
+    ]:
+        try:
+            parser.parse(lexer.scan(expr))
+        except ParserError as e:
+            assert str(e) == message
+        else:
+            raise AssertionError(f"Expected ParserError for {expr!r}")
+
+
 def test_evaluator():
     deps = Lexer(), Parser()
 
@@ -109,26 +194,17 @@ def test_compiler():
     def _genast(expr: str) -> nodes.Expression:
         return deps[1].parse(deps[0].scan(expr))
 
-    def _genconst(const: str):
-        return [len(const), *map(ord, const)]
-
-    consts = []
-    for const in map(_genconst, ("0", "50", "90", "7", "23", "8", "6")):
-        consts.extend(const)
-    consts.append(Instruction.EOS)
+    consts = [*constants.encode_pool([50, 90, 7, 23, 8, 6])]
 
     program = [
-        Instruction.LOAD_CONST, 1,
         Instruction.LOAD_CONST, 0,
+        Instruction.LOAD_CONST, 1,
         Instruction.LOAD_CONST, 2,
-        Instruction.ADD,
-        Instruction.LOAD_CONST, 3,
         Instruction.DIVIDE,
+        Instruction.LOAD_CONST, 3,
         Instruction.LOAD_CONST, 4,
         Instruction.LOAD_CONST, 5,
-        Instruction.LOAD_CONST, 0,
-        Instruction.LOAD_CONST, 6,
-        Instruction.SUBTRACT,
+        Instruction.NEGATE,
         Instruction.ADD,
         Instruction.POWER,
         Instruction.MULTIPLY,
@@ -137,24 +213,192 @@ def test_compiler():
     ]
 
     bytecode = bytes(consts + program)
-    compiler = Compiler()
+    compiler = Compiler(fold=False, peephole=False)
     ast = _genast(expr)
     gen_bytecode = compiler.compile(ast)
     assert gen_bytecode == bytecode
 
+    # The peephole pass loads -6 instead, 6 is no longer pooled.
+    consts = [*constants.encode_pool([50, 90, 7, 23, 8, -6])]
+    program = [
+        Instruction.LOAD_CONST, 0,
+        Instruction.LOAD_CONST, 1,
+        Instruction.LOAD_CONST, 2,
+        Instruction.DIVIDE,
+        Instruction.LOAD_CONST, 3,
+        Instruction.LOAD_CONST, 4,
+        Instruction.LOAD_CONST, 5,
+        Instruction.ADD,
+        Instruction.POWER,
+        Instruction.MULTIPLY,
+        Instruction.SUBTRACT,
+        Instruction.EOS,
+    ]
+    assert Compiler(fold=False).compile(ast) == bytes(consts + program)
+
 
-def test_virtual_machine():
+def test_constant_folding():
     deps = Lexer(), Parser()
 
     def _genast(expr: str) -> nodes.Expression:
         return deps[1].parse(deps[0].scan(expr))
 
-    vm = VirtualMachine()
+    evaluator = Evaluator()
     compiler = Compiler()
-    for expr, ans in EXPRESSIONS:
+    for expr, _ in EXPRESSIONS:
         ast = _genast(expr)
-        bytecode = compiler.compile(ast)
-        assert vm.execute(bytecode) == ans
+        answer = evaluator.eval(ast)
+        consts = [*constants.encode_pool([answer])]
+        program = [Instruction.LOAD_CONST, 0, Instruction.EOS]
+        assert compiler.compile(ast) == bytes(consts + program)
+        assert type(VirtualMachine().execute(compiler.compile(ast))) is type(answer)
+
+    bytecode = compiler.compile(_genast("x * (2 + 3) - 4 / 2"))
+    consts = [*constants.encode_pool([5, 2.0])]
+    program = [
+        Instruction.LOAD_VAR, 0,
+        Instruction.LOAD_CONST, 0,
+        Instruction.MULTIPLY,
+        Instruction.LOAD_CONST, 1,
+        Instruction.SUBTRACT,
+        Instruction.EOS,
+    ]
+    assert bytecode == bytes(consts + program)
+
+    try:
+        compiler.compile(_genast("x + 1 / (3 - 3)"))
+    except ZeroDivisionError as e:
+        assert str(e) == "Zero division error '1 / 0' at column 6"
+    else:
+        raise AssertionError("Expected ZeroDivisionError")
+
+
+def test_constant_pool():
+    values = [0, -1, 255, -(2**64), 11111111**2, 0.5, float("inf"), -0.0, 1e300]
+    pool = constants.encode_pool(values)
+    assert pool[:2] == bytes((constants.VERSION, len(values)))
+    assert constants.decode_pool(pool + b"rest") == (values, len(pool))
+    assert [type(value) for value in constants.decode_pool(pool)[0]] == list(
+        map(type, values)
+    )
+    try:
+        constants.decode_pool(bytes((0xFF, 0)))
+    except InvalidByteCode:
+        pass
+    else:
+        raise AssertionError("Expected InvalidByteCode")
+
+
+def test_constant_interning():
+    compiler = Compiler(fold=False)
+    ones = Parser().parse(Lexer().scan(" + ".join(["1"] * 10_000)))
+    bytecode = compiler.compile(ones)
+    assert constants.decode_pool(bytecode)[0] == [1]
+    assert VirtualMachine().execute(bytecode) == 10_000
+
+    tree = Parser().parse(Lexer().scan("-1 + 1.0 - 0 + 0.0 * 1.0 - 1 + -(0.0) + 10^400 * 0.0"))
+    pool = constants.decode_pool(compiler.compile(tree))[0]
+    assert [repr(value) for value in pool] == ["-1", "1.0", "0", "0.0", "1", "-0.0", "10", "400"]
+    # Folding gives -0.0 too, which must not be mistaken for 0.0.
+    bytecode = Compiler().compile(Parser().parse(Lexer().scan("-(0.0) + x - 0.0")))
+    pool = constants.decode_pool(bytecode)[0]
+    assert [repr(value) for value in pool] == ["-0.0", "0.0"]
+
+
+def test_peephole():
+    from .compiler import Peephole
+    from .vm import LoadedProgram
+
+    lexer, parser, evaluator = Lexer(), Parser(), Evaluator()
+    plain, optimized = Compiler(fold=False, peephole=False), Compiler(fold=False)
+    # -0.0 + 0 is 0.0 but -0.0 - 0 is -0.0, so `a + -b` stays as it is.
+    for expr, before, after in [
+        ("----3", 5, 1),
+        ("--a", 3, 1),
+        ("+++a", 1, 1),
+        ("-3 * a", 4, 3),
+        ("a - -b", 4, 4),
+        ("a + -b", 4, 4),
+        ("-(-a + --b)", 7, 5),
+        ("-b", 2, 2),
+    ]:
+        tree = parser.parse(lexer.scan(expr))
+        for variables in ({"a": 2, "b": 0.0}, {"a": -0.0, "b": 0}, {"a": 0, "b": -0.0}):
+            answer = evaluator.eval(tree, variables)
+            for compiler, count in ((plain, before), (optimized, after)):
+                bytecode = compiler.compile(tree)
+                slots = [variables[name] for name in compiler.variables]
+                assert len(LoadedProgram(bytecode).code) == count
+                assert repr(VirtualMachine().execute(bytecode, slots)) == repr(answer)
+    for expr, ans in EXPRESSIONS:
+        tree = parser.parse(lexer.scan(expr))
+        bytecode = optimized.compile(tree)
+        assert len(bytecode) <= len(plain.compile(tree))
+        assert VirtualMachine().execute(bytecode) == ans
+        assert Peephole().optimize(bytecode) == bytecode
+
+    pool = constants.encode_pool([])
+    try:
+        Peephole().optimize(pool + bytes([0xFE, Instruction.EOS]))
+    except UnknownInstruction:
+        pass
+    else:
+        raise AssertionError("Expected UnknownInstruction")
+
+
+def test_wide_operands():
+    from .instructions import encode_operand, decode_operand
+
+    for value in (0, 1, 127, 128, 255, 256, 300, 16383, 16384, 2**40):
+        encoded = encode_operand(value)
+        assert decode_operand(b"x" + encoded + b"y", 1) == (value, len(encoded) + 1)
+
+    expreval = ExprEvaluator()
+    terms = " + ".join(f"{i} * x" for i in range(1, 301))
+    prepared = expreval.prepare(terms)
+    assert prepared(2) == sum(range(1, 301)) * 2
+
+    names = [f"v{i}" for i in range(300)]
+    prepared = expreval.prepare(" - ".join(names))
+    assert prepared(*range(300)) == -sum(range(1, 300))
+
+    digits = "1" * 400
+    assert expreval.eval(f"{digits} ^ 2") == int(digits) ** 2
+    assert VirtualMachine().execute(Compiler(fold=False).compile(
+        Parser().parse(Lexer().scan(f"{digits} ^ 2"))
+    )) == int(digits) ** 2
+
+
+def test_virtual_machine():
+    deps = Lexer(), Parser()
+
+    def _genast(expr: str) -> nodes.Expression:
+        return deps[1].parse(deps[0].scan(expr))
+
+    vm = VirtualMachine()
+    for compiler in (Compiler(), Compiler(fold=False)):
+        for expr, ans in EXPRESSIONS:
+            ast = _genast(expr)
+            bytecode = compiler.compile(ast)
+            assert vm.execute(bytecode) == ans
+
+
+def test_virtual_machine_errors():
+    vm = VirtualMachine()
+    pool = constants.encode_pool([0, 1])
+    for program, error in [
+        ([Instruction.LOAD_CONST, 1, 0xFE, Instruction.EOS], UnknownInstruction),
+        ([Instruction.LOAD_VAR, 3, Instruction.EOS], UnboundVariable),
+        ([Instruction.LOAD_CONST, 1, Instruction.LOAD_CONST, 0, Instruction.DIVIDE,
+          Instruction.EOS], ZeroDivisionError),
+    ]:
+        try:
+            vm.execute(pool + bytes(program))
+        except error as e:
+            message = str(e)
+        else:
+            raise AssertionError(f"Expected {error.__name__}")
+    assert message == "'1 / 0' at instruction 12"
 
 
 def test_equal_results_vm_eval():
@@ -165,10 +409,696 @@ def test_equal_results_vm_eval():
 
     evaluator = Evaluator()
     vm = VirtualMachine()
-    compiler = Compiler()
+    compiler = Compiler(fold=False)
     for expr, _ in EXPRESSIONS:
         ast = genast(expr)
         bytecode = compiler.compile(ast)
         vm_result = vm.execute(bytecode)
         ev_result = evaluator.eval(ast)
         assert vm_result == ev_result
+
+
+def test_compile_cache():
+    expreval = ExprEvaluator(cache_size=2)
+    cache = expreval.cache
+    assert expreval.eval("3 + 5") == 8
+    assert (cache.hits, cache.misses) == (0, 1)
+    bytecode = expreval.compile("3 + 5")
+    assert expreval.compile("3 + 5") is bytecode
+    assert expreval.format("3+5") == "3 + 5"
+    assert (cache.hits, cache.misses, cache.evictions) == (2, 2, 0)
+    expreval.eval("4 * 7")
+    assert "3 + 5" not in cache and len(cache) == 2
+    assert cache.evictions == 1
+    cache.clear()
+    assert len(cache) == 0 and (cache.hits, cache.misses) == (0, 0)
+
+
+def test_compile_cache_lru_order():
+    cache = CompileCache(maxsize=2)
+    expreval = ExprEvaluator(cache_size=0)
+    for expr in ("1", "2"):
+        cache.put(expr, expreval._entry(expr))
+    cache.get("1")
+    cache.put("3", expreval._entry("3"))
+    assert "1" in cache and "2" not in cache and "3" in cache
+    assert len(expreval.cache) == 0
+
+
+def test_variables():
+    expreval = ExprEvaluator()
+    expr = "x * x + 2 * x * y - y ^ 2 / rate_2"
+    answer = lambda x, y, rate_2: x * x + 2 * x * y - y**2 / rate_2
+    prepared = expreval.prepare(expr)
+    assert prepared.variables == ("x", "y", "rate_2")
+    for x, y, rate in [(1, 2, 3), (0.5, -4, 8), (10, 0, 1)]:
+        result = answer(x, y, rate)
+        assert prepared(x, y, rate) == result
+        assert prepared(rate_2=rate, y=y, x=x) == result
+        assert prepared(x, rate_2=rate, y=y) == result
+        assert expreval.eval(expr, x=x, y=y, rate_2=rate) == result
+
+
+def test_variable_slots():
+    deps = Lexer(), Parser()
+    compiler = Compiler()
+    ast = deps[1].parse(deps[0].scan("b - a * b"))
+    bytecode = compiler.compile(ast)
+    assert compiler.variables == ("b", "a")
+    program = [
+        Instruction.LOAD_VAR, 0,
+        Instruction.LOAD_VAR, 1,
+        Instruction.LOAD_VAR, 0,
+        Instruction.MULTIPLY,
+        Instruction.SUBTRACT,
+        Instruction.EOS,
+    ]
+    assert bytecode.endswith(bytes(program))
+    assert VirtualMachine().execute(bytecode, [5, 3]) == -10
+
+
+def test_unbound_variables():
+    expreval = ExprEvaluator()
+    prepared = expreval.prepare("x + y")
+    for call in (lambda: prepared(1), lambda: expreval.eval("x + y", x=1)):
+        try:
+            call()
+        except UnboundVariable:
+            continue
+        raise AssertionError("Expected UnboundVariable")
+    for call in (lambda: prepared(1, 2, 3), lambda: prepared(1, x=2)):
+        try:
+            call()
+        except TypeError:
+            continue
+        raise AssertionError("Expected TypeError")
+
+
+def test_vectorized_machine():
+    import pytest
+
+    np = pytest.importorskip("numpy")
+    from .vectorized import VectorizedMachine
+
+    deps = Lexer(), Parser()
+    compiler = Compiler()
+    vm = VirtualMachine()
+    vvm = VectorizedMachine()
+    for expr, _ in EXPRESSIONS:
+        bytecode = compiler.compile(deps[1].parse(deps[0].scan(expr)))
+        assert vvm.execute(bytecode) == vm.execute(bytecode)
+
+    xs = np.array([-3, -1, 2, 5, 9])
+    ys = np.array([1.5, 2.0, -0.5, 4.0, 0.25])
+    for expr in ("x * y - x ^ 2", "(x + 1) / y", "x ^ (0 - 2) + y ^ 3", "-x / 4 + +y"):
+        bytecode = compiler.compile(deps[1].parse(deps[0].scan(expr)))
+        vector = vvm.execute(bytecode, [xs, ys])
+        scalar = [vm.execute(bytecode, [x, y]) for x, y in zip(xs.tolist(), ys.tolist())]
+        assert vector.tolist() == scalar
+
+    # Integers grow like Python's instead of wrapping around, and keep their
+    # dtype where they fit.
+    expreval = ExprEvaluator()
+    xs = np.array([10**7, 2, -3])
+    for expr in ("x ^ 3", "x * x * x * x", "x ^ 3 - x ^ 3 + 1", "x ^ 3 / x", "(0 - x) ^ 3 * 2 + 1"):
+        vector = expreval.vectorize(expr)(xs)
+        assert vector.tolist() == [expreval.eval(expr, x=x) for x in xs.tolist()]
+    assert expreval.vectorize("x ^ 3")(xs).tolist() == [10**21, 8, -27]
+    assert expreval.vectorize("x ^ 3 - x ^ 3 + 1")(xs).dtype == np.int64
+    assert expreval.vectorize("x * 2")(xs).dtype == np.int64
+    small = np.array([1, 2], dtype=np.int8)
+    assert expreval.vectorize("x + 100")(small).dtype == np.int8
+    assert expreval.vectorize("x + 126")(small).tolist() == [127, 128]
+    # Unsigned results below zero and booleans get Python's answers too.
+    for expr, args, answer in [
+        ("x - y", [np.array([1], np.uint8), np.array([2], np.uint8)], [-1]),
+        ("x - 3", [np.array([1], np.uint64)], [-2]),
+        ("x - 1", [np.array([2**64 - 1], np.uint64)], [2**64 - 2]),
+        ("x + y", [np.array([True]), np.array([True])], [2]),
+        ("x * y + x", [np.array([True, False]), np.array([True, True])], [2, 0]),
+    ]:
+        assert expreval.vectorize(expr)(*args).tolist() == answer
+    assert expreval.vectorize("x - 1")(np.array([2], np.uint8)).dtype == np.uint8
+    # So does NEGATE, which is not a subtraction from zero for float zeros.
+    for expr, xs, answer in [
+        ("-x", np.array([-(2**63)]), [2**63]),
+        ("-x", np.array([1, 5], np.uint8), [-1, -5]),
+        ("-x", np.array([True, False]), [-1, 0]),
+        ("-x * 2", np.array([3], np.int8), [-6]),
+    ]:
+        assert expreval.vectorize(expr)(xs).tolist() == answer
+    negated = expreval.vectorize("-x")(np.array([0.0, -0.0]))
+    assert [repr(value) for value in negated.tolist()] == ["-0.0", "0.0"]
+
+
+def test_vectorized_zero_division():
+    import pytest
+
+    np = pytest.importorskip("numpy")
+    expreval = ExprEvaluator()
+    xs = np.array([1.0, 0.0, 3.0, 0.0])
+    with pytest.raises(ZeroDivisionError):
+        expreval.vectorize("6 / x")(xs)
+    from .vectorized import VectorizedMachine
+
+    vvm = VectorizedMachine(zero_division="nan")
+    result = vvm.execute(expreval.compile("6 / x"), [xs])
+    assert result[0] == 6 and result[2] == 2 and np.isinf(result[1])
+    assert vvm.mask is not None
+    assert vvm.mask.tolist() == [False, True, False, True]
+    prepared = expreval.vectorize("6 / (x - 1) + 6 / x", zero_division="nan")
+    assert prepared.mask is None
+    prepared(xs)
+    assert prepared.mask is not None
+    assert prepared.mask.tolist() == [True, True, False, True]
+    prepared(xs + 1)
+    assert prepared.mask.tolist() == [False, True, False, True]
+
+
+def test_parallel_evaluation():
+    import pytest
+
+    np = pytest.importorskip("numpy")
+    from .parallel import SharedArray
+
+    expreval = ExprEvaluator()
+    xs = np.arange(-50, 50)
+    ys = np.linspace(0.5, 8, 100)
+    expected = expreval.vectorize("x * y - x ^ 2 / 3")(xs, ys)
+    with SharedArray.from_array(ys) as shared:
+        with expreval.eval_parallel(
+            "x * y - x ^ 2 / 3", xs, y=shared, workers=3, chunksize=7
+        ) as result:
+            assert result.array.tolist() == expected.tolist()
+
+    with SharedArray((4,), np.bool_) as mask, SharedArray((4,), np.float64) as out:
+        xs = np.array([1.0, 0.0, 2.0, 0.0])
+        expreval.eval_parallel(
+            "1 / x", xs, workers=2, chunksize=1, zero_division="nan", out=out, mask=mask
+        )
+        assert mask.array.tolist() == [False, True, False, True]
+        assert out.array[2] == 0.5
+        with pytest.raises(ZeroDivisionError):
+            expreval.eval_parallel("1 / x", xs, workers=2, chunksize=1)
+
+    # The output dtype does not depend on the values in the first chunk.
+    xs, ys = np.array([2, 2, 2, 2]), np.array([1, -1, 2, -2])
+    with expreval.eval_parallel("x ^ y", xs, ys, workers=2, chunksize=1) as result:
+        assert result.array.tolist() == [2.0, 0.5, 4.0, 0.25]
+    with expreval.eval_parallel("x ^ y", xs, 3, workers=2, chunksize=1) as result:
+        assert result.array.dtype == xs.dtype and result.array.tolist() == [8] * 4
+    with SharedArray((4,), xs.dtype) as out, pytest.raises(TypeError):
+        expreval.eval_parallel("x ^ y", xs, ys, workers=2, chunksize=1, out=out)
+    # Empty inputs give an empty output without starting any workers.
+    with expreval.eval_parallel("x + 1", np.array([], dtype=np.float64), workers=2) as result:
+        assert result.array.shape == (0,) and result.array.dtype == np.float64
+
+
+def test_loaded_program():
+    from concurrent.futures import ThreadPoolExecutor
+    from .vm import LoadedProgram
+
+    deps = Lexer(), Parser()
+    vm = VirtualMachine()
+    for compiler in (Compiler(), Compiler(fold=False)):
+        for expr, ans in EXPRESSIONS:
+            program = LoadedProgram(compiler.compile(deps[1].parse(deps[0].scan(expr))))
+            assert program.run() == program.run() == ans
+
+    bytecode = ExprEvaluator().compile("x * 2 - y / x")
+    program = LoadedProgram(bytecode)
+    assert program.variables == 2
+    inputs = [(x, y) for x in range(1, 50) for y in range(-5, 5)]
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(program.run, inputs))
+    assert results == [vm.execute(bytecode, slots) for slots in inputs]
+    for slots, error in [((0, 1), ZeroDivisionError), ((1,), UnboundVariable)]:
+        try:
+            program.run(slots)
+        except error:
+            continue
+        raise AssertionError(f"Expected {error.__name__}")
+
+
+def test_closure_compiler():
+    from .closures import ClosureCompiler
+
+    deps = Lexer(), Parser()
+    closures = ClosureCompiler()
+    evaluator = Evaluator()
+    for expr, ans in EXPRESSIONS:
+        closure = closures.compile(deps[1].parse(deps[0].scan(expr)))
+        assert closure(()) == ans and closures.variables == ()
+
+    expreval = ExprEvaluator()
+    expr = "x * x - 2 * y / (x + 1) ^ 2 + -y"
+    closure = expreval.prepare(expr, backend="closure")
+    program = expreval.prepare(expr)
+    assert closure.variables == program.variables == ("x", "y")
+    for x, y in [(1, 2), (0.5, -3), (7, 0)]:
+        assert closure(x, y) == program(x, y) == expreval.eval(expr, x=x, y=y)
+
+    ast = deps[1].parse(deps[0].scan("4 / (x - 2)"))
+    for run in (closures.compile(ast), lambda slots: evaluator.eval(ast, {"x": slots[0]})):
+        try:
+            run((2,))
+        except ZeroDivisionError as e:
+            assert str(e) == "Zero division error '4 / 0' at column 2"
+        else:
+            raise AssertionError("Expected ZeroDivisionError")
+
+    # Too deep for nested closures, this runs as register code.
+    deep = expreval.prepare(" + ".join(["x"] * 5000) + " - y / x", backend="closure")
+    assert deep.variables == ("x", "y") and deep(3, 6) == 14998
+    try:
+        deep(0, 6)
+    except ZeroDivisionError as e:
+        assert str(e) == "Zero division error '6 / 0' at column 20002"
+    else:
+        raise AssertionError("Expected ZeroDivisionError")
+
+
+def test_code_generator():
+    from .codegen import CodeGenerator
+
+    deps = Lexer(), Parser()
+    codegen = CodeGenerator()
+    for expr, ans in EXPRESSIONS:
+        function = codegen.compile(deps[1].parse(deps[0].scan(expr)))
+        assert function(()) == ans and codegen.variables == ()
+
+    expreval = ExprEvaluator()
+    expr = "x * 2 + (y - 1) / (x - 3) ^ 2 - 4 / y"
+    generated = expreval.prepare(expr, backend="codegen")
+    assert expreval.codegen(expr) is expreval.codegen(expr)
+    assert generated.variables == ("x", "y")
+    for x, y in [(1, 2), (0.5, -3), (7, 1)]:
+        assert generated(x, y) == expreval.eval(expr, x=x, y=y)
+    for x, y in [(3, 5), (1, 0), (3, 0)]:
+        errors = []
+        for run in (lambda: generated(x, y), lambda: expreval.eval(expr, x=x, y=y)):
+            try:
+                run()
+            except ZeroDivisionError as e:
+                errors.append(str(e))
+        assert len(errors) == 2 and errors[0] == errors[1]
+
+    # Straight-line code gives the same answers, and is what trees too deep
+    # for one nested expression compile to.
+    for expr, ans in EXPRESSIONS:
+        module = codegen.generate(deps[1].parse(deps[0].scan(expr)), flat=True)
+        namespace: dict[str, typing.Any] = {}
+        exec(compile(module, "<flat>", "exec"), namespace)
+        assert namespace["expression"](()) == ans
+    for expr, x, ans in [(" + ".join(["x"] * 5000), 3, 15000), ("x" + " ^ 1" * 300, 2, 2)]:
+        assert expreval.prepare(expr, backend="codegen")(x) == ans
+    assert "t4999 = " in codegen.source(deps[1].parse(deps[0].scan(" + ".join(["x"] * 5001))))
+
+
+def test_tiered_execution():
+    expreval = ExprEvaluator(tiers=(("eval", 0), ("vm", 2), ("codegen", 4)))
+    promotions = []
+    expreval.stats.listeners.append(lambda *args: promotions.append(args))
+    expr = "x * 2 + (y - 1) / 4"
+    results, tiers = [], []
+    for _ in range(6):
+        results.append(expreval.eval(expr, x=3, y=5))
+        tiers.append(expreval.tier(expr))
+    assert tiers == ["eval", "eval", "vm", "vm", "codegen", "codegen"]
+    assert results == [7.0] * 6
+    assert promotions == [(expr, "eval", "vm"), (expr, "vm", "codegen")]
+    assert expreval.stats.calls == {"eval": 2, "vm": 2, "codegen": 2}
+    assert expreval.stats.promotions == {("eval", "vm"): 1, ("vm", "codegen"): 1}
+    try:
+        expreval.eval(expr, x=3)
+    except UnboundVariable:
+        pass
+    else:
+        raise AssertionError("Expected UnboundVariable")
+
+    # Long formulas are promoted all the way and keep their answers.
+    expreval = ExprEvaluator()
+    for long, answer in [(" + ".join(["x"] * 5000), 5000), ("x" + " ^ 2" * 300, 1)]:
+        assert [expreval.eval(long, x=1) for _ in range(200)] == [answer] * 200
+        assert expreval.tier(long) == "codegen"
+    assert not expreval.stats.failures
+    # A backend that fails to compile is skipped, the current one is kept.
+    def fail(*args: typing.Any):
+        raise RecursionError
+
+    expreval = ExprEvaluator(tiers=(("eval", 0), ("vm", 2), ("codegen", 4), ("closure", 6)))
+    expreval._codegen.compile = fail  # type: ignore[method-assign]
+    tiers = []
+    for _ in range(8):
+        assert expreval.eval(expr, x=3, y=5) == 7.0
+        tiers.append(expreval.tier(expr))
+    assert tiers == ["eval", "eval", "vm", "vm", "vm", "vm", "closure", "closure"]
+    assert expreval.stats.failures == {"codegen": 1}
+    assert expreval.stats.promotions == {("eval", "vm"): 1, ("vm", "closure"): 1}
+
+    pinned = ExprEvaluator(backend="closure")
+    assert pinned.tier(expr) == "closure"
+    assert pinned.eval(expr, x=3, y=5) == 7.0 and not pinned.stats.promotions
+    for tiers in [(), (("vm", 1),), (("eval", 0), ("jit", 1)), (("eval", 0), ("vm", 5), ("codegen", 2))]:
+        try:
+            ExprEvaluator(tiers=tiers)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Expected ValueError for {tiers}")
+
+
+def test_batch_evaluation():
+    from . import batch
+
+    sources = [expr for expr, _ in EXPRESSIONS] * 3 + ["1 / 0", "x + 1", "(2"]
+    answers = [ans for _, ans in EXPRESSIONS] * 3
+    for backend in batch.BACKENDS:
+        for workers in [1, 2]:
+            outcomes = list(batch.evaluate(sources, workers=workers, backend=backend, chunksize=4))
+            assert [value for value, _ in outcomes[:-3]] == answers
+            assert all(error is None for _, error in outcomes[:-3])
+            errors = [type(error) for _, error in outcomes[-3:]]
+            assert errors == [ZeroDivisionError, UnboundVariable, ParserError]
+
+
+def test_batch_command(tmp_path, capsys):
+    from .__main__ import arguments, run_batch
+
+    # Blank lines are echoed, not evaluated, so results stay on their line.
+    source, output = tmp_path / "in.txt", tmp_path / "out.txt"
+    source.write_text("1 + 1\n\n  \n2 * 3\n1 / 0\n\n")
+    assert run_batch(arguments([str(source), "-o", str(output), "--workers", "1"])) == 1
+    *results, error, blank, end = output.read_text().split("\n")
+    assert results == ["2", "", "", "6"] and blank == end == ""
+    assert error.startswith("error: ZeroDivisionError")
+    assert capsys.readouterr().err.startswith(f"{source}:5: ZeroDivisionError")
+    source.write_text("\n\n")
+    assert run_batch(arguments([str(source), "-o", str(output), "--workers", "1"])) == 0
+    assert output.read_text() == "\n\n"
+    for option in ["--workers", "--chunksize"]:
+        for value in ["0", "-1", "x"]:
+            try:
+                arguments([str(source), option, value])
+            except SystemExit:
+                pass
+            else:
+                raise AssertionError(f"Expected SystemExit for {option} {value}")
+
+
+def test_eval_many():
+    import itertools
+
+    expreval = ExprEvaluator()
+    items = [expreval.compile("2 ^ 10"), "1 + 1", "1 + 1", bytearray(expreval.compile("7 * 6"))]
+    assert list(expreval.eval_many(items, workers=2, chunksize=3)) == [1024, 2, 2, 42]
+    outcomes = expreval.eval_many(["1 - 2", "1 / 0", "4"], workers=1, return_exceptions=True)
+    first, error, last = outcomes
+    assert first == -1 and isinstance(error, ZeroDivisionError) and last == 4
+    results = expreval.eval_many(["1", "2 +"], workers=1)
+    assert next(results) == 1
+    try:
+        next(results)
+    except ParserError:
+        pass
+    else:
+        raise AssertionError("Expected ParserError")
+    endless = expreval.eval_many(itertools.cycle(["3 * 3", "x"]), workers=2, return_exceptions=True)
+    head = list(itertools.islice(endless, 1001))
+    assert head[::2] == [9] * 501 and all(isinstance(e, UnboundVariable) for e in head[1::2])
+
+
+def test_deep_trees():
+    from .printer import ASTPrinter
+    from .formatter import Formatter
+
+    def token(type: TokenType, lexeme: str):
+        return Token(type, lexeme, 0)
+
+    depth = 10_000
+    one, x = token(TokenType.NUMBER, "1"), token(TokenType.IDENTIFIER, "x")
+    minus, plus = token(TokenType.MINUS, "-"), token(TokenType.PLUS, "+")
+    left = token(TokenType.LEFT, "(")
+    signs: nodes.Expression = nodes.Variable(x)
+    groups: nodes.Expression = nodes.Number(one)
+    chain: nodes.Expression = nodes.Number(one)
+    for _ in range(depth):
+        signs = nodes.UMinus(minus, signs)
+        groups = nodes.Group(left, groups)
+        chain = nodes.Plus(chain, plus, nodes.Variable(x))
+    trees = [(signs, 2), (groups, 1), (chain, 1 + 2 * depth)]
+    for tree, answer in trees:
+        assert Evaluator().eval(tree, {"x": 2}) == answer
+        assert VirtualMachine().execute(Compiler().compile(tree), (2,)) == answer
+        assert VirtualMachine().execute(Compiler(fold=False).compile(tree), (2,)) == answer
+        assert tree == tree and not tree == nodes.Number(one)
+    assert Formatter().format(signs) == "-" * depth + "x"
+    assert Formatter().format(groups) == "(" * depth + "1" + ")" * depth
+    assert Formatter().format(chain) == "1" + " + x" * depth
+    assert ASTPrinter().join(signs).splitlines() == ["-"] * depth + ["x"]
+    # Every expression nested beyond the recursion limit goes through the
+    # fallback walkers as a whole and must still give the same answers.
+    for expr, ans in EXPRESSIONS:
+        tree = Parser().parse(Lexer().scan(expr))
+        source = Formatter().format(tree)
+        for _ in range(depth):
+            tree = nodes.Group(left, tree)
+        assert Evaluator().eval(tree) == ans
+        assert VirtualMachine().execute(Compiler().compile(tree)) == ans
+        assert VirtualMachine().execute(Compiler(fold=False).compile(tree)) == ans
+        assert Formatter().format(tree) == "(" * depth + source + ")" * depth
+    # The parser does not recurse either, deep trees can come from source.
+    from .arena import ArenaEvaluator, ArenaParser
+
+    expreval = ExprEvaluator()
+    for source, answer in [
+        ("(" * depth + "1" + ")" * depth, 1),
+        ("-" * depth + "x", 2),
+        ("-" * (depth + 1) + "x", -2),
+        ("x" + " ^ (1" * depth + ")" * depth, 2),
+        ("(" * depth + "-x ^ 2 - (x" + ")" * (depth + 1), -6),
+    ]:
+        assert expreval.eval(source, x=2) == answer
+        assert Formatter().format(Parser().parse(Lexer().scan(source))) == source
+        assert ArenaEvaluator().eval(ArenaParser().parse(Lexer().scan(source)), {"x": 2}) == answer
+    try:
+        Parser().parse(Lexer().scan("(" * depth + "1" + ")" * (depth - 1)))
+    except ParserError as e:
+        assert str(e) == "Group expression was never closed at column 0"
+    else:
+        raise AssertionError("Expected ParserError")
+
+
+def test_nodes_keep_spans():
+    ast = Parser().parse(Lexer().scan("-x * 2.50"))
+    assert isinstance(ast, nodes.Star) and isinstance(ast.left, nodes.UMinus)
+    number, variable = ast.right, ast.left.right
+    assert isinstance(number, nodes.Number) and isinstance(variable, nodes.Variable)
+    assert (number.value, number.lexeme, number.column) == (2.5, "2.50", 5)
+    assert number.token == Token(TokenType.NUMBER, "2.50", 5)
+    assert ast.operator == Token(TokenType.STAR, "*", 3)
+    assert ast.left.operator == Token(TokenType.MINUS, "-", 0)
+    assert variable.token == Token(TokenType.IDENTIFIER, "x", 1)
+    for node in [ast, ast.left, number, variable]:
+        assert not hasattr(node, "__dict__")
+
+
+def test_nodes_compare_once(monkeypatch):
+    # Unequal trees are told apart by a single walk, not a second reflected one.
+    walks = []
+    equal = nodes.equal
+    monkeypatch.setattr(nodes, "equal", lambda left, right: walks.append(1) or equal(left, right))
+    first, second = (Parser().parse(Lexer().scan(src)) for src in ["-x * 2", "-x * 3"])
+    assert first != second and not first == second and first == first
+    assert len(walks) == 3
+    assert first != 2 and first.left != first.left.right
+
+
+def test_arena():
+    from .arena import Arena, ArenaParser, ArenaEvaluator, ArenaCompiler
+    from .formatter import Formatter
+
+    lexer, parser, arena_parser = Lexer(), Parser(), ArenaParser(arena=Arena(capacity=1))
+    evaluator, compiler = ArenaEvaluator(), ArenaCompiler()
+    for expr, ans in EXPRESSIONS:
+        arena = arena_parser.parse(lexer.scan(expr))
+        tree = parser.parse(lexer.scan(expr))
+        assert evaluator.eval(arena) == ans
+        assert VirtualMachine().execute(compiler.compile(arena)) == ans
+        assert compiler.compile(arena) == Compiler(cse=False).compile(tree)
+        assert ArenaCompiler(fold=False).compile(arena) == Compiler(False, False).compile(tree)
+        assert arena.to_nodes() == tree and Arena.from_nodes(tree).to_nodes() == tree
+    try:
+        ArenaCompiler(cse=True)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected ValueError")
+    # Parsing again reuses the columns grown by the longest expression.
+    capacity = len(arena_parser.arena.kinds)
+    arena = arena_parser.parse(lexer.scan("x * (2.50 + y)"))
+    assert len(arena) == 6 and len(arena.kinds) == capacity
+    assert evaluator.eval(arena, {"x": 2, "y": 0.5}) == 6
+    assert Formatter().format(arena.to_nodes()) == "x * (2.50 + y)"
+    try:
+        evaluator.eval(arena, {"x": 2})
+    except UnboundVariable as e:
+        assert str(e) == "Variable 'y' at column 12 is not bound"
+    else:
+        raise AssertionError("Expected UnboundVariable")
+    try:
+        evaluator.eval(arena_parser.parse(lexer.scan("1 / (x - x)")), {"x": 1})
+    except ZeroDivisionError as e:
+        assert str(e) == "Zero division error '1 / 0' at column 2"
+    else:
+        raise AssertionError("Expected ZeroDivisionError")
+
+
+def test_token_spans():
+    import pickle
+
+    source = "12.5 * rate"
+    number, star, rate, eof = Lexer().scan(source)
+    assert (number.lexeme, number.value, star.lexeme, rate.lexeme) == ("12.5", 12.5, "*", "rate")
+    assert rate == Token(TokenType.IDENTIFIER, "rate", 7)
+    assert rate == Token(TokenType.IDENTIFIER, source, 7, start=7, end=11)
+    assert str(star) == "Token(star, '*', 5)" and not hasattr(star, "__dict__")
+    assert isinstance(TokenType.STAR, int) and str(TokenType.STAR) == "star"
+    assert [token.lexeme for token in Lexer().stream(source.encode())] == ["12.5", "*", "rate", ""]
+    assert pickle.loads(pickle.dumps(number)) == number
+
+
+def test_common_subexpressions(capsys):
+    from .compiler import CommonSubtrees
+    from .printer import ByteCodePrinter
+    from .vm import LoadedProgram
+
+    lexer, parser = Lexer(), Parser()
+    tree = parser.parse(lexer.scan("(a*b+c) * (a*b+c) / (a*b+c)"))
+    numbers = CommonSubtrees().number(tree)
+    first, second, third = tree.left, tree.right.left, tree.right.right
+    assert first is not second and numbers[id(first)] == numbers[id(second)]
+    assert numbers[id(third)] == numbers[id(first)] != numbers[id(tree.right)]
+    assert numbers[id(first.right.left)] != numbers[id(first.right)]
+
+    compiler = Compiler()
+    bytecode = compiler.compile(tree)
+    assert bytecode.endswith(bytes([
+        Instruction.LOAD_VAR, 0,
+        Instruction.LOAD_VAR, 1,
+        Instruction.MULTIPLY,
+        Instruction.LOAD_VAR, 2,
+        Instruction.ADD,
+        Instruction.DUP,
+        Instruction.STORE_TEMP, 0,
+        Instruction.LOAD_TEMP, 0,
+        Instruction.LOAD_TEMP, 0,
+        Instruction.DIVIDE,
+        Instruction.MULTIPLY,
+        Instruction.EOS,
+    ]))
+    slots = (2, 3, 4)
+    assert VirtualMachine().execute(bytecode, slots) == 10.0
+    assert LoadedProgram(bytecode).run(slots) == 10.0
+    unshared = Compiler(cse=False).compile(tree)
+    assert len(unshared) - len(bytecode) == 9
+    assert VirtualMachine().execute(unshared, slots) == 10.0
+
+    # Repeats nested in a repeat are loaded with it, only numbers and
+    # variables are loaded again, and the fallback emits the same code.
+    tree = parser.parse(lexer.scan("(x*y + x*y) - (x*y + x*y) + x"))
+    bytecode = compiler.compile(tree)
+    answer = Evaluator().eval(tree, {"x": 2, "y": 3})
+    assert VirtualMachine().execute(bytecode, (2, 3)) == answer == -2
+    assert bytecode.count(Instruction.MULTIPLY) == 1
+    assert bytecode.count(Instruction.STORE_TEMP) == 2
+    left = Token(TokenType.LEFT, "(", 0)
+    for _ in range(10_000):
+        tree = nodes.Group(left, tree)
+    assert compiler.compile(tree) == bytecode
+
+    ByteCodePrinter().print(Compiler().compile(parser.parse(lexer.scan("-x * -x"))))
+    assert capsys.readouterr().out.splitlines()[1:] == [
+        " LOAD_VAR 0",
+        " NEGATE",
+        " DUP",
+        " STORE_TEMP 0",
+        " LOAD_TEMP 0",
+        " MULTIPLY",
+    ]
+
+    pool = constants.encode_pool([0])
+    program = pool + bytes([Instruction.LOAD_TEMP, 0, Instruction.EOS])
+    for run in (lambda: VirtualMachine().execute(program), lambda: LoadedProgram(program)):
+        try:
+            run()
+        except InvalidByteCode:
+            continue
+        raise AssertionError("Expected InvalidByteCode")
+
+
+def test_register_machine():
+    from .regvm import RegisterCompiler
+    from .vm import LoadedProgram
+
+    lexer, parser, evaluator = Lexer(), Parser(), Evaluator()
+    for compiler in (RegisterCompiler(), RegisterCompiler(fold=False, cse=False)):
+        for expr, ans in EXPRESSIONS:
+            program = compiler.compile(parser.parse(lexer.scan(expr)))
+            assert program.run() == ans and compiler.variables == ()
+
+    compiler = RegisterCompiler()
+    tree = parser.parse(lexer.scan("x * 2 + (y - 1) / 4 - -x * (y - 1)"))
+    program = compiler.compile(tree)
+    assert compiler.variables == ("x", "y")
+    assert program.listing() == [
+        "CONSTANTS ['r3 = 2', 'r4 = 1', 'r5 = 4', 'r6 = -1']",
+        "VARIABLES ['r7', 'r8']",
+        "MULTIPLY r0, r7, r3",
+        "SUBTRACT r1, r8, r4",
+        "DIVIDE r2, r1, r5",
+        "ADD r0, r0, r2",
+        "NEGATE r2, r7",
+        "MULTIPLY r2, r2, r1",
+        "SUBTRACT r0, r0, r2",
+        "RETURN r0",
+    ]
+    # Leaves are already in their registers, only operators run.
+    assert len(program.code) == 7 < len(LoadedProgram(Compiler().compile(tree)).code)
+    for x, y in [(3, 5), (0.5, -3), (-0.0, 1)]:
+        answer = evaluator.eval(tree, {"x": x, "y": y})
+        assert repr(program.run((x, y))) == repr(answer)
+    assert repr(compiler.compile(parser.parse(lexer.scan("-x"))).run((0.0,))) == "-0.0"
+
+    ast = parser.parse(lexer.scan("4 / (x - 2)"))
+    try:
+        compiler.compile(ast).run((2,))
+    except ZeroDivisionError as e:
+        assert str(e) == "Zero division error '4 / 0' at column 2"
+    else:
+        raise AssertionError("Expected ZeroDivisionError")
+    try:
+        compiler.compile(ast).run(())
+    except UnboundVariable:
+        pass
+    else:
+        raise AssertionError("Expected UnboundVariable")
+
+    left = Token(TokenType.LEFT, "(", 0)
+    minus = Token(TokenType.MINUS, "-", 0)
+    deep = parser.parse(lexer.scan("x * y + x * y"))
+    for _ in range(10_000):
+        deep = nodes.UMinus(minus, nodes.Group(left, deep))
+    assert compiler.compile(deep).run((2, 3)) == 12
+    assert len(compiler.compile(deep).code) == 2 + 10_000
+
+    expreval = ExprEvaluator(backend="register")
+    expr = "x * x - 2 * y / (x + 1) ^ 2 + -y"
+    prepared = expreval.prepare(expr, backend="register")
+    assert prepared.variables == ("x", "y")
+    assert expreval.registers(expr) is expreval.registers(expr)
+    for x, y in [(1, 2), (0.5, -3), (7, 0)]:
+        assert prepared(x, y) == expreval.eval(expr, x=x, y=y) == evaluator.eval(
+            parser.parse(lexer.scan(expr)), {"x": x, "y": y}
+        )
+    assert expreval.tier(expr) == "register"
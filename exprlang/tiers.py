@@ -0,0 +1,57 @@
+from collections import Counter
+import typing as ty
+
+# Execution tiers, cheapest to compile first:
+#   eval     tree walking Evaluator, nothing to compile
+#   vm       bytecode decoded into a LoadedProgram
+#   register three-address code for a RegisterProgram
+#   closure  nested Python closures
+#   codegen  a function compiled by CPython
+BACKENDS: ty.Final = ("eval", "vm", "register", "closure", "codegen")
+
+# (backend, number of calls after which an expression is promoted to it)
+Tiers = ty.Sequence[tuple[str, int]]
+DEFAULT_TIERS: ty.Final[Tiers] = (("eval", 0), ("vm", 8), ("codegen", 128))
+
+Listener = ty.Callable[[str, str, str], None]
+
+
+def validate(tiers: Tiers) -> tuple[tuple[str, int], ...]:
+    tiers = tuple((name, threshold) for name, threshold in tiers)
+    if not tiers or tiers[0][1] != 0:
+        raise ValueError(f"The first tier must start at 0 calls, got {tiers}")
+    for name, _ in tiers:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown backend {name!r}, expected one of {BACKENDS}")
+    thresholds = [threshold for _, threshold in tiers]
+    if thresholds != sorted(thresholds):
+        raise ValueError(f"Tier thresholds must not decrease, got {tiers}")
+    return tiers
+
+
+class TierStats:
+    # Counters for tuning the thresholds. `calls` counts evaluations per
+    # backend, `promotions` counts (from, to) transitions and `failures` the
+    # backends an expression could not be compiled for, which it skipped.
+    # Listeners are called with (expression, from, to) on every promotion.
+    def __init__(self) -> None:
+        self.calls: Counter[str] = Counter()
+        self.promotions: Counter[tuple[str, str]] = Counter()
+        self.failures: Counter[str] = Counter()
+        self.listeners: list[Listener] = []
+
+    def promoted(self, expr: str, old: str, new: str):
+        self.promotions[old, new] += 1
+        for listener in self.listeners:
+            listener(expr, old, new)
+
+    def clear(self):
+        self.calls.clear()
+        self.promotions.clear()
+        self.failures.clear()
+
+    def __repr__(self) -> str:
+        return (
+            f"TierStats(calls={dict(self.calls)}, promotions={dict(self.promotions)}, "
+            f"failures={dict(self.failures)})"
+        )
@@ -1,8 +1,9 @@
 import enum
 
 
-class TokenType(enum.StrEnum):
+class TokenType(enum.IntEnum):
     NUMBER = enum.auto()
+    IDENTIFIER = enum.auto()
     LEFT = enum.auto()
     RIGHT = enum.auto()
     SLASH = enum.auto()
@@ -13,12 +14,49 @@ class TokenType(enum.StrEnum):
     EOF = enum.auto()
     DOT = enum.auto()
 
+    def __str__(self) -> str:
+        return self.name.lower()
+
+
+# Members looked up on the enum class go through its metaclass on every
+# access, code run once per token reads them from module globals instead.
+_NUMBER = TokenType.NUMBER
+
 
 class Token:
-    def __init__(self, type: TokenType, lexeme: str, column: int) -> None:
+    # `value` is the parsed literal of NUMBER tokens, derived from the lexeme
+    # when not given. It takes no part in comparisons.
+    #
+    # The lexeme is not copied out of the source: a token keeps the text it
+    # was scanned from with the span `start:end` of its lexeme and slices it
+    # when asked. Binary text is decoded as latin-1, like the Lexer does.
+    # The span is kept as start and length, lengths are small ints that
+    # Python does not allocate.
+    __slots__ = ("type", "column", "value", "_text", "_start", "_length")
+
+    def __init__(
+        self,
+        type: TokenType,
+        text: str | bytes,
+        column: int,
+        value: float | int | None = None,
+        start: int = 0,
+        end: int | None = None,
+    ) -> None:
         self.type = type
-        self.lexeme = lexeme
         self.column = column
+        self._text = text
+        self._start = start
+        self._length = (len(text) if end is None else end) - start
+        if value is None and type == _NUMBER:
+            lexeme = self.lexeme
+            value = float(lexeme) if "." in lexeme else int(lexeme)
+        self.value = value
+
+    @property
+    def lexeme(self) -> str:
+        lexeme = self._text[self._start : self._start + self._length]
+        return lexeme if isinstance(lexeme, str) else lexeme.decode("latin-1")
 
     def __str__(self) -> str:
         return f"Token({self.type!s}, {self.lexeme!r}, {self.column})"
@@ -28,6 +66,6 @@ class Token:
     def __eq__(self, token: object) -> bool:
         return isinstance(token, Token) and (
             self.type == token.type
-            and self.lexeme == token.lexeme
             and self.column == token.column
+            and self.lexeme == token.lexeme
         ) or NotImplemented
@@ -0,0 +1,156 @@
+from .vm import VirtualMachine, DivisionByZero, BinaryOp, operator_table
+from .prepared import PreparedExpression
+import typing as ty
+import functools
+import operator
+
+try:
+    import numpy as np
+except ImportError:  # numpy is an optional dependency
+    np = None
+
+if ty.TYPE_CHECKING:
+    import numpy as np
+    from numpy.typing import ArrayLike, NDArray
+
+ZeroDivision = ty.Literal["raise", "nan"]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("The vectorized machine requires numpy: pip install numpy")
+
+
+class VectorizedMachine(VirtualMachine):
+    # Runs the same instruction stream as VirtualMachine, but every stack
+    # slot holds a numpy array, so one pass evaluates all the elements.
+    #
+    # zero_division="raise" mirrors the scalar machine and raises on the
+    # first element divided by zero, zero_division="nan" lets numpy produce
+    # inf/nan instead and records the offending elements in `mask`.
+    #
+    # Integers do not wrap around like numpy's: an operation whose result
+    # may not fit its integer dtype is redone on Python ints, and the result
+    # stays an object array if it really does not fit.
+    def __init__(self, zero_division: ZeroDivision = "raise") -> None:
+        _require_numpy()
+        if zero_division not in ("raise", "nan"):
+            raise ValueError(f"zero_division must be 'raise' or 'nan', got {zero_division!r}")
+        super().__init__()
+        self._binary = operator_table(
+            add=functools.partial(_exact, operator.add),
+            subtract=functools.partial(_exact, operator.sub),
+            multiply=functools.partial(_exact, operator.mul),
+            divide=self.divide,
+            power=self.power,
+        )
+        self._negate = self.negate
+        self.zero_division = zero_division
+        self.mask: "NDArray[np.bool_] | None" = None
+        self._shape: tuple[int, ...] = ()
+
+    def execute(
+        self,
+        bytecode: list[int] | bytes | None = None,
+        slots: ty.Sequence["ArrayLike"] = (),
+    ) -> "NDArray":
+        arrays = [np.asarray(slot) for slot in slots]
+        self._shape = np.broadcast_shapes(*(array.shape for array in arrays))
+        self.mask = np.zeros(self._shape, dtype=np.bool_)
+        result = super().execute(bytecode, arrays)
+        if np.shape(result) != self._shape:
+            return np.broadcast_to(result, self._shape).copy()
+        return np.asarray(result)
+
+    def _zero_division(self, zero: "NDArray[np.bool_]", left: "ArrayLike", op: str):
+        if not zero.any():
+            return
+        if self.zero_division == "nan":
+            self.mask |= zero
+            return
+        index = int(np.argmax(np.broadcast_to(zero, self._shape)))
+        value = np.broadcast_to(left, self._shape).flat[index]
+        raise DivisionByZero(f"'{value} {op} 0' at element {index}")
+
+    def divide(self, left: "ArrayLike", right: "ArrayLike"):
+        self._zero_division(np.equal(right, 0), left, "/")
+        if np.result_type(left, right) == object:
+            # Python ints from _exact, divided as floats like the rest.
+            left, right = np.asarray(left, dtype=np.float64), np.asarray(right, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.true_divide(left, right)
+
+    def negate(self, operand: "ArrayLike"):
+        # Integers as 0 - x, which _exact keeps from wrapping around, floats
+        # negated so that zeros keep flipping their sign.
+        operand = _integral(operand)
+        if np.result_type(operand).kind in "iuO":
+            return _exact(np.subtract, 0, operand)
+        return np.negative(operand)
+
+    def power(self, left: "ArrayLike", right: "ArrayLike"):
+        negative = np.less(right, 0)
+        # Python promotes int ** negative int to float, numpy refuses it.
+        integral = np.result_type(left, right).kind in "iuO"
+        if integral and negative.any():
+            left = np.asarray(left, dtype=np.float64)
+        self._zero_division(np.equal(left, 0) & negative, left, "^")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return _exact(np.power, left, right)
+
+
+def _integral(operand: ty.Any):
+    # Booleans take part in arithmetic as the ints Python would use.
+    if getattr(operand, "dtype", None) == np.bool_:
+        return np.asarray(operand, dtype=np.int64)
+    return operand
+
+
+def _exact(function: BinaryOp, left: ty.Any, right: ty.Any):
+    # The integer result is right wherever the float estimate of it is well
+    # inside the dtype's range, otherwise it is computed on Python ints.
+    # Python ints that fit go back to the integer dtype, or to int64 when
+    # they do not fit it, like negative results of unsigned operands.
+    left, right = _integral(left), _integral(right)
+    with np.errstate(over="ignore"):
+        result = function(left, right)
+    dtype = getattr(result, "dtype", None)
+    if dtype is None or dtype.kind not in "iuO":
+        return result
+    if dtype.kind != "O":
+        limits = np.iinfo(dtype)
+        with np.errstate(all="ignore"):
+            estimate = function(np.asarray(left, dtype=np.float64), np.asarray(right, dtype=np.float64))
+        bound = 2.0 ** (limits.bits - 2)
+        low = 0.0 if dtype.kind == "u" else -bound
+        if ((estimate >= low) & (estimate < bound)).all():
+            return result
+        result = function(np.asarray(left, dtype=object), np.asarray(right, dtype=object))
+    for fits in (dtype, np.dtype(np.int64)):
+        if fits.kind == "O":
+            continue
+        limits = np.iinfo(fits)
+        if ((result >= limits.min) & (result <= limits.max)).all():
+            return np.asarray(result, dtype=fits)
+    return result
+
+
+class VectorizedExpression(PreparedExpression):
+    # A PreparedExpression run by a VectorizedMachine. With
+    # zero_division="nan", `mask` has the elements the last call divided by
+    # zero.
+    __slots__ = ("machine",)
+
+    def __init__(
+        self,
+        source: str,
+        bytecode: bytes,
+        variables: tuple[str, ...],
+        machine: VectorizedMachine,
+    ) -> None:
+        super().__init__(source, bytecode, variables, lambda slots: machine.execute(bytecode, slots))
+        self.machine = machine
+
+    @property
+    def mask(self) -> "NDArray[np.bool_] | None":
+        return self.machine.mask
@@ -1,88 +1,216 @@
-from .instructions import Instruction
-from .exc import UnknownInstruction
+from .exc import InvalidByteCode, UnknownInstruction, UnboundVariable
+from .instructions import HAS_OPERAND, Instruction, decode_operand
+from . import constants
+import typing as ty
+import operator
+import types
+
+_EMPTY = constants.encode_pool([]) + bytes((Instruction.EOS,))
+
+BinaryOp = ty.Callable[[ty.Any, ty.Any], ty.Any]
+
+
+class DivisionByZero(ZeroDivisionError):
+    # Raised by the operator tables, the machine adds the instruction offset.
+    ...
+
+
+def divide(left: float | int, right: float | int):
+    if right == 0:
+        raise DivisionByZero(f"'{left} / 0'")
+    return left / right
+
+
+def operator_table(**overrides: BinaryOp) -> list[BinaryOp | None]:
+    # Dense, opcode indexed table of the binary instructions.
+    table: list[BinaryOp | None] = [None] * 0x100
+    table[Instruction.ADD] = operator.add
+    table[Instruction.SUBTRACT] = operator.sub
+    table[Instruction.MULTIPLY] = operator.mul
+    table[Instruction.POWER] = operator.pow
+    table[Instruction.DIVIDE] = divide
+    for name, function in overrides.items():
+        table[Instruction[name.upper()]] = function
+    return table
 
 
 class VirtualMachine:
-    def __init__(self, bytecode: list[int] | bytes | None = None) -> None:
-        self._bytecode = bytecode or [Instruction.EOS, Instruction.EOS]
+    _binary: list[BinaryOp | None] = operator_table()
+    _negate: ty.Callable[[ty.Any], ty.Any] = operator.neg
+
+    def __init__(
+        self,
+        bytecode: list[int] | bytes | None = None,
+        slots: ty.Sequence[float | int] = (),
+    ) -> None:
+        self._bytecode = bytecode or _EMPTY
+        self._slots = slots
         self._constants: list[int | float] = []
-        self._stop = len(self._bytecode)
         self._stack: list[float] = []
-        self.pop = lambda: self._stack.pop()
-        self.push = self._stack.append
         self._current = 0
 
     reset = __init__
 
-    def execute(self, bytecode: list[int] | bytes | None = None):
-        self.reset(bytecode)
+    def execute(
+        self,
+        bytecode: list[int] | bytes | None = None,
+        slots: ty.Sequence[float | int] = (),
+    ):
+        self.reset(bytecode, slots)
         self._load_constants()
         self._execute()
         if self._stack:
-            return self.pop()
+            return self._stack.pop()
 
     def _load_constants(self):
-        while self.peek() != Instruction.EOS:
-            buffer = [chr(self.advance()) for _ in range(self.advance())]
-            lexeme = "".join(buffer)
-            type = float if "." in lexeme else int
-            self._constants.append(type(lexeme))
-        self.advance()
+        self._constants, self._current = constants.decode_pool(self._bytecode)
 
     def _execute(self):
-        while self.peek() != Instruction.EOS:
-            match self.peek():
-                case Instruction.ADD:        self.add()
-                case Instruction.POWER:      self.power()
-                case Instruction.DIVIDE:     self.divide()
-                case Instruction.MULTIPLY:   self.multiply()
-                case Instruction.SUBTRACT:   self.subtract()
-                case Instruction.LOAD_CONST: self.load_const()
-                case unknown: raise UnknownInstruction(unknown)
-        self.advance()
-
-    def peek(self) -> int:
-        return self._bytecode[self._current]
-
-    def advance(self) -> int:
-        consumed = self.peek()
-        self._current += 1
-        return consumed
-
-    def add(self):
-        self.advance()
-        right = self.pop()
-        left = self.pop()
-        self.push(left + right)
-
-    def subtract(self):
-        self.advance()
-        right = self.pop()
-        left = self.pop()
-        self.push(left - right)
-
-    def multiply(self):
-        self.advance()
-        right = self.pop()
-        left = self.pop()
-        self.push(left * right)
-
-    def divide(self):
-        right = self.pop()
-        left = self.pop()
-        if right == 0:
-            raise ZeroDivisionError(f"'{left} / 0' at instruction {self._current}")
-        self.advance()
-        self.push(left / right)
-
-    def power(self):
-        self.advance()
-        right = self.pop()
-        left = self.pop()
-        self.push(left**right)
-
-    def load_const(self):
-        self.advance()
-        location = self.advance()
-        constant = self._constants[location]
-        self.push(constant)
+        # Everything the loop touches lives in a local, instructions either
+        # index the binary operator table or take an operand, except NEGATE
+        # and DUP.
+        code = self._bytecode
+        binary = self._binary
+        neg = self._negate
+        slots = self._slots
+        consts = self._constants
+        stack = self._stack
+        temps: dict[int, ty.Any] = {}
+        push = stack.append
+        pop = stack.pop
+        load_const = Instruction.LOAD_CONST.value
+        load_var = Instruction.LOAD_VAR.value
+        load_temp = Instruction.LOAD_TEMP.value
+        negate = Instruction.NEGATE.value
+        dup = Instruction.DUP.value
+        eos = Instruction.EOS.value
+        ip = self._current
+        try:
+            while (op := code[ip]) != eos:
+                function = binary[op]
+                if function is not None:
+                    right = pop()
+                    stack[-1] = function(stack[-1], right)
+                    ip += 1
+                    continue
+                if op == negate:
+                    stack[-1] = neg(stack[-1])
+                    ip += 1
+                    continue
+                if op == dup:
+                    push(stack[-1])
+                    ip += 1
+                    continue
+                if op not in HAS_OPERAND:
+                    raise UnknownInstruction(op)
+                operand = code[ip + 1]
+                if operand < 0x80:
+                    ip += 2
+                else:
+                    operand, ip = decode_operand(code, ip + 1)
+                if op == load_const:
+                    push(consts[operand])
+                elif op == load_var:
+                    if operand >= len(slots):
+                        raise UnboundVariable(f"Slot {operand} is not bound at instruction {ip}")
+                    push(slots[operand])
+                elif op == load_temp:
+                    if operand not in temps:
+                        _unstored(operand, ip)
+                    push(temps[operand])
+                else:
+                    temps[operand] = pop()
+        except DivisionByZero as error:
+            raise ZeroDivisionError(f"{error} at instruction {ip}") from None
+        self._current = ip + 1
+
+
+def _unstored(temp: int, ip: int) -> ty.NoReturn:
+    raise InvalidByteCode(f"Temporary {temp} is loaded before it is stored at instruction {ip}")
+
+
+_CONST, _VAR, _BINARY, _NEGATE, _DUP, _STORE, _TEMP = range(7)
+
+
+class LoadedProgram:
+    # Bytecode decoded once: the constant pool becomes Python numbers and
+    # every instruction a (kind, argument) pair, where the argument is the
+    # constant itself, the variable slot or temporary, or the operator
+    # function. Code has no jumps, so a temporary loaded before it is
+    # stored is caught here rather than while running. Running
+    # only touches locals, so one program can be shared between threads.
+    __slots__ = ("constants", "code", "variables")
+
+    def __init__(self, bytecode: bytes | list[int]) -> None:
+        consts, ip = constants.decode_pool(bytecode)
+        binary = VirtualMachine._binary
+        code: list[tuple[int, ty.Any]] = []
+        stored: set[int] = set()
+        variables = 0
+        while (op := bytecode[ip]) != Instruction.EOS:
+            function = binary[op]
+            if function is not None:
+                if not isinstance(function, types.BuiltinFunctionType):
+                    function = _located(function, ip)
+                code.append((_BINARY, function))
+                ip += 1
+                continue
+            if op == Instruction.NEGATE or op == Instruction.DUP:
+                code.append((_NEGATE if op == Instruction.NEGATE else _DUP, None))
+                ip += 1
+                continue
+            if op not in HAS_OPERAND:
+                raise UnknownInstruction(op)
+            operand, ip = decode_operand(bytecode, ip + 1)
+            if op == Instruction.LOAD_CONST:
+                code.append((_CONST, consts[operand]))
+            elif op == Instruction.LOAD_VAR:
+                code.append((_VAR, operand))
+                variables = max(variables, operand + 1)
+            elif op == Instruction.STORE_TEMP:
+                code.append((_STORE, operand))
+                stored.add(operand)
+            elif operand in stored:
+                code.append((_TEMP, operand))
+            else:
+                _unstored(operand, ip)
+        self.constants = tuple(consts)
+        self.code = tuple(code)
+        self.variables = variables  # Number of slots the program reads.
+
+    def run(self, slots: ty.Sequence[float | int] = ()):
+        if len(slots) < self.variables:
+            raise UnboundVariable(f"Expected {self.variables} slots, got {len(slots)}")
+        stack: list[ty.Any] = []
+        temps: dict[int, ty.Any] = {}
+        push = stack.append
+        pop = stack.pop
+        for kind, argument in self.code:
+            if kind == _BINARY:
+                right = pop()
+                stack[-1] = argument(stack[-1], right)
+            elif kind == _CONST:
+                push(argument)
+            elif kind == _VAR:
+                push(slots[argument])
+            elif kind == _NEGATE:
+                stack[-1] = -stack[-1]
+            elif kind == _DUP:
+                push(stack[-1])
+            elif kind == _STORE:
+                temps[argument] = pop()
+            else:
+                push(temps[argument])
+        if stack:
+            return stack[-1]
+
+
+def _located(function: BinaryOp, ip: int) -> BinaryOp:
+    # Operators that may divide by zero learn their instruction offset.
+    def located(left: ty.Any, right: ty.Any):
+        try:
+            return function(left, right)
+        except DivisionByZero as error:
+            raise ZeroDivisionError(f"{error} at instruction {ip}") from None
+
+    return located
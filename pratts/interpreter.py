@@ -1,6 +1,20 @@
 from math import factorial
 from . import nodes
 import typing as ty
+import operator
+
+_BINARY: dict[type, ty.Callable[[ty.Any, ty.Any], ty.Any]] = {
+    nodes.Plus: operator.add,
+    nodes.Minus: operator.sub,
+    nodes.Star: operator.mul,
+    nodes.Slash: operator.truediv,
+}
+_UNARY: dict[type, ty.Callable[[ty.Any], ty.Any]] = {
+    nodes.UPlus: operator.pos,
+    nodes.UMinus: operator.neg,
+    nodes.Group: operator.pos,
+    nodes.UNot: lambda operand: factorial(int(operand)),
+}
 
 
 class Interpreter(nodes.Visitor[float | int]):
@@ -35,11 +49,10 @@ class Interpreter(nodes.Visitor[float | int]):
         return expr.operand.accept(self)
 
     def accept_string(self, expr: nodes.String) -> float | int:
-        return ty.cast(float, expr.value.lexeme[1:-1])
+        return ty.cast(float, expr.value)
 
     def accept_number(self, expr: nodes.Number) -> float | int:
-        type = float if "." in expr.value.lexeme else int
-        return type(expr.value.lexeme)
+        return expr.value
 
     def accept_unot(self, expr: nodes.UNot) -> float | int:
         return factorial(int(expr.operand.accept(self)))
@@ -49,4 +62,42 @@ class Interpreter(nodes.Visitor[float | int]):
         return expr.middle.accept(self) if cond else expr.right.accept(self)
 
     def eval(self, expr: nodes.Expression) -> float | int:
-        return expr.accept(self)
+        try:
+            return expr.accept(self)
+        except RecursionError:
+            return self._walk(expr)
+
+    def _walk(self, root: nodes.Expression) -> float | int:
+        """
+        Evaluates trees too deep to visit with an explicit stack. Operators
+        are pushed back as (function, node) pairs below their operands and
+        applied to the values those left behind. A ternary evaluates its
+        condition first and only then pushes the branch it picked.
+        """
+        values: list[ty.Any] = []
+        pending: list[ty.Any] = [root]
+        while pending:
+            expr = pending.pop()
+            kind = type(expr)
+            if kind is tuple:
+                function, expr = expr
+                if isinstance(expr, nodes.Binary):
+                    right = values.pop()
+                    values[-1] = function(values[-1], right)
+                elif isinstance(expr, nodes.Ternary):
+                    pending.append(expr.middle if values.pop() else expr.right)
+                else:
+                    values[-1] = function(values[-1])
+            elif kind in _BINARY:
+                pending.append((_BINARY[kind], expr))
+                pending.append(expr.right)
+                pending.append(expr.left)
+            elif kind in _UNARY:
+                pending.append((_UNARY[kind], expr))
+                pending.append(expr.operand)
+            elif kind is nodes.TernaryCond:
+                pending.append((None, expr))
+                pending.append(expr.left)
+            else:
+                values.append(expr.accept(self))
+        return values.pop()
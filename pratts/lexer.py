@@ -1,24 +1,69 @@
 from .typedef import TokenStream, Location
 from . import token
 import typing as ty
+import codecs
+import mmap
 
 __all__ = ("lex",)
 
+Source = str | bytes | bytearray | memoryview | mmap.mmap | ty.IO[str] | ty.IO[bytes]
 
-def lex(source: str) -> TokenStream:
-    yield from _Lexer_impl(source)._scan()
+# Characters of the current line kept in front of a lexeme for error tokens.
+# Longer lines are shown truncated.
+_CONTEXT: ty.Final[int] = 1 << 12
+
+
+def lex(source: Source, chunksize: int = 1 << 16) -> TokenStream:
+    """
+    Tokens of `source` as they are scanned. Files and buffers are read
+    `chunksize` at a time, bytes are decoded incrementally as UTF-8.
+    """
+    yield from _Lexer_impl(_chunks(source, chunksize))._scan()
+
+
+def _chunks(source: Source, chunksize: int) -> ty.Iterator[str]:
+    if isinstance(source, str):
+        yield source
+        return
+    reads: ty.Iterable[ty.Any]
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        view = memoryview(source).cast("B")
+        reads = (view[i : i + chunksize] for i in range(0, len(view), chunksize))
+    else:
+        reads = iter(lambda: source.read(chunksize), source.read(0))
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in reads:
+        yield chunk if isinstance(chunk, str) else decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
 
 
 class _Lexer_impl:
-    "Do not use this class directly, use function lex: `lex(source: str) -> TokenStream`"
+    "Do not use this class directly, use function lex: `lex(source: Source) -> TokenStream`"
 
-    def __init__(self, source: str | None = None) -> None:
-        self._source = source or ""
-        self._stop: ty.Final[int] = len(self._source)
+    def __init__(self, chunks: ty.Iterable[str] = ()) -> None:
+        # _source only holds the text from the start of the current line
+        # (or _CONTEXT characters before the lexeme) to the last chunk read.
+        self._chunks = iter(chunks)
+        self._source: str = ""
         self._current: int = 0
         self._column: int = 0
         self._start: int = 0
         self._line: int = 1
+        self._line_start: int = 0
+        self._anchor: int = 0
+
+    def _refill(self) -> bool:
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            keep = max(self._anchor, self._start - _CONTEXT)
+            self._source = self._source[keep:] + chunk
+            self._current -= keep
+            self._start -= keep
+            self._anchor = max(self._anchor - keep, 0)
+            self._line_start = max(self._line_start - keep, 0)
+            return True
+        return False
 
     def _peek(self) -> str:
         return "" if self._empty() else self._source[self._current]
@@ -37,10 +82,19 @@ class _Lexer_impl:
             return bool(self._advance())
 
     def _consume(self):
+        # The next lexeme starts here, on the current line. A string or
+        # comment spanning lines keeps the line it started on until then.
         consumed = self._lexeme()
         self._start = self._current
+        self._anchor = self._line_start
         return consumed
 
+    def _error_line(self) -> str:
+        # The line the current lexeme starts on.
+        while (end := self._source.find("\n", self._start)) < 0 and self._refill():
+            pass
+        return self._source[self._anchor : end if end >= 0 else None]
+
     def _make_token(
         self,
         tktype: token.TkType,
@@ -48,13 +102,16 @@ class _Lexer_impl:
         error: str | None = None,
     ) -> token.Token:
         location = self._capture_loc() if location is None else location
-        lexeme = self._consume()
         if error is not None:
-            lexeme = self._source.splitlines()[location.line - 1]
-        return token.Token(tktype, lexeme, location, error)
+            line = self._error_line()
+            self._consume()
+            return token.Token(tktype, line, location, error)
+        start, end = self._start, self._current
+        self._consume()
+        return token.Token(tktype, self._source, location, None, start, end)
 
     def _empty(self) -> bool:
-        return self._current >= self._stop
+        return self._current >= len(self._source) and not self._refill()
 
     def _capture_loc(self) -> Location:
         return Location(self._line, self._column)
@@ -68,6 +125,7 @@ class _Lexer_impl:
     def _advance_line(self):
         self._line += 1
         self._column = 0
+        self._line_start = self._current
 
     def _consume_string(self) -> token.Token:
         location = self._capture_loc()
@@ -129,6 +187,7 @@ class _Lexer_impl:
                             self._advance() # Not part of end comment token
                             tk = self._consume_multiline_comment()
                             if tk is not None: yield tk
+                            else: self._consume()
                         case _: yield self._make_token(t.SLASH)
                 case "!":
                     token_type = t.BANG_EQUAL if self._match("=") else t.BANG
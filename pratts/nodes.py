@@ -22,24 +22,34 @@ class Visitor(ty.Protocol[_T_co]):
 
 
 class Expression(ty.Protocol):
+    __slots__ = ()
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co: ...
 
 
 class Binary:
+    """
+    Nodes keep the location of their operator rather than its token, the
+    lexeme is the same for every node of a class.
+    """
+
+    __slots__ = ("left", "right", "location")
+    lexeme: ty.ClassVar[str]
+
     def __init__(self, left: Expression, operator: Token, right: Expression) -> None:
         self.left = left
         self.right = right
-        self.operator = operator
+        self.location = operator.location
 
     def __eq__(self, other: object) -> bool:
-        return isinstance(other, Binary) and (
-            self.operator == other.operator
-            and self.left == other.left
-            and self.right == other.right
-        ) or NotImplemented
+        return isinstance(other, Binary) and equal(self, other) or NotImplemented
 
 
 class Ternary:
+    __slots__ = ("left", "middle", "right", "location", "rlocation")
+    llexeme: ty.ClassVar[str]
+    rlexeme: ty.ClassVar[str]
+
     def __init__(
         self,
         left: Expression,
@@ -51,91 +61,159 @@ class Ternary:
         self.left = left
         self.middle = middle
         self.right = right
-        self.roperator = roperator
-        self.loperator = loperator
+        self.location = loperator.location
+        self.rlocation = roperator.location
 
     def __eq__(self, other: object) -> bool:
-        return isinstance(other, Ternary) and (
-            self.roperator == other.roperator
-            and self.loperator == other.loperator
-            and self.left == other.left
-            and self.middle == other.middle
-            and self.right == other.right
-        ) or NotImplemented
+        return isinstance(other, Ternary) and equal(self, other) or NotImplemented
 
 
 class Unary:
+    __slots__ = ("operand", "location")
+    lexeme: ty.ClassVar[str]
+
     def __init__(self, operand: Expression, operator: Token) -> None:
         self.operand = operand
-        self.operator = operator
+        self.location = operator.location
 
     def __eq__(self, other: object) -> bool:
-        return isinstance(other, Unary) and (
-            self.operator == other.operator
-            and self.operand == other.operand
-        ) or NotImplemented
+        return isinstance(other, Unary) and equal(self, other) or NotImplemented
 
 
 class Literal:
+    """
+    `value` is decoded once when the node is built, `lexeme` and `location`
+    are what remains of the token.
+    """
+
+    __slots__ = ("value", "lexeme", "location")
+
     def __init__(self, value: Token) -> None:
-        self.value = value
+        self.value = self.decode(value.lexeme)
+        self.lexeme = value.lexeme
+        self.location = value.location
+
+    @staticmethod
+    def decode(lexeme: str) -> ty.Any:
+        return lexeme
 
     def __eq__(self, other: object) -> bool:
         return isinstance(other, Literal) and (
-            self.value == other.value
+            type(self) is type(other)
+            and self.lexeme == other.lexeme
         ) or NotImplemented
 
 
 class Plus(Expression, Binary):
+    __slots__ = ()
+    lexeme = "+"
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co:
         return visitor.accept_plus(self)
 
 
 class Star(Expression, Binary):
+    __slots__ = ()
+    lexeme = "*"
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co:
         return visitor.accept_star(self)
 
 
 class Slash(Expression, Binary):
+    __slots__ = ()
+    lexeme = "/"
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co:
         return visitor.accept_slash(self)
 
 
 class Minus(Expression, Binary):
+    __slots__ = ()
+    lexeme = "-"
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co:
         return visitor.accept_minus(self)
 
 
 class UPlus(Expression, Unary):
+    __slots__ = ()
+    lexeme = "+"
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co:
         return visitor.accept_uplus(self)
 
 
 class UMinus(Expression, Unary):
+    __slots__ = ()
+    lexeme = "-"
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co:
         return visitor.accept_uminus(self)
 
 
 class UNot(Expression, Unary):
+    __slots__ = ()
+    lexeme = "!"
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co:
         return visitor.accept_unot(self)
 
 
 class Group(Expression, Unary):
+    __slots__ = ()
+    lexeme = "("
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co:
         return visitor.accept_group(self)
 
 
 class Number(Expression, Literal):
+    __slots__ = ()
+
+    @staticmethod
+    def decode(lexeme: str) -> float | int:
+        return float(lexeme) if "." in lexeme else int(lexeme)
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co:
         return visitor.accept_number(self)
 
 
 class String(Expression, Literal):
+    __slots__ = ()
+
+    @staticmethod
+    def decode(lexeme: str) -> str:
+        return lexeme[1:-1]
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co:
         return visitor.accept_string(self)
 
 
 class TernaryCond(Expression, Ternary):
+    __slots__ = ()
+    llexeme, rlexeme = "?", ":"
+
     def accept(self, visitor: Visitor[_T_co]) -> _T_co:
         return visitor.accept_ternary_cond(self)
+
+
+def equal(left: Expression, right: Expression) -> bool:
+    "Structural comparison with an explicit stack instead of recursion."
+    pending: list[tuple[ty.Any, ty.Any]] = [(left, right)]
+    while pending:
+        left, right = pending.pop()
+        if type(left) is not type(right):
+            return False
+        if isinstance(left, Binary):
+            pending.append((left.right, right.right))
+            pending.append((left.left, right.left))
+        elif isinstance(left, Ternary):
+            pending.append((left.right, right.right))
+            pending.append((left.middle, right.middle))
+            pending.append((left.left, right.left))
+        elif isinstance(left, Unary):
+            pending.append((left.operand, right.operand))
+        elif left != right:
+            return False
+    return True
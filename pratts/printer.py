@@ -5,13 +5,13 @@ from .typedef import Stringify
 class PrintExpression(nodes.Visitor[str], Stringify[nodes.Expression]):
     def _binlr(self, expr: nodes.Binary) -> str:
         left = expr.left.accept(self)
-        operator = expr.operator.lexeme
+        operator = expr.lexeme
         right = expr.right.accept(self)
         return f"{left} {operator} {right}"
 
     def _binu(self, expr: nodes.Unary) -> str:
         operand = expr.operand.accept(self)
-        operator = expr.operator.lexeme
+        operator = expr.lexeme
         post = ")" if operator == "(" else ""
         if operator == "!":
             post = operator
@@ -43,17 +43,17 @@ class PrintExpression(nodes.Visitor[str], Stringify[nodes.Expression]):
         return self._binlr(expr)
 
     def accept_number(self, expr: nodes.Number) -> str:
-        return expr.value.lexeme
+        return expr.lexeme
 
     def accept_string(self, expr: nodes.String) -> str:
-        return expr.value.lexeme
+        return expr.lexeme
 
     def accept_ternary_cond(self, expr: nodes.TernaryCond) -> str:
         left = expr.left.accept(self)
         middle = expr.middle.accept(self)
         right = expr.right.accept(self)
-        lop = expr.loperator.lexeme
-        rop = expr.roperator.lexeme
+        lop = expr.llexeme
+        rop = expr.rlexeme
         return f'{left} {lop} {middle} {rop} {right}'
 
     def tostr(self, thing: nodes.Expression) -> str:
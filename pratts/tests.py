@@ -0,0 +1,89 @@
+from .typedef import ManagedStream
+from .interpreter import Interpreter
+from .pratts import expression
+from .lexer import lex
+from . import token as tk
+import typing
+import mmap
+import io
+
+SOURCE: typing.Final[str] = (
+    '60 / (1 ? 10 : 30) // trailing comment\n'
+    '"two\nlines" ümlaut_1 /* a comment\nover * lines */ != <= >= == !x\n'
+    '  -7 + +8 * $, {}. #'
+)
+
+
+def _summary(source: typing.Any, chunksize: int = 1 << 16) -> list[tuple[typing.Any, ...]]:
+    return [
+        (token.type, token.lexeme, token.location, token.error)
+        for token in lex(source, chunksize)
+    ]
+
+
+def test_lexer():
+    tokens = _summary(SOURCE)
+    types = [type for type, *_ in tokens]
+    assert types[:9] == [
+        tk.TkType.NUMBER, tk.TkType.SLASH, tk.TkType.OPEN_PAREN, tk.TkType.NUMBER,
+        tk.TkType.QMARK, tk.TkType.NUMBER, tk.TkType.COLON, tk.TkType.NUMBER,
+        tk.TkType.CLOSE_PAREN,
+    ]
+    assert tokens[9] == (tk.TkType.STRING, '"two\nlines"', (2, 1), None)
+    assert tokens[10] == (tk.TkType.IDENTIFIER, "ümlaut_1", (3, 8), None)
+    assert [lexeme for _, lexeme, *_ in tokens[11:]] == [
+        "!=", "<=", ">=", "==", "!", "x", "-", "7", "+", "+", "8", "*", "$", ",", "{", "}", ".", "#",
+    ]
+    assert all(error is None for *_, error in tokens)
+
+
+def test_lexer_sources(tmp_path):
+    # Every chunk size up to a few characters splits tokens, lines and the
+    # two byte UTF-8 'ü' somewhere, the tokens must not change.
+    expected = _summary(SOURCE)
+    encoded = SOURCE.encode()
+    path = tmp_path / "source.txt"
+    path.write_bytes(encoded)
+    for chunksize in (1, 2, 3, 5, 7, 64, 1 << 16):
+        assert _summary(encoded, chunksize) == expected
+        assert _summary(bytearray(encoded), chunksize) == expected
+        assert _summary(memoryview(encoded), chunksize) == expected
+        assert _summary(io.BytesIO(encoded), chunksize) == expected
+        assert _summary(io.StringIO(SOURCE), chunksize) == expected
+        with open(path, "rb") as binary, open(path, encoding="utf-8") as text:
+            assert _summary(binary, chunksize) == expected
+            assert _summary(text, chunksize) == expected
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            assert _summary(mapped, chunksize) == expected
+    assert _summary(b"") == _summary("") == []
+
+
+def test_lexer_errors():
+    # Error tokens carry the line their location is on.
+    for source, line, location, message in [
+        ("1 + @", "1 + @", (1, 5), "Invalid character: '@'"),
+        ("1 /* x\n*/@", "*/@", (2, 3), "Invalid character: '@'"),
+        ("1 // x\n@ 2", "@ 2", (2, 1), "Invalid character: '@'"),
+        ('"a\nb" @', 'b" @', (2, 4), "Invalid character: '@'"),
+        ('1\n "ab\ncd', ' "ab', (2, 2), "Unterminated String."),
+        ("1\n/* ab\ncd", "/* ab", (2, 2), "Unterminated multiline comment."),
+    ]:
+        for chunksize in (1, 2, 3, 1 << 16):
+            errors = [token for token in lex(source.encode(), chunksize) if token.is_error]
+            assert len(errors) == 1
+            assert (errors[0].lexeme, errors[0].location, errors[0].error) == (line, location, message)
+    # Tokens after a comment do not take it into their lexeme.
+    assert _summary("/* x\n*/5")[0][:2] == (tk.TkType.NUMBER, "5")
+    # Lines longer than the kept context are shown truncated, not in full.
+    long = "1 + " * 5000 + "@"
+    errors = [token for token in lex(long.encode(), 256) if token.is_error]
+    assert long.endswith(errors[0].lexeme) and len(errors[0].lexeme) < len(long)
+
+
+def test_interpreter():
+    for source, answer in [
+        ("60 / (1 ? 10 : 30)", 6),
+        ("-7 + +8 * 2", 9),
+        ("0 ? 1 : 2 * 3", 6),
+    ]:
+        assert Interpreter().eval(expression(ManagedStream(lex(source)))) == answer
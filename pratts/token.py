@@ -2,7 +2,7 @@ import enum, typing as ty
 from .typedef import Location
 
 
-class TkType(enum.StrEnum):
+class TkType(enum.IntEnum):
     DOT = enum.auto()  # .
     STAR = enum.auto()  # *
     PLUS = enum.auto()  # +
@@ -31,19 +31,37 @@ class TkType(enum.StrEnum):
     IDENTIFIER = enum.auto()  # [a-zA-Z_]+
     ERROR = enum.auto()  # LexingErrorToken
 
+    def __str__(self) -> str:
+        return self.name.lower()
+
 
 class Token:
+    """
+    The lexeme is the span `start:end` of `text`, sliced when asked for, so
+    scanning never copies it out of the source.
+    """
+
+    __slots__ = ("type", "error", "location", "_text", "_start", "_length")
+
     def __init__(
         self,
         tktype: TkType,
-        lexeme: str,
+        text: str,
         location: Location,
         error: str | None = None,
+        start: int = 0,
+        end: int | None = None,
     ) -> None:
         self.type = tktype
         self.error = error
-        self.lexeme = lexeme
         self.location = location
+        self._text = text
+        self._start = start
+        self._length = (len(text) if end is None else end) - start
+
+    @property
+    def lexeme(self) -> str:
+        return self._text[self._start : self._start + self._length]
 
     @property
     def is_error(self) -> bool:
@@ -58,7 +76,7 @@ class Token:
         return self.location.column
 
     def __len__(self) -> int:
-        return len(self.lexeme)
+        return self._length
 
     def __eq__(self, other: object) -> bool:
         return isinstance(other, Token) and (